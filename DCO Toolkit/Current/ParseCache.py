@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import pickle
+
+
+def source_version(*paths):
+    """Version string for a parser: a hash of its source files, so any edit to the parser invalidates the cache"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# Eviction trims the cache to this fraction of max_bytes, so a full cache is not rescanned on every write
+EVICT_TO_FRACTION = 0.9
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed provisions, so unchanged XML is not parsed again.
+
+    Entries are keyed by the XML file's content hash, the parser version and the
+    schedule policy, and hold the parser's output - a DataFrame or a list of
+    provision records - as a pickle. Reading an entry
+    touches its modification time, and once the cache grows past max_bytes the
+    least recently used entries are deleted until it is back within
+    EVICT_TO_FRACTION of max_bytes, leaving room for further writes. Several processes may share a cache:
+    entries are written to a temporary file and renamed into place. An entry that
+    cannot be unpickled (truncated, or written by an incompatible version) is a
+    miss and is deleted.
+
+    The cache's size is scanned from disk when it is opened and on eviction, and
+    otherwise tracked as entries are written, so a put does not list the
+    directory. Entries written by other processes are counted at the next scan.
+    """
+
+    def __init__(self, directory='parse_cache', parser_version='', max_bytes=1024 ** 3):
+        self.directory = directory
+        self.parser_version = parser_version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    def key(self, xml_file, policy=''):
+        content = hashlib.sha256()
+        with open(xml_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                content.update(block)
+        return hashlib.sha256('\0'.join([content.hexdigest(), self.parser_version, policy]).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        """The cached parse for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                df = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Discarding unreadable parse cache entry {key}: {e}")
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read
+        return df
+
+    def put(self, key, df):
+        path = self._path(key)
+        partial = f'{path}.{os.getpid()}.partial'
+        with open(partial, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.size += os.path.getsize(partial)
+        os.replace(partial, path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def get_or_parse(self, xml_file, parse, policy=''):
+        """The provisions of xml_file from the cache, or from parse(xml_file), which are then cached"""
+        key = self.key(xml_file, policy)
+        df = self.get(key)
+        if df is not None:
+            self.hits += 1
+            return df
+        self.misses += 1
+        df = parse(xml_file)
+        self.put(key, df)
+        return df
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Delete the least recently used entries if the cache is past max_bytes, until it is within EVICT_TO_FRACTION of it"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TO_FRACTION
+        for _, size, name in sorted(entries):
+            if total <= limit:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+            logging.getLogger(__name__).info(f"Evicted {name} from the parse cache")
+        self.size = total
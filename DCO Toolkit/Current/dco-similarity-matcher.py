@@ -1,40 +1,62 @@
 import psycopg2
 from psycopg2.extras import execute_values
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import XMLDataExtractor
+import LegislationReferences
 from XMLDataExtractor import parse_xml
+from ParseCache import ParseCache, source_version
 import os
+import sys
+import importlib.util
 from Levenshtein import ratio #distance #seqratio, setratio
 import logging
 import time
+import argparse
+import csv
+import io
+import json
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager, redirect_stdout
 # import multiprocessing
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import partial
 from hashlib import md5
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from typing import List, Tuple, Dict
-from itertools import groupby
+from itertools import groupby, islice
+from collections import deque
 # import heapq
 # import numpy as np
 
 
-def create_database():
+DB_CONFIG = {
+    'host': "localhost",
+    'user': "draggy",
+    'password': "catscats",
+    'port': "5432"
+}
+
+
+def connect_database(database: str = "dcos"):
+    return psycopg2.connect(database=database, **DB_CONFIG)
+
+
+def create_database(database: str = "dcos"):
     try:
         # First connect to default 'postgres' database
-        conn = psycopg2.connect(
-            host="localhost",
-            database="postgres",  # Connect to default postgres database
-            user="draggy",
-            password="catscats",
-            port="5432"
-        )
+        conn = connect_database("postgres")
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         cur = conn.cursor()
         
         # Check if our target database exists
-        cur.execute("SELECT 1 FROM pg_catalog.pg_database WHERE datname = 'dcos'")
+        cur.execute("SELECT 1 FROM pg_catalog.pg_database WHERE datname = %s", (database,))
         if not cur.fetchone():
-            cur.execute('CREATE DATABASE dcos')
-            print("Database 'dcos' created successfully")
+            cur.execute(f'CREATE DATABASE "{database}"')
+            print(f"Database '{database}' created successfully")
             
         cur.close()
         conn.close()
@@ -46,17 +68,11 @@ def create_database():
 
 
 
-def setup_tables():
+def setup_tables(database: str = "dcos"):
     try:
         # Try to connect to the database
-        conn = psycopg2.connect(
-            host="localhost",
-            database="dcos",
-            user="draggy",
-            password="catscats",
-            port="5432"
-        )
-        cur = conn.cursor()
+        conn = connect_database(database)
+        cur = conn.cursor(cursor_factory=CountingCursor)
         
         # Create original tables
         cur.execute("""
@@ -75,8 +91,7 @@ def setup_tables():
                 article_number TEXT,
                 article_title TEXT,
                 article_text TEXT[],
-                novel BOOLEAN DEFAULT NULL,
-                UNIQUE(order_id, article_number)
+                novel BOOLEAN DEFAULT NULL
             )
         """)
         
@@ -119,6 +134,31 @@ def setup_tables():
             END $$;
         """)
         
+        # Provision kind and schedule placement. Schedule paragraphs reuse article
+        # numbers, so the natural key includes the schedule and part ('' in the body).
+        cur.execute("""
+            DO $$
+            BEGIN
+                BEGIN
+                    ALTER TABLE articles
+                    ADD COLUMN provision_kind TEXT NOT NULL DEFAULT 'article',
+                    ADD COLUMN schedule_number TEXT NOT NULL DEFAULT '',
+                    ADD COLUMN schedule_name TEXT,
+                    ADD COLUMN schedule_type TEXT,
+                    ADD COLUMN part_number TEXT NOT NULL DEFAULT '',
+                    ADD COLUMN part_title TEXT;
+                EXCEPTION
+                    WHEN duplicate_column THEN
+                        NULL;
+                END;
+            END $$;
+        """)
+        cur.execute("ALTER TABLE articles DROP CONSTRAINT IF EXISTS articles_order_id_article_number_key")
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_articles_provision
+            ON articles(order_id, schedule_number, part_number, article_number)
+        """)
+
         # Add new columns to similarities table
         cur.execute("""
             DO $$
@@ -133,6 +173,69 @@ def setup_tables():
             END $$;
         """)
 
+        # Last time a similarity row changed, for incremental exports
+        cur.execute("""
+            DO $$
+            BEGIN
+                BEGIN
+                    ALTER TABLE similarities
+                    ADD COLUMN updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+                EXCEPTION
+                    WHEN duplicate_column THEN
+                        NULL;
+                END;
+            END $$;
+        """)
+
+        # Transaction that last changed a similarity row, stamped by a trigger. Unlike
+        # updated_at (the transaction's start time) it gives incremental exports a bound
+        # that transactions committing after the export cannot fall behind.
+        cur.execute("""
+            ALTER TABLE similarities
+            ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id()
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION similarities_stamp_change() RETURNS trigger AS $$
+            BEGIN
+                NEW.change_xid := pg_current_xact_id();
+                RETURN NEW;
+            END $$ LANGUAGE plpgsql
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS similarities_change_xid ON similarities")
+        cur.execute("""
+            CREATE TRIGGER similarities_change_xid
+            BEFORE INSERT OR UPDATE ON similarities
+            FOR EACH ROW EXECUTE FUNCTION similarities_stamp_change()
+        """)
+
+        # Tombstones for deleted similarity rows (re-baseline merges, backfills), so an
+        # incremental export can pass deletions on as well as changes
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS similarity_deletions (
+                similarity_id INTEGER NOT NULL,
+                source_article_id INTEGER,
+                target_article_id INTEGER,
+                target_order_id INTEGER,
+                deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                change_xid xid8 NOT NULL DEFAULT pg_current_xact_id()
+            )
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION similarities_record_deletions() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO similarity_deletions (similarity_id, source_article_id, target_article_id, target_order_id)
+                SELECT id, source_article_id, target_article_id, target_order_id FROM deleted_rows;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS similarities_deletions ON similarities")
+        cur.execute("""
+            CREATE TRIGGER similarities_deletions
+            AFTER DELETE ON similarities
+            REFERENCING OLD TABLE AS deleted_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION similarities_record_deletions()
+        """)
+
 
         # Create new tables
         cur.execute("""
@@ -156,6 +259,66 @@ def setup_tables():
             )
         """)
         
+        # Materialised precedent lineage, maintained by update_precedent_graph
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS precedent_graph (
+                article_id INTEGER PRIMARY KEY REFERENCES articles(article_id),
+                parent_article_id INTEGER REFERENCES articles(article_id),
+                parent_similarity FLOAT,
+                root_article_id INTEGER REFERENCES articles(article_id),
+                depth INTEGER DEFAULT 0,
+                descendant_count INTEGER DEFAULT 0
+            )
+        """)
+
+        # Definitions index: one row per defined term in a definition list. Definitions
+        # worded the same (exactly or near enough) across Orders share a variant_id.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS definitions (
+                definition_id SERIAL PRIMARY KEY,
+                article_id INTEGER REFERENCES articles(article_id),
+                order_id INTEGER REFERENCES orders(order_id),
+                term TEXT,
+                term_key TEXT,
+                definition_text TEXT,
+                definition_hash TEXT,
+                variant_id INTEGER,
+                variant_similarity FLOAT,
+                UNIQUE(article_id, term_key)
+            )
+        """)
+
+        # Cross-references made by each article, as extracted at parse time. Links to
+        # provisions of the same Order carry the resolved target_article_id; citations
+        # of other legislation have kind 'legislation' and the legislation URI as ref.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cross_references (
+                reference_id SERIAL PRIMARY KEY,
+                source_article_id INTEGER REFERENCES articles(article_id),
+                order_id INTEGER REFERENCES orders(order_id),
+                reference_kind TEXT,
+                target_schedule_number TEXT,
+                target_part_number TEXT NOT NULL DEFAULT '',
+                target_article_number TEXT,
+                target_subref TEXT,
+                ref TEXT,
+                link_text TEXT,
+                target_article_id INTEGER REFERENCES articles(article_id)
+            )
+        """)
+
+        # The Part a schedule reference names, for tables created before it was stored
+        cur.execute("ALTER TABLE cross_references ADD COLUMN IF NOT EXISTS target_part_number TEXT NOT NULL DEFAULT ''")
+
+        # Denormalised read model for the article precedent panel, one row per article
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS article_precedents (
+                article_id INTEGER PRIMARY KEY REFERENCES articles(article_id),
+                precedents JSONB NOT NULL DEFAULT '[]',
+                successors JSONB NOT NULL DEFAULT '[]'
+            )
+        """)
+
         # Create indexes for original tables
         cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_articles_order_id 
@@ -181,6 +344,26 @@ def setup_tables():
             CREATE INDEX IF NOT EXISTS idx_similarities_target_order_id 
             ON similarities(target_order_id)
         """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_similarities_target_article_id
+            ON similarities(target_article_id)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_similarities_updated_at
+            ON similarities(updated_at)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_similarities_change_xid
+            ON similarities(change_xid)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_similarity_deletions_change_xid
+            ON similarity_deletions(change_xid)
+        """)
         
         # Create indexes for new columns and tables
         cur.execute("""
@@ -197,6 +380,23 @@ def setup_tables():
             CREATE INDEX IF NOT EXISTS idx_articles_word_count 
             ON articles(word_count)
         """)
+
+        # Candidate index: category and word count range, as used by backfill_order
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_articles_category_word_count
+            ON articles(category, word_count)
+        """)
+
+        # Candidate partition, as used by rank_candidates and backfill_order
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_articles_partition
+            ON articles(provision_kind, schedule_type, category, word_count)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_articles_hash
+            ON articles(hash)
+        """)
         
         # Add indexes for title_patterns
         cur.execute("""
@@ -209,6 +409,54 @@ def setup_tables():
             ON title_patterns(target_hash)
         """)
         
+        # Add indexes for precedent_graph
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_precedent_graph_parent
+            ON precedent_graph(parent_article_id)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_precedent_graph_root
+            ON precedent_graph(root_article_id)
+        """)
+
+        # Add indexes for definitions
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_definitions_term_hash
+            ON definitions(term_key, definition_hash)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_definitions_variant
+            ON definitions(variant_id)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_definitions_order
+            ON definitions(order_id)
+        """)
+
+        # Add indexes for cross_references
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cross_references_source
+            ON cross_references(source_article_id)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cross_references_target
+            ON cross_references(target_article_id)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cross_references_ref
+            ON cross_references(ref)
+        """)
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cross_references_order
+            ON cross_references(order_id)
+        """)
+
         # Add indexes for category_relationships
         cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_category_relationships_source 
@@ -226,12 +474,163 @@ def setup_tables():
     except psycopg2.OperationalError as e:
         if "database" in str(e) and "does not exist" in str(e):
             # Database doesn't exist, create it
-            create_database()
+            create_database(database)
             # Try connecting again
-            return setup_tables()
+            return setup_tables(database)
         else:
             raise
 
+
+# Embedded backend schema: orders, articles and similarities as in setup_tables,
+# with TEXT[] columns held as JSON. precedent_graph and article_precedents are
+# Postgres only (they rely on DISTINCT ON, arrays and JSONB).
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY,
+        order_name TEXT UNIQUE,
+        order_year INTEGER,
+        order_SI_number INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS articles (
+        article_id INTEGER PRIMARY KEY,
+        order_id INTEGER REFERENCES orders(order_id),
+        article_number TEXT,
+        article_title TEXT,
+        article_text TEXT_ARRAY,
+        novel BOOLEAN DEFAULT NULL,
+        title_hash TEXT,
+        title_words TEXT_ARRAY,
+        word_count INT,
+        first_paragraph TEXT,
+        category TEXT,
+        hash TEXT,
+        provision_kind TEXT NOT NULL DEFAULT 'article',
+        schedule_number TEXT NOT NULL DEFAULT '',
+        schedule_name TEXT,
+        schedule_type TEXT,
+        part_number TEXT NOT NULL DEFAULT '',
+        part_title TEXT,
+        UNIQUE(order_id, schedule_number, part_number, article_number)
+    );
+
+    CREATE TABLE IF NOT EXISTS similarities (
+        id INTEGER PRIMARY KEY,
+        source_article_id INTEGER REFERENCES articles(article_id),
+        target_article_id INTEGER REFERENCES articles(article_id),
+        target_order_id INTEGER REFERENCES orders(order_id),
+        similarity_score FLOAT,
+        reordered BOOLEAN DEFAULT FALSE,
+        updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        UNIQUE(source_article_id, target_order_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS paragraph_cache (
+        hash_id TEXT PRIMARY KEY,
+        paragraph_text TEXT,
+        word_count INT,
+        paragraph_index INT,
+        article_id INT REFERENCES articles(article_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS title_patterns (
+        id INTEGER PRIMARY KEY,
+        source_hash TEXT,
+        target_hash TEXT,
+        frequency INT,
+        avg_content_similarity FLOAT,
+        UNIQUE(source_hash, target_hash)
+    );
+
+    CREATE TABLE IF NOT EXISTS category_relationships (
+        source_category TEXT,
+        target_category TEXT,
+        frequency INT,
+        avg_similarity FLOAT,
+        PRIMARY KEY (source_category, target_category)
+    );
+
+    CREATE TABLE IF NOT EXISTS definitions (
+        definition_id INTEGER PRIMARY KEY,
+        article_id INTEGER REFERENCES articles(article_id),
+        order_id INTEGER REFERENCES orders(order_id),
+        term TEXT,
+        term_key TEXT,
+        definition_text TEXT,
+        definition_hash TEXT,
+        variant_id INTEGER,
+        variant_similarity FLOAT,
+        UNIQUE(article_id, term_key)
+    );
+
+    CREATE TABLE IF NOT EXISTS cross_references (
+        reference_id INTEGER PRIMARY KEY,
+        source_article_id INTEGER REFERENCES articles(article_id),
+        order_id INTEGER REFERENCES orders(order_id),
+        reference_kind TEXT,
+        target_schedule_number TEXT,
+        target_part_number TEXT NOT NULL DEFAULT '',
+        target_article_number TEXT,
+        target_subref TEXT,
+        ref TEXT,
+        link_text TEXT,
+        target_article_id INTEGER REFERENCES articles(article_id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_articles_order_id ON articles(order_id);
+    CREATE INDEX IF NOT EXISTS idx_paragraph_cache_article ON paragraph_cache(article_id);
+    CREATE INDEX IF NOT EXISTS idx_similarities_source_article_id ON similarities(source_article_id);
+    CREATE INDEX IF NOT EXISTS idx_similarities_target_order_id ON similarities(target_order_id);
+    CREATE INDEX IF NOT EXISTS idx_similarities_target_article_id ON similarities(target_article_id);
+    CREATE INDEX IF NOT EXISTS idx_similarities_updated_at ON similarities(updated_at);
+    CREATE INDEX IF NOT EXISTS idx_articles_title_hash ON articles(title_hash);
+    CREATE INDEX IF NOT EXISTS idx_articles_category_word_count ON articles(category, word_count);
+    CREATE INDEX IF NOT EXISTS idx_articles_partition ON articles(provision_kind, schedule_type, category, word_count);
+    CREATE INDEX IF NOT EXISTS idx_articles_hash ON articles(hash);
+    CREATE INDEX IF NOT EXISTS idx_title_patterns_source_hash ON title_patterns(source_hash);
+    CREATE INDEX IF NOT EXISTS idx_title_patterns_target_hash ON title_patterns(target_hash);
+    CREATE INDEX IF NOT EXISTS idx_definitions_term_hash ON definitions(term_key, definition_hash);
+    CREATE INDEX IF NOT EXISTS idx_definitions_variant ON definitions(variant_id);
+    CREATE INDEX IF NOT EXISTS idx_definitions_order ON definitions(order_id);
+    CREATE INDEX IF NOT EXISTS idx_cross_references_source ON cross_references(source_article_id);
+    CREATE INDEX IF NOT EXISTS idx_cross_references_target ON cross_references(target_article_id);
+    CREATE INDEX IF NOT EXISTS idx_cross_references_ref ON cross_references(ref);
+    CREATE INDEX IF NOT EXISTS idx_cross_references_order ON cross_references(order_id);
+    CREATE INDEX IF NOT EXISTS idx_category_relationships_source ON category_relationships(source_category);
+    CREATE INDEX IF NOT EXISTS idx_category_relationships_target ON category_relationships(target_category);
+"""
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    sqlite3.register_converter("TEXT_ARRAY", json.loads)
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute("PRAGMA foreign_keys = ON")
+    # One writer per file; WAL keeps readers (e.g. the benchmark's recall check) off the writer's back
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# Columns added to the SQLite schema since it was introduced: table -> [(column, definition)]
+SQLITE_ADDED_COLUMNS = {
+    'cross_references': [('target_part_number', "TEXT NOT NULL DEFAULT ''")],
+}
+
+
+def setup_sqlite_tables(path: str):
+    """Embedded alternative to setup_tables: creates the schema in a SQLite database file"""
+    conn = connect_sqlite(path)
+    conn.executescript(SQLITE_SCHEMA)
+    # CREATE TABLE IF NOT EXISTS leaves older files without the newer columns
+    for table, columns in SQLITE_ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    conn.commit()
+    logging.info(f"SQLite schema ready in {path}")
+    return conn, SQLiteCursor(conn)
+
 @dataclass
 class ComparisonResult:
     similarity: float
@@ -253,6 +652,14 @@ class Article:
     first_paragraph: str = None
     title_words: List[str] = None
     article_title: str = None  # Add this line
+    provision_kind: str = 'article'  # 'article' or 'schedule'
+    schedule_type: str = None
+    definitions: Dict[str, str] = None  # Interpretation articles only, see scoring_definitions
+
+    @property
+    def partition(self) -> Tuple[str, str]:
+        """Candidate partition: articles are only compared with articles, schedule paragraphs with the same type of schedule"""
+        return self.provision_kind, self.schedule_type
 
 @dataclass
 class ParagraphMatch:
@@ -260,6 +667,236 @@ class ParagraphMatch:
     target_idx: int
     similarity: float
 
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor that counts the statements it sends, as a measure of SQL round trips"""
+    round_trips = 0
+
+    def execute(self, query, vars=None):
+        self.round_trips += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        self.round_trips += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self.round_trips += 1
+        return super().copy_expert(sql, file, size)
+
+
+class SQLiteCursor:
+    """
+    Cursor for the embedded SQLite backend.
+
+    Accepts the matcher's psycopg2-style queries (%s placeholders, Python lists
+    for TEXT[] columns) so the ingest and match path runs unchanged against a
+    database file. Lists are stored as JSON in TEXT_ARRAY columns and decoded
+    again on the way out.
+    """
+
+    # The row list placeholder of an execute_values query
+    VALUES_PLACEHOLDER = re.compile(r'\bVALUES\s+%s', re.IGNORECASE)
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._cur = conn.cursor()
+        self._returned = None
+        self.round_trips = 0
+
+    @staticmethod
+    def _translate(query: str) -> str:
+        return query.replace('%s', '?').replace('%%', '%')
+
+    @staticmethod
+    def _adapt(params) -> tuple:
+        if params is None:
+            return ()
+        return tuple(json.dumps(p) if isinstance(p, list) else p for p in params)
+
+    def execute(self, query, vars=None):
+        self.round_trips += 1
+        self._returned = None
+        self._cur.execute(self._translate(query), self._adapt(vars))
+
+    def executemany(self, query, vars_list):
+        self.round_trips += 1
+        self._returned = None
+        self._cur.executemany(self._translate(query), [self._adapt(v) for v in vars_list])
+
+    def execute_values(self, query, argslist, page_size=100):
+        """
+        Equivalent of psycopg2.extras.execute_values: expands 'VALUES %s' into
+        multi-row VALUES, one statement per page. Rows from a RETURNING clause
+        are kept across every page for fetchone/fetchall.
+        """
+        parts = self.VALUES_PLACEHOLDER.split(query, maxsplit=1)
+        if len(parts) != 2:
+            raise ValueError("execute_values query must contain 'VALUES %s'")
+        # The other placeholders are translated around the VALUES list, which is already in '?' form
+        head, tail = (self._translate(part) for part in parts)
+        self._returned = []
+        for start in range(0, len(argslist), page_size):
+            page = [self._adapt(row) for row in argslist[start:start + page_size]]
+            values = ', '.join('(' + ', '.join('?' * len(row)) + ')' for row in page)
+            self.round_trips += 1
+            self._cur.execute(f'{head}VALUES {values}{tail}',
+                              [value for row in page for value in row])
+            self._returned.extend(self._cur.fetchall())
+
+    def fetchone(self):
+        if self._returned is not None:
+            return self._returned.pop(0) if self._returned else None
+        return self._cur.fetchone()
+
+    def fetchmany(self, size):
+        if self._returned is not None:
+            rows, self._returned = self._returned[:size], self._returned[size:]
+            return rows
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        if self._returned is not None:
+            rows, self._returned = self._returned, []
+            return rows
+        return self._cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+def insert_values(cur, query: str, argslist: List[tuple], fetch: bool = False) -> List[tuple]:
+    """
+    execute_values against whichever backend the cursor belongs to.
+    With fetch=True, returns the RETURNING rows of every page.
+    """
+    if isinstance(cur, SQLiteCursor):
+        cur.execute_values(query, argslist)
+        return cur.fetchall() if fetch else None
+    return execute_values(cur, query, argslist, fetch=fetch)
+
+
+class MatcherMetrics:
+    """Wall time per stage and work counters for matching one Order"""
+
+    STAGES = ('xml_parse', 'order_upsert', 'article_upsert', 'corpus_load',
+              'candidate_generation', 'scoring', 'writes')
+
+    def __init__(self, order_name: str):
+        self.order_name = order_name
+        self.wall_seconds = 0.0
+        self.stage_seconds = {stage: 0.0 for stage in self.STAGES}
+        self.counters = {
+            'articles': 0,
+            'paragraphs': 0,
+            'target_orders': 0,
+            'sql_round_trips': 0,
+            'candidates': 0,
+            'pruned_pairs': 0,
+            'levenshtein_comparisons': 0,
+            'definition_comparisons': 0,
+            'early_exits': 0
+        }
+        self.max_candidates_per_article = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - start
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_candidates(self, candidates: int) -> None:
+        self.count('candidates', candidates)
+        self.max_candidates_per_article = max(self.max_candidates_per_article, candidates)
+
+    def to_dict(self) -> Dict:
+        articles = self.counters['articles']
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'order_name': self.order_name,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'stage_seconds': {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()},
+            'counters': dict(self.counters),
+            'candidates_per_article': {
+                'mean': self.counters['candidates'] / articles if articles else 0.0,
+                'max': self.max_candidates_per_article
+            }
+        }
+
+
+class MetricsSink:
+    """
+    Writes MatcherMetrics after each Order: one JSON line per Order, and a
+    Prometheus textfile (for node_exporter's textfile collector) holding the
+    latest Order alongside totals for the run.
+    """
+
+    def __init__(self, jsonl_path: str = None, prom_path: str = None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.orders = 0
+        self.total_stage_seconds = {stage: 0.0 for stage in MatcherMetrics.STAGES}
+        self.total_counters = {}
+
+    def emit(self, metrics: MatcherMetrics) -> None:
+        self.orders += 1
+        for stage, seconds in metrics.stage_seconds.items():
+            self.total_stage_seconds[stage] = self.total_stage_seconds.get(stage, 0.0) + seconds
+        for name, value in metrics.counters.items():
+            self.total_counters[name] = self.total_counters.get(name, 0) + value
+
+        if self.jsonl_path:
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(metrics.to_dict()) + '\n')
+        if self.prom_path:
+            self._write_prometheus(metrics)
+
+    def _write_prometheus(self, metrics: MatcherMetrics) -> None:
+        order = metrics.order_name.replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            '# HELP dco_matcher_order_stage_seconds Wall time per stage for the last Order matched.',
+            '# TYPE dco_matcher_order_stage_seconds gauge'
+        ]
+        lines += [f'dco_matcher_order_stage_seconds{{order="{order}",stage="{stage}"}} {seconds}'
+                  for stage, seconds in metrics.stage_seconds.items()]
+        lines += [
+            '# HELP dco_matcher_order_count Work counters for the last Order matched.',
+            '# TYPE dco_matcher_order_count gauge'
+        ]
+        lines += [f'dco_matcher_order_count{{order="{order}",counter="{name}"}} {value}'
+                  for name, value in metrics.counters.items()]
+        lines += [
+            '# HELP dco_matcher_stage_seconds_total Wall time per stage over the run.',
+            '# TYPE dco_matcher_stage_seconds_total counter'
+        ]
+        lines += [f'dco_matcher_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                  for stage, seconds in self.total_stage_seconds.items()]
+        lines += [
+            '# HELP dco_matcher_count_total Work counters over the run.',
+            '# TYPE dco_matcher_count_total counter'
+        ]
+        lines += [f'dco_matcher_count_total{{counter="{name}"}} {value}'
+                  for name, value in self.total_counters.items()]
+        lines += [
+            '# HELP dco_matcher_orders_total Orders matched in the run.',
+            '# TYPE dco_matcher_orders_total counter',
+            f'dco_matcher_orders_total {self.orders}'
+        ]
+
+        # Replace atomically so the collector never reads a partial file
+        partial_path = self.prom_path + '.partial'
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(partial_path, self.prom_path)
+
 def hash_paragraph(text: str) -> str:
     return md5(text.encode()).hexdigest()
 
@@ -273,7 +910,6 @@ def word_overlap(text1, text2):
 def compare_articles(source_paragraphs: List[str], target_paragraphs: List[str]) -> Tuple[float, bool]:
     source_text = ' '.join(source_paragraphs).lower().strip()
     target_text = ' '.join(target_paragraphs).lower().strip()
-    global levcount
     similarity = ratio(source_text, target_text) * 100
     
     reordered = False
@@ -281,12 +917,81 @@ def compare_articles(source_paragraphs: List[str], target_paragraphs: List[str])
         source_order = [hash_paragraph(p) for p in source_paragraphs]
         target_order = [hash_paragraph(p) for p in target_paragraphs]
         reordered = source_order != target_order
-    levcount += 1
     return similarity, reordered
 
+# Definitions needed on both sides before Interpretation articles are compared definition by definition
+DEFINITION_MIN_TERMS = 5
+
+def scoring_definitions(definitions: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    {term_key: definition text} for compare_definitions from an article's structured
+    (term, definition_text) pairs, as extracted at parse time and held in the
+    definitions table, with text normalised as by normalise_definition.
+    Returns None when the article has fewer than DEFINITION_MIN_TERMS definitions.
+    """
+    by_term = {}
+    for term, text in definitions:
+        by_term.setdefault(term.lower(), normalise_definition(text))
+    if len(by_term) < DEFINITION_MIN_TERMS:
+        return None
+    return by_term
+
+def attach_definitions(cur, articles: List['Article']) -> None:
+    """Set the definitions of the Interpretation articles among `articles` from the definitions table"""
+    article_ids = [article.id for article in articles if article.category == 'Interpretation']
+    stored = {}
+    for start in range(0, len(article_ids), 500):
+        chunk = article_ids[start:start + 500]
+        cur.execute(f"""
+            SELECT article_id, term_key, definition_text
+            FROM definitions
+            WHERE article_id IN ({', '.join(['%s'] * len(chunk))})
+            ORDER BY definition_id
+        """, tuple(chunk))
+        for article_id, term_key, text in cur.fetchall():
+            stored.setdefault(article_id, []).append((term_key, text))
+    for article in articles:
+        if article.category == 'Interpretation':
+            article.definitions = scoring_definitions(stored.get(article.id, []))
+
+def compare_definitions(source: Dict[str, str], target: Dict[str, str]) -> Tuple[float, bool]:
+    """
+    Definition-level similarity for Interpretation articles.
+
+    Each definition is compared only with the same term's definition on the other
+    side; the definitions of terms found on one side only are compared as one block.
+    The score is the length-weighted mean of those ratios, on the same scale as
+    compare_articles, but replaces one Levenshtein ratio over two very long texts
+    with many short ones, most of which are skipped as identical.
+    """
+    matched = 0.0
+    total = 0
+    for term in source.keys() & target.keys():
+        source_text, target_text = source[term], target[term]
+        weight = max(len(source_text), len(target_text))
+        total += weight
+        matched += weight if source_text == target_text else weight * ratio(source_text, target_text)
+
+    source_only = ' '.join(text for term, text in source.items() if term not in target)
+    target_only = ' '.join(text for term, text in target.items() if term not in source)
+    if source_only or target_only:
+        weight = max(len(source_only), len(target_only))
+        total += weight
+        matched += weight * ratio(source_only, target_only)
+    similarity = matched / total * 100 if total else 0.0
+
+    common_terms = [term for term in source if term in target]
+    reordered = common_terms != [term for term in target if term in source]
+    return similarity, reordered
+
+def score_articles(source: 'Article', target: 'Article') -> Tuple[float, bool]:
+    """Similarity used by the matcher: definition by definition for Interpretation articles, otherwise compare_articles"""
+    if source.definitions and target.definitions:
+        return compare_definitions(source.definitions, target.definitions)
+    return compare_articles(source.paragraphs, target.paragraphs)
+
 def process_new_article(article_text: List[str], cur) -> None:
     # Cache paragraphs
-    global totalparas
     for idx, paragraph in enumerate(article_text):
         hash_id = hash_paragraph(paragraph)
         cur.execute("""
@@ -330,10 +1035,34 @@ def categorize_article(title: str) -> str:
             return category
     return "Other"
 
+def categorize_schedule(schedule_name: str) -> str:
+    """Schedule type used to partition candidates, so e.g. protective provisions are only compared with each other"""
+    schedule_type_patterns = {
+        "Protective provisions": ["protective provision", "protection of", "for the protection"],
+        "Requirements": ["requirement"],
+        "Discharge procedure": ["discharge", "procedure for", "approvals"],
+        "Authorised development": ["authorised development", "authorised project", "ancillary works"],
+        "Marine licence": ["marine licence", "deemed licence", "deemed marine"],
+        "Land": ["land", "acquisition", "compensation", "possession"],
+        "Streets and access": ["street", "access", "highway", "road", "traffic", "rights of way", "footpath"],
+        "Trees and hedgerows": ["tree", "hedgerow"],
+        "Certified documents": ["certified", "documents", "plans"],
+        "Legislation": ["legislation", "enactments", "modification", "disapplication", "amendment"]
+    }
+
+    name_lower = (schedule_name or '').lower()
+    for schedule_type, patterns in schedule_type_patterns.items():
+        if any(pattern in name_lower for pattern in patterns):
+            return schedule_type
+    return "Other"
+
 def compute_title_signature(title: str) -> Tuple[str, List[str]]:
     """Compute title hash and word list"""
     words = [w.lower() for w in title.split()]
-    return md5(' '.join(sorted(words)).encode()).hexdigest(), words
+    return hash_title_words(words), words
+
+def hash_title_words(words: List[str]) -> str:
+    return md5(' '.join(sorted(words)).encode()).hexdigest()
 
 def get_word_count_range(word_count):
     if word_count < 50:
@@ -344,118 +1073,6 @@ def get_word_count_range(word_count):
         return word_count * 0.7, word_count * 1.3  # Current strict range for longer articles
 
 
-# def find_candidate_articles(cur, new_article: Article, target_order_id: int) -> List[Article]:
-#     # First check for exact matches using hash
-#     cur.execute("""
-#         SELECT article_id, article_text, title_hash, word_count, article_title, category 
-#         FROM articles 
-#         WHERE order_id = %s AND hash = %s
-#     """, (target_order_id, new_article.hash))
-    
-#     exact_match = cur.fetchone()
-#     if exact_match:
-#         article_id, article_text, title_hash, word_count, title, category = exact_match
-#         # print("Exact match found")
-#         return [Article(
-#             id=article_id,
-#             paragraphs=article_text,
-#             order_id=target_order_id,
-#             hash=new_article.hash,
-#             joined_text=' '.join(article_text),
-#             length=len(' '.join(article_text)),
-#             signature=get_text_signature(' '.join(article_text)),
-#             title_hash=title_hash,
-#             word_count=word_count,
-#             article_title=title
-#         )]
-
-#     # If no exact match, proceed with other checks
-#     min_words, max_words = get_word_count_range(new_article.word_count)
-    
-#     cur.execute("""
-#         SELECT article_id, article_text, title_hash, word_count, article_title, category
-#         FROM articles 
-#         WHERE order_id = %s
-#         AND word_count BETWEEN %s AND %s
-#     """, (target_order_id, min_words, max_words))
-
-#     candidates = []
-#     for row in cur.fetchall():
-#         article_id, article_text, title_hash, word_count, title, category = row
-
-#         # Check category match
-#         if category != new_article.category:
-#             continue
-
-#         # Check length similarity (within 20%)
-#         source_length = len(' '.join(new_article.paragraphs))
-#         target_length = len(' '.join(article_text))
-#         length_ratio = target_length / source_length if source_length > 0 else 0
-        
-#         if not (0.8 <= length_ratio <= 1.2):
-#             continue
-
-#         # Count identical paragraphs
-#         identical_count = sum(1 for p1 in new_article.paragraphs
-#                             for p2 in article_text
-#                             if p1.lower().strip() == p2.lower().strip())
-        
-#         # Check if more than half are identical (for articles with 5+ paragraphs)
-#         if len(new_article.paragraphs) >= 5:
-#             if identical_count > len(new_article.paragraphs) / 2:
-#                 candidates.append(Article(
-#                     id=article_id,
-#                     paragraphs=article_text,
-#                     order_id=target_order_id,
-#                     hash=calculate_hash(article_text),
-#                     joined_text=' '.join(article_text),
-#                     length=len(' '.join(article_text)),
-#                     signature=get_text_signature(' '.join(article_text)),
-#                     title_hash=title_hash,
-#                     word_count=word_count,
-#                     article_title=title
-#                 ))
-#                 continue
-#         # For articles with fewer paragraphs, keep existing exact match check
-#         elif any(p1.lower().strip() == p2.lower().strip()
-#                 for p1 in new_article.paragraphs
-#                 for p2 in article_text):
-#             candidates.append(Article(
-#                 id=article_id,
-#                 paragraphs=article_text,
-#                 order_id=target_order_id,
-#                 hash=calculate_hash(article_text),
-#                 joined_text=' '.join(article_text),
-#                 length=len(' '.join(article_text)),
-#                 signature=get_text_signature(' '.join(article_text)),
-#                 title_hash=title_hash,
-#                 word_count=word_count,
-#                 article_title=title
-#             ))
-#             continue
-
-
-#         # If no exact match, check word overlap
-#         source_words = set(' '.join(new_article.paragraphs).lower().split())
-#         target_words = set(' '.join(article_text).lower().split())
-#         overlap = len(source_words & target_words) / min(len(source_words), len(target_words))
-
-#         if overlap > 0.8:  # Threshold for word overlap
-#             candidates.append(Article(
-#                 id=article_id,
-#                 paragraphs=article_text,
-#                 order_id=target_order_id,
-#                 hash=calculate_hash(article_text),
-#                 joined_text=' '.join(article_text),
-#                 length=len(' '.join(article_text)),
-#                 signature=get_text_signature(' '.join(article_text)),
-#                 title_hash=title_hash,
-#                 word_count=word_count,
-#                 article_title=title
-#             ))
-
-#     return candidates
-
 def calculate_candidate_score(new_article: Article, candidate: Article) -> float:
     """
     Calculate a priority score for a candidate article based on multiple indicators.
@@ -497,374 +1114,1789 @@ def calculate_candidate_score(new_article: Article, candidate: Article) -> float
     
     return score
 
-def find_candidate_articles(cur, new_article: Article, target_order_id: int) -> List[Tuple[float, Article]]:
+def fetch_articles(cur, query: str, params: tuple = None) -> List[Article]:
     """
-    Find and score candidate articles, returning them sorted by likelihood of matching.
-    Returns: List of (score, article) tuples sorted by score descending.
+    Run an article query and build Article objects from its rows, with the
+    definitions of Interpretation articles attached.
+    The query must select: article_id, article_text, order_id, title_hash,
+    category, word_count, title_words, hash, provision_kind, schedule_type
     """
-    # First check for exact hash matches
-    cur.execute("""
-        SELECT article_id, article_text, title_hash, word_count, article_title, category 
-        FROM articles 
-        WHERE order_id = %s AND hash = %s
-    """, (target_order_id, new_article.hash))
-    
-    exact_match = cur.fetchone()
-    if exact_match:
-        article_id, article_text, title_hash, word_count, title, category = exact_match
-        article = Article(
-            id=article_id,
-            paragraphs=article_text,
-            order_id=target_order_id,
-            hash=new_article.hash,
-            joined_text=' '.join(article_text),
-            length=len(' '.join(article_text)),
-            signature=get_text_signature(' '.join(article_text)),
-            title_hash=title_hash,
-            word_count=word_count,
-            article_title=title,
-            category=category
-        )
-        return [(100.0, article)]  # Perfect match
+    cur.execute(query, params)
+    articles = [article_from_row(row) for row in cur.fetchall()]
+    attach_definitions(cur, articles)
+    return articles
+
+def article_from_row(row: tuple) -> Article:
+    """Build an Article from a row in the column order fetch_articles expects, without definitions"""
+    art_id, text, o_id, t_hash, cat, w_count, t_words, a_hash, kind, s_type = row
+    joined_text = ' '.join(text)
+    return Article(
+        id=art_id,
+        paragraphs=text,
+        order_id=o_id,
+        hash=a_hash,
+        joined_text=joined_text,
+        length=len(joined_text),
+        signature=get_text_signature(joined_text),
+        title_hash=t_hash,
+        category=cat,
+        word_count=w_count,
+        first_paragraph=text[0] if text else '',
+        title_words=t_words,
+        provision_kind=kind,
+        schedule_type=s_type
+    )
+
+# Rows fetched per round trip when streaming the corpus
+CORPUS_BATCH_SIZE = 2000
+
+def stream_target_orders(conn, cur, order_id: int, batch_size: int = CORPUS_BATCH_SIZE,
+                         with_definitions: bool = True, earlier_only: bool = False):
+    """
+    Yield (target_order_id, articles) for every Order other than `order_id`, one
+    Order at a time as its rows arrive. With `earlier_only`, only Orders made
+    before it (by year, then SI number) are yielded.
+
+    On Postgres the corpus is read through a named server-side cursor in batches
+    of `batch_size` rows, so memory is bounded by the largest Order rather than
+    the whole database and matching can start before the last row is sent.
+    With `with_definitions`, each Order's Interpretation articles have their
+    definitions attached through `cur`.
+    """
+    if earlier_only:
+        query = """
+            SELECT a.article_id, a.article_text, a.order_id, a.title_hash, a.category, a.word_count, a.title_words,
+                a.hash, a.provision_kind, a.schedule_type
+            FROM articles a
+            JOIN orders o ON a.order_id = o.order_id
+            WHERE (o.order_year, o.order_SI_number) < (
+                SELECT order_year, order_SI_number FROM orders WHERE order_id = %s
+            )
+            ORDER BY a.order_id
+        """
+    else:
+        query = """
+            SELECT article_id, article_text, order_id, title_hash, category, word_count, title_words, hash,
+                provision_kind, schedule_type
+            FROM articles
+            WHERE order_id != %s
+            ORDER BY order_id
+        """
+    yield from stream_orders(conn, cur, query, (order_id,), f"corpus_stream_{order_id}",
+                             batch_size, with_definitions)
+
+def stream_orders(conn, cur, query: str, params: tuple, name: str, batch_size: int = CORPUS_BATCH_SIZE,
+                  with_definitions: bool = True):
+    """
+    Yield (order_id, articles) for each Order an article query returns, through a
+    server-side cursor called `name` on Postgres, `batch_size` rows at a time.
+    The query selects the columns fetch_articles expects, with each Order's rows together.
+    """
+    if isinstance(cur, SQLiteCursor):
+        stream = SQLiteCursor(conn)
+    else:
+        stream = conn.cursor(name=name)
+    stream.execute(query, params)
+
+    def rows():
+        while True:
+            batch = stream.fetchmany(batch_size)
+            if hasattr(cur, 'round_trips'):
+                cur.round_trips += 1
+            if not batch:
+                return
+            yield from batch
+
+    try:
+        for order_id, group in groupby(rows(), key=lambda row: row[2]):
+            articles = [article_from_row(row) for row in group]
+            if with_definitions:
+                attach_definitions(cur, articles)
+            yield order_id, articles
+    finally:
+        if stream is not cur:
+            stream.close()
+
+def rank_candidates(new_article: Article, target_articles: List[Article]) -> List[Tuple[float, Article]]:
+    """
+    Score the candidates among a target order's loaded articles, best first: an
+    identical hash is a perfect match, otherwise articles of the same category
+    within the word count range are scored by calculate_candidate_score. Only
+    candidates in the same partition (provision kind and schedule type) are considered.
+    """
+    target_articles = [candidate for candidate in target_articles if candidate.partition == new_article.partition]
+    for candidate in target_articles:
+        if candidate.hash == new_article.hash:
+            return [(100.0, candidate)]  # Perfect match
 
-    # Get potential candidates within word count range
     min_words, max_words = get_word_count_range(new_article.word_count)
-    
-    cur.execute("""
-        SELECT article_id, article_text, title_hash, word_count, article_title, category
-        FROM articles 
-        WHERE order_id = %s
-        AND word_count BETWEEN %s AND %s
-        AND category = %s  -- Prioritize category matches first
-    """, (target_order_id, min_words, max_words, new_article.category))
 
     scored_candidates = []
-    for row in cur.fetchall():
-        article_id, article_text, title_hash, word_count, title, category = row
-        
-        candidate = Article(
-            id=article_id,
-            paragraphs=article_text,
-            order_id=target_order_id,
-            hash=calculate_hash(article_text),
-            joined_text=' '.join(article_text),
-            length=len(' '.join(article_text)),
-            signature=get_text_signature(' '.join(article_text)),
-            title_hash=title_hash,
-            word_count=word_count,
-            article_title=title,
-            category=category
-        )
-        
+    for candidate in target_articles:
+        if candidate.category != new_article.category:
+            continue
+        if not (min_words <= candidate.word_count <= max_words):
+            continue
+
         score = calculate_candidate_score(new_article, candidate)
-        if score > 0:  # Only include candidates with non-zero scores
+        if score > 0:
             scored_candidates.append((score, candidate))
-    
-    # Sort by score descending
+
     return sorted(scored_candidates, key=lambda x: x[0], reverse=True)
 
-levcount=0
-total_paragraphs=0
-total_db_paragraphs=0
+def best_candidate_match(new_article: Article, scored_candidates: List[Tuple[float, Article]],
+                         metrics: 'MatcherMetrics' = None) -> Tuple[float, int, bool]:
+    """
+    Run Levenshtein over candidates in order of likelihood.
+    Returns: (similarity, target_article_id, reordered) for the best candidate, or None.
+    """
+    best_match = None
+    for score, candidate in scored_candidates:
+        similarity, reordered = score_articles(new_article, candidate)
+        if metrics is not None:
+            metrics.count('definition_comparisons' if new_article.definitions and candidate.definitions
+                          else 'levenshtein_comparisons')
+
+        # Update best match if better
+        if similarity > (best_match[0] if best_match else 0):
+            best_match = (similarity, candidate.id, reordered)
+
+        # Early termination if we found a very good match
+        if similarity >= 95:
+            if metrics is not None:
+                metrics.count('early_exits')
+            break  # Stop processing candidates for this order
+
+    return best_match
+
+# Conflict condition for similarity upserts: rows whose match is unchanged are left
+# alone, so updated_at only moves when a match actually changes
+SIMILARITY_CHANGED = """
+    WHERE similarities.target_article_id <> EXCLUDED.target_article_id
+    OR similarities.similarity_score <> EXCLUDED.similarity_score
+    OR similarities.reordered <> EXCLUDED.reordered
+"""
+
+def store_similarities(cur, new_art: Article, best_matches: Dict[int, Tuple[float, int, bool]]) -> None:
+    """Write an article's best match per target order, and update title patterns"""
+    # Convert best_matches to similarity data for database insertion
+    if best_matches:
+        similarity_data = []
+        for target_order_id, (similarity, target_id, reordered) in best_matches.items():
+            similarity_data.append((
+                new_art.id,
+                target_id,
+                target_order_id,
+                similarity,
+                reordered
+            ))
+            
+            # Get target article hash
+            cur.execute("SELECT title_hash FROM articles WHERE article_id = %s", (target_id,))
+            target_hash = cur.fetchone()[0]
+            
+            # Update title patterns
+            cur.execute("""
+                INSERT INTO title_patterns (source_hash, target_hash, frequency, avg_content_similarity)
+                VALUES (%s, %s, 1, %s)
+                ON CONFLICT (source_hash, target_hash) 
+                DO UPDATE SET 
+                    frequency = title_patterns.frequency + 1,
+                    avg_content_similarity = 
+                        (title_patterns.avg_content_similarity * title_patterns.frequency + %s) 
+                        / (title_patterns.frequency + 1)
+            """, (new_art.title_hash, target_hash, similarity, similarity))
+
+        # Insert similarities with reordering flag
+        insert_values(cur, f"""
+            INSERT INTO similarities (
+                source_article_id, 
+                target_article_id, 
+                target_order_id, 
+                similarity_score,
+                reordered
+            )
+            VALUES %s
+            ON CONFLICT (source_article_id, target_order_id) 
+            DO UPDATE SET 
+                target_article_id = EXCLUDED.target_article_id,
+                similarity_score = EXCLUDED.similarity_score,
+                reordered = EXCLUDED.reordered,
+                updated_at = EXCLUDED.updated_at
+            {SIMILARITY_CHANGED}
+        """, similarity_data)
+
+
+# Minimum similarity for a match to count as an article's precedent in the lineage graph
+LINEAGE_THRESHOLD = 50
+
+
+def _reparent_article(cur, article_id: int, old_parent_id: int, new_parent_id: int, similarity: float) -> None:
+    """Move an article's subtree under a new parent, keeping counts, roots and depths consistent"""
+    cur.execute("SELECT descendant_count + 1 FROM precedent_graph WHERE article_id = %s", (article_id,))
+    subtree_size = cur.fetchone()[0]
+
+    ancestors_query = """
+        WITH RECURSIVE chain AS (
+            SELECT article_id, parent_article_id FROM precedent_graph WHERE article_id = %s
+            UNION ALL
+            SELECT g.article_id, g.parent_article_id
+            FROM precedent_graph g
+            JOIN chain c ON g.article_id = c.parent_article_id
+        )
+        UPDATE precedent_graph
+        SET descendant_count = descendant_count + %s
+        WHERE article_id IN (SELECT article_id FROM chain)
+    """
+    if old_parent_id is not None:
+        cur.execute(ancestors_query, (old_parent_id, -subtree_size))
 
-def process_file(file_path: str, conn, cur) -> None:
-    start_time = time.time()
-    logging.info(f"Processing {file_path}")
-    df = parse_xml(file_path)
-    logging.info(f"Loaded {len(df)} articles from XML")
+    if new_parent_id is not None:
+        # The parent may predate the graph, in which case it starts as a root
+        cur.execute("""
+            INSERT INTO precedent_graph (article_id, root_article_id, depth)
+            VALUES (%s, %s, 0)
+            ON CONFLICT (article_id) DO NOTHING
+        """, (new_parent_id, new_parent_id))
+        cur.execute(ancestors_query, (new_parent_id, subtree_size))
 
-    global levcount
-    global total_paragraphs
-    global total_db_paragraphs
+    cur.execute("""
+        UPDATE precedent_graph
+        SET parent_article_id = %s, parent_similarity = %s
+        WHERE article_id = %s
+    """, (new_parent_id, similarity, article_id))
 
+    # Roots and depths of the whole moved subtree follow from the new parent
     cur.execute("""
-        SELECT o.order_name, SUM(array_length(a.article_text, 1))
-        FROM orders o 
-        JOIN articles a ON o.order_id = a.order_id
-        GROUP BY o.order_name
+        WITH RECURSIVE subtree AS (
+            SELECT g.article_id,
+                   COALESCE(p.root_article_id, g.article_id) AS root_article_id,
+                   COALESCE(p.depth + 1, 0) AS depth
+            FROM precedent_graph g
+            LEFT JOIN precedent_graph p ON p.article_id = g.parent_article_id
+            WHERE g.article_id = %s
+            UNION ALL
+            SELECT g.article_id, s.root_article_id, s.depth + 1
+            FROM precedent_graph g
+            JOIN subtree s ON g.parent_article_id = s.article_id
+        )
+        UPDATE precedent_graph g
+        SET root_article_id = s.root_article_id, depth = s.depth
+        FROM subtree s
+        WHERE g.article_id = s.article_id
+    """, (article_id,))
+
+
+def update_precedent_graph(cur, article_ids: List[int]) -> None:
+    """
+    Bring the precedent graph up to date for articles whose similarities changed.
+
+    Each article's parent is its best match in an earlier Order (by year, then SI
+    number), with ties going to the earliest Order. Every node also carries its
+    lineage root, its depth below that root and its number of descendants, so a
+    whole lineage tree is one indexed read:
+
+        SELECT * FROM precedent_graph
+        WHERE root_article_id = (SELECT root_article_id FROM precedent_graph WHERE article_id = %s)
+    """
+    if not article_ids:
+        return
+
+    cur.execute("""
+        INSERT INTO precedent_graph (article_id, root_article_id, depth)
+        SELECT article_id, article_id, 0 FROM unnest(%s::int[]) AS article_id
+        ON CONFLICT (article_id) DO NOTHING
+    """, (article_ids,))
+
+    cur.execute("""
+        SELECT DISTINCT ON (s.source_article_id)
+            s.source_article_id, s.target_article_id, s.similarity_score
+        FROM similarities s
+        JOIN articles sa ON sa.article_id = s.source_article_id
+        JOIN orders so ON so.order_id = sa.order_id
+        JOIN orders t ON t.order_id = s.target_order_id
+        WHERE s.source_article_id = ANY(%s)
+        AND s.similarity_score >= %s
+        AND (t.order_year, t.order_SI_number) < (so.order_year, so.order_SI_number)
+        ORDER BY s.source_article_id, s.similarity_score DESC, t.order_year, t.order_SI_number
+    """, (article_ids, LINEAGE_THRESHOLD))
+    best_parents = {source_id: (target_id, score) for source_id, target_id, score in cur.fetchall()}
+
+    cur.execute("""
+        SELECT article_id, parent_article_id, parent_similarity
+        FROM precedent_graph
+        WHERE article_id = ANY(%s)
+    """, (article_ids,))
+    for article_id, old_parent_id, old_similarity in cur.fetchall():
+        new_parent_id, similarity = best_parents.get(article_id, (None, None))
+        if new_parent_id == old_parent_id:
+            if similarity != old_similarity:
+                cur.execute("""
+                    UPDATE precedent_graph SET parent_similarity = %s WHERE article_id = %s
+                """, (similarity, article_id))
+            continue
+        _reparent_article(cur, article_id, old_parent_id, new_parent_id, similarity)
+
+
+def rebuild_precedent_graph(cur) -> None:
+    """Rebuild the precedent graph from similarities, one Order at a time in chronological order"""
+    cur.execute("TRUNCATE precedent_graph")
+    cur.execute("""
+        SELECT a.order_id, array_agg(a.article_id)
+        FROM articles a
+        JOIN orders o ON a.order_id = o.order_id
+        GROUP BY a.order_id, o.order_year, o.order_SI_number
+        ORDER BY o.order_year, o.order_SI_number
     """)
-    # db_paragraphs = cur.fetchall()
-    # total_db_paragraphs = sum(count for _, count in db_paragraphs)
-    # logging.info(f"Total paragraphs in database: {total_db_paragraphs}")
+    for order_id, article_ids in cur.fetchall():
+        update_precedent_graph(cur, article_ids)
+    logging.info("Rebuilt precedent graph")
 
 
-    totalparas = 0
-    levcount = 0
-    # Process order
-    order_data = [(
-        df.iloc[0]['Order'],
-        int(df.iloc[0]['Year']), 
-        int(df.iloc[0]['No.'])
-    )]
-    log_order_name = df.iloc[0]['Order']
+# Number of matches kept per article in the precedent panel read model
+PRECEDENT_PANEL_SIZE = 20
 
-    execute_values(cur, """
-        INSERT INTO orders (
-            order_name, order_year, order_SI_number
+
+def refresh_article_precedents(cur, article_ids: List[int]) -> None:
+    """
+    Recompute the article_precedents rows for the given articles.
+
+    Each row holds the article's top matches in both directions, best first, with
+    order name, year, article number, title, first paragraph and link already
+    resolved, so the precedent panel is a primary-key read rather than a join
+    over similarities, articles and orders. Links to schedule paragraphs in a Part
+    include it (/schedule/2/part/3/paragraph/1), as paragraph numbers restart in
+    each Part. Called in the same transaction as the similarities writes it
+    reflects, with the articles those writes added or removed a match for.
+    """
+    if not article_ids:
+        return
+
+    # Keys follow the SimilarArticle shape used by the precedent pages
+    match_columns = """
+        jsonb_build_object(
+            'similarity_id', s.id,
+            'similarity', s.similarity_score,
+            'reordered', s.reordered,
+            'article_id', m.article_id,
+            'article_number', m.article_number,
+            'provision_kind', m.provision_kind,
+            'schedule_number', NULLIF(m.schedule_number, ''),
+            'article_title', m.article_title,
+            'first_paragraph', m.first_paragraph,
+            'category', m.category,
+            'word_count', m.word_count,
+            'order_id', o.order_id,
+            'order_name', o.order_name,
+            'order_year', o.order_year,
+            'url', 'https://www.legislation.gov.uk/uksi/' || o.order_year || '/' || o.order_SI_number
+                   || CASE WHEN m.provision_kind = 'schedule'
+                           THEN '/schedule/' || m.schedule_number
+                                || CASE WHEN m.part_number <> ''
+                                        THEN '/part/' || LOWER(TRIM(REPLACE(UPPER(m.part_number), 'PART', '')))
+                                        ELSE '' END
+                                || '/paragraph/'
+                           ELSE '/article/' END
+                   || m.article_number || '/made'
         )
-        VALUES %s
-        ON CONFLICT (order_name) DO UPDATE SET 
-            order_year = EXCLUDED.order_year,
-            order_SI_number = EXCLUDED.order_SI_number
-        RETURNING order_id
-    """, order_data)
-
-    result = cur.fetchone()
-    order_id = result[0] if result else None
-
-    if not order_id:
-        cur.execute("SELECT order_id FROM orders WHERE order_name = %s", (order_name,))
-        order_id = cur.fetchone()[0]
-
-    article_data = []
-    for _, row in df.iterrows():
-        title_hash, title_words = compute_title_signature(row['Title'])
-        category = categorize_article(row['Title'])
-        word_count = len(' '.join(row['Text']).split())
-        first_paragraph = row['Text'][0] if row['Text'] else ''
-        hash = calculate_hash(row['Text'])
-
-        article_data.append((
-            order_id,
-            row['Art'],
-            row['Title'],
-            row['Text'],
-            title_hash,
-            title_words,
-            word_count,
-            first_paragraph,
-            category,
-            hash
-        ))
-    # Batch insert articles with metadata
-    execute_values(cur, """
-        INSERT INTO articles (
-            order_id, article_number, article_title, article_text,
-            title_hash, title_words, word_count, first_paragraph, category, hash
+    """
+    cur.execute(f"""
+        INSERT INTO article_precedents (article_id, precedents, successors)
+        SELECT
+            a.article_id,
+            COALESCE((
+                SELECT jsonb_agg(top.match ORDER BY top.similarity_score DESC)
+                FROM (
+                    SELECT {match_columns} AS match, s.similarity_score
+                    FROM similarities s
+                    JOIN articles m ON m.article_id = s.target_article_id
+                    JOIN orders o ON o.order_id = m.order_id
+                    WHERE s.source_article_id = a.article_id
+                    ORDER BY s.similarity_score DESC
+                    LIMIT %s
+                ) top
+            ), '[]'),
+            COALESCE((
+                SELECT jsonb_agg(top.match ORDER BY top.similarity_score DESC)
+                FROM (
+                    SELECT {match_columns} AS match, s.similarity_score
+                    FROM similarities s
+                    JOIN articles m ON m.article_id = s.source_article_id
+                    JOIN orders o ON o.order_id = m.order_id
+                    WHERE s.target_article_id = a.article_id
+                    ORDER BY s.similarity_score DESC
+                    LIMIT %s
+                ) top
+            ), '[]')
+        FROM articles a
+        WHERE a.article_id = ANY(%s)
+        ON CONFLICT (article_id) DO UPDATE SET
+            precedents = EXCLUDED.precedents,
+            successors = EXCLUDED.successors
+    """, (PRECEDENT_PANEL_SIZE, PRECEDENT_PANEL_SIZE, list(article_ids)))
+
+
+@dataclass
+class PreparedOrder:
+    """An Order parsed from XML with the derived article columns already computed"""
+    file_path: str
+    order_name: str
+    order_year: int
+    order_si_number: int
+    # (article_number, title, text, title_hash, title_words, word_count, first_paragraph, category, hash,
+    #  provision_kind, schedule_number, schedule_name, schedule_type, part_number, part_title)
+    articles: List[tuple]
+    parse_seconds: float = 0.0
+    # (schedule_number, part_number, article_number, term, definition_text), one per term per article
+    definitions: List[tuple] = field(default_factory=list)
+    # (schedule_number, part_number, article_number, kind, target_schedule_number, target_part_number,
+    #  target_article_number, target_subref, ref, link_text), one per distinct reference made by an article
+    references: List[tuple] = field(default_factory=list)
+
+
+LEGISLATION_PARSER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'legislation-parser.py')
+# Parsers the matcher can ingest with: LegislationXMLParser's provision records, or the legacy XMLDataExtractor DataFrame
+PARSERS = ('legislation', 'extractor')
+
+
+def load_legislation_parser():
+    """Import legislation-parser.py, which cannot be imported by name, once per process"""
+    module = sys.modules.get('legislation_parser')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('legislation_parser', LEGISLATION_PARSER_PATH)
+        module = importlib.util.module_from_spec(spec)
+        # Registered before it runs, so its dataclasses (and cached records) resolve by name
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def open_parse_cache(directory: str, max_mb: int = 1024, parser: str = 'legislation') -> ParseCache:
+    """
+    A ParseCache for the given parser's output, invalidated whenever that parser or the
+    reference extraction both parsers share (LegislationReferences) changes
+    """
+    source = LEGISLATION_PARSER_PATH if parser == 'legislation' else XMLDataExtractor.__file__
+    return ParseCache(directory, parser_version=f'{parser}:{source_version(source, LegislationReferences.__file__)}',
+                      max_bytes=max_mb * 1024 * 1024)
+
+
+def iter_provisions(file_path: str):
+    """
+    The provisions of an Order as LegislationXMLParser records, built lazily, with
+    every schedule selected so the parse never prompts and with their definitions.
+    """
+    legislation_parser = load_legislation_parser()
+    parser = legislation_parser.LegislationXMLParser(definitions=True)
+    policy = legislation_parser.SchedulePolicy(include_unmatched=True)
+    return parser.iter_provisions(file_path, schedule_policy=policy)
+
+
+def parse_provisions(file_path: str) -> list:
+    """Every provision record of an Order, for the parse cache"""
+    return list(iter_provisions(file_path))
+
+
+def provision_placement(number, name, part_number, part_title) -> tuple:
+    """
+    (provision_kind, schedule_number, schedule_name, schedule_type, part_number, part_title)
+    for a provision. Schedule paragraphs carry their schedule and part; body articles have ''
+    for both. Missing values arrive as None or NaN depending on the Order, so test for strings.
+    """
+    if not isinstance(number, str):
+        return ('article', '', None, None, '', None)
+    name = name if isinstance(name, str) else None
+    return (
+        'schedule',
+        number,
+        name,
+        categorize_schedule(name),
+        part_number if isinstance(part_number, str) else '',
+        part_title if isinstance(part_title, str) else None
+    )
+
+
+def prepare_order_from_records(file_path: str, records, parse_start: float) -> PreparedOrder:
+    """
+    Normalise provision records ready for insertion in one pass, without a DataFrame.
+
+    The records may be a lazy iterator such as LegislationXMLParser.iter_provisions;
+    each is turned into its article, definition and reference tuples as it arrives.
+    As with XMLDataExtractor, the Order's own name in text and definitions is
+    replaced with 'Order', so Orders compare on their wording alone.
+    """
+    articles = []
+    definitions = []
+    references = []
+    first = None
+    order_name = None
+    for record in records:
+        if first is None:
+            first = record
+            order_name = re.compile(re.escape(record.order.strip()), re.IGNORECASE)
+        text = [order_name.sub('Order', paragraph) for paragraph in record.text]
+        words = record.title.lower().split()
+        article = (
+            record.art,
+            record.title,
+            text,
+            hash_title_words(words),
+            words,
+            len(' '.join(text).split()),
+            text[0] if text else '',
+            categorize_article(record.title),
+            calculate_hash(text)
+        ) + provision_placement(record.schedule, record.schedule_name, record.part_number, record.part_title)
+        articles.append(article)
+
+        # A term defined twice in one article keeps its first definition
+        seen_terms = set()
+        for term, definition in record.definitions:
+            if term.lower() not in seen_terms:
+                seen_terms.add(term.lower())
+                definitions.append((article[10], article[13], article[0], term,
+                                    order_name.sub('Order', definition)))
+        references.extend((article[10], article[13], article[0]) + reference for reference in record.references)
+
+    if first is None:
+        raise ValueError(f"No provisions found in {file_path}")
+    return PreparedOrder(
+        file_path=file_path,
+        order_name=first.order,
+        order_year=int(first.year),
+        order_si_number=int(first.number),
+        articles=articles,
+        parse_seconds=time.perf_counter() - parse_start,
+        definitions=definitions,
+        references=references
+    )
+
+
+def normalise_extractor_text(df: 'pandas.DataFrame') -> 'pandas.DataFrame':
+    """
+    XMLDataExtractor's provisions with their text cleaned by LegislationXMLParser.clean_text,
+    as the default parser cleans its own, so either parser stores the same article
+    text, hashes and definitions for an Order.
+    """
+    clean_text = load_legislation_parser().LegislationXMLParser().clean_text
+    clean_optional = lambda value: clean_text(value) if isinstance(value, str) else value
+    return df.assign(
+        Title=df['Title'].map(clean_text),
+        Text=df['Text'].map(lambda text: [paragraph for paragraph in map(clean_text, text) if paragraph]),
+        Schedule_Name=df['Schedule_Name'].map(clean_optional),
+        Part_Title=df['Part_Title'].map(clean_optional),
+        Definitions=df['Definitions'].map(
+            lambda definitions: [(clean_text(term), clean_text(text)) for term, text in definitions]),
+        References=df['References'].map(
+            lambda references: [tuple(reference[:-1]) + (clean_text(reference[-1]),) for reference in references])
+    )
+
+
+def prepare_order(file_path: str, parse_cache: ParseCache = None, parser: str = 'legislation') -> PreparedOrder:
+    """
+    Parse an XML file and normalise its articles ready for insertion.
+
+    Kept at module level and free of database access so it can run in a
+    worker process while another Order is being matched. With a parse_cache,
+    an unchanged file is read from the cache instead of being parsed. The file
+    is read with LegislationXMLParser, schedules included, and its records are
+    normalised directly (prepare_order_from_records); parser='extractor' reads it
+    with XMLDataExtractor instead.
+    """
+    parse_start = time.perf_counter()
+    if parser == 'legislation':
+        # Cached records unpickle against the parser module, so load it first
+        load_legislation_parser()
+        # The parser prints each Order's title to stdout; the matcher logs its own progress
+        with redirect_stdout(io.StringIO()):
+            records = (parse_cache.get_or_parse(file_path, parse_provisions) if parse_cache
+                       else iter_provisions(file_path))
+            return prepare_order_from_records(file_path, records, parse_start)
+
+    df = normalise_extractor_text(
+        parse_cache.get_or_parse(file_path, parse_xml) if parse_cache else parse_xml(file_path))
+
+    # Derived columns are computed column-wise over the whole Order rather than per row
+    titles = df['Title']
+    texts = df['Text']
+    title_words = titles.str.lower().str.split()
+    title_hashes = title_words.map(hash_title_words)
+    categories = titles.map(categorize_article)
+    word_counts = texts.str.join(' ').str.split().str.len()
+    first_paragraphs = texts.map(lambda text: text[0] if text else '')
+    hashes = texts.map(calculate_hash)
+
+    placements = [provision_placement(*placement) for placement in zip(
+        df['Schedule'], df['Schedule_Name'], df['Part_Number'], df['Part_Title'])]
+
+    articles = [row + placement for row, placement in zip(zip(
+        df['Art'],
+        titles,
+        texts,
+        title_hashes,
+        title_words,
+        word_counts.astype(int).tolist(),
+        first_paragraphs,
+        categories,
+        hashes
+    ), placements)]
+
+    # Definition lists, keyed to their article; a term defined twice in one article keeps its first definition
+    definitions = []
+    for article, article_definitions in zip(articles, df['Definitions']):
+        seen_terms = set()
+        for term, text in article_definitions:
+            if term.lower() not in seen_terms:
+                seen_terms.add(term.lower())
+                definitions.append((article[10], article[13], article[0], term, text))
+
+    references = [
+        (article[10], article[13], article[0]) + reference
+        for article, article_references in zip(articles, df['References'])
+        for reference in article_references
+    ]
+
+    return PreparedOrder(
+        file_path=file_path,
+        order_name=df.iloc[0]['Order'],
+        order_year=int(df.iloc[0]['Year']),
+        order_si_number=int(df.iloc[0]['No.']),
+        articles=articles,
+        parse_seconds=time.perf_counter() - parse_start,
+        definitions=definitions,
+        references=references
+    )
+
+
+ARTICLE_COLUMNS = """
+    order_id, article_number, article_title, article_text,
+    title_hash, title_words, word_count, first_paragraph, category, hash,
+    provision_kind, schedule_number, schedule_name, schedule_type, part_number, part_title
+"""
+
+ARTICLE_UPSERT_ACTION = """
+    ON CONFLICT (order_id, schedule_number, part_number, article_number) DO UPDATE SET
+        article_title = EXCLUDED.article_title,
+        article_text = EXCLUDED.article_text,
+        title_hash = EXCLUDED.title_hash,
+        title_words = EXCLUDED.title_words,
+        word_count = EXCLUDED.word_count,
+        first_paragraph = EXCLUDED.first_paragraph,
+        category = EXCLUDED.category,
+        hash = EXCLUDED.hash,
+        provision_kind = EXCLUDED.provision_kind,
+        schedule_name = EXCLUDED.schedule_name,
+        schedule_type = EXCLUDED.schedule_type,
+        part_title = EXCLUDED.part_title
+    RETURNING article_id, schedule_number, part_number, article_number
+"""
+
+
+def _pg_array_literal(values: List[str]) -> str:
+    """TEXT[] input literal with every element quoted, so commas, braces and quotes survive COPY"""
+    return '{' + ','.join('"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values) + '}'
+
+
+def _copy_text_field(value) -> str:
+    """A value as a field of text-format COPY: None is \\N (NULL), so it stays distinct from ''"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def upsert_articles(cur, order_id: int, articles: List[tuple]) -> List[Tuple[int, str]]:
+    """
+    Insert or update an Order's prepared articles.
+
+    On Postgres the rows are streamed with COPY into a temporary staging table and
+    merged with one set-based upsert. The embedded backend uses a multi-row insert.
+    Rows sharing a (schedule_number, part_number, article_number) key, e.g. two
+    P1groups without a Pnumber, are written once with the last of them, as one
+    upsert statement cannot affect the same row twice on Postgres.
+    Returns: (article_id, schedule_number, part_number, article_number) for every article written.
+    """
+    by_key = {}
+    for article in articles:
+        key = (article[10], article[13], article[0])
+        if key in by_key:
+            logging.warning(f"Duplicate provision {key} in order {order_id}; keeping the last")
+            del by_key[key]
+        by_key[key] = article
+    articles = list(by_key.values())
+
+    if isinstance(cur, SQLiteCursor):
+        insert_values(cur, f"INSERT INTO articles ({ARTICLE_COLUMNS}) VALUES %s {ARTICLE_UPSERT_ACTION}",
+                      [(order_id,) + article for article in articles])
+        return cur.fetchall()
+
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS article_staging (
+            order_id INTEGER,
+            article_number TEXT,
+            article_title TEXT,
+            article_text TEXT[],
+            title_hash TEXT,
+            title_words TEXT[],
+            word_count INT,
+            first_paragraph TEXT,
+            category TEXT,
+            hash TEXT,
+            provision_kind TEXT,
+            schedule_number TEXT,
+            schedule_name TEXT,
+            schedule_type TEXT,
+            part_number TEXT,
+            part_title TEXT
         )
+    """)
+
+    buffer = io.StringIO()
+    for (article_number, title, text, title_hash, title_words, word_count,
+         first_paragraph, category, hash, *placement) in articles:
+        row = [order_id, article_number, title, _pg_array_literal(text), title_hash,
+               _pg_array_literal(title_words), word_count, first_paragraph, category, hash, *placement]
+        buffer.write('\t'.join(_copy_text_field(value) for value in row) + '\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY article_staging ({ARTICLE_COLUMNS}) FROM STDIN", buffer)
+
+    cur.execute(f"""
+        INSERT INTO articles ({ARTICLE_COLUMNS})
+        SELECT {ARTICLE_COLUMNS} FROM article_staging
+        {ARTICLE_UPSERT_ACTION}
+    """)
+    upserted = cur.fetchall()
+    cur.execute("TRUNCATE article_staging")
+    return upserted
+
+
+def process_file(file_path: str, conn, cur, sink: 'MetricsSink' = None, parse_cache: ParseCache = None,
+                 parser: str = 'legislation', earlier_only: bool = False) -> int:
+    logging.info(f"Processing {file_path}")
+    return process_prepared_order(prepare_order(file_path, parse_cache, parser), conn, cur, sink, earlier_only)
+
+
+# Definitions at least this similar to an existing wording share its variant_id
+DEFINITION_VARIANT_THRESHOLD = 90.0
+
+
+def normalise_definition(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def store_definitions(cur, order_id: int, definitions: List[tuple]) -> None:
+    """
+    Replace an Order's rows in the definitions index and assign their variants.
+
+    definitions holds (article_id, term, definition_text). Each definition joins
+    the variant of an identical wording of the same term in another Order, or of
+    the closest wording at or above DEFINITION_VARIANT_THRESHOLD; otherwise it
+    starts a variant of its own. "Which DCOs define X this way" is then a lookup
+    on variant_id.
+    """
+    cur.execute("DELETE FROM definitions WHERE order_id = %s", (order_id,))
+    if not definitions:
+        return
+
+    rows = []
+    for article_id, term, text in definitions:
+        normalised = normalise_definition(text)
+        rows.append((article_id, order_id, term, term.lower(), text, md5(normalised.encode()).hexdigest()))
+    inserted = insert_values(cur, """
+        INSERT INTO definitions (article_id, order_id, term, term_key, definition_text, definition_hash)
         VALUES %s
-        ON CONFLICT (order_id, article_number) DO UPDATE SET
-            article_title = EXCLUDED.article_title,
-            article_text = EXCLUDED.article_text,
-            title_hash = EXCLUDED.title_hash,
-            title_words = EXCLUDED.title_words,
-            word_count = EXCLUDED.word_count,
-            first_paragraph = EXCLUDED.first_paragraph,
-            category = EXCLUDED.category,
-            hash = EXCLUDED.hash
-        RETURNING article_id, article_text
-    """, article_data)
-    
-    new_articles_raw = cur.fetchall()
-    logging.info(f"Found {len(new_articles_raw)} new articles to process")
+        RETURNING definition_id, term_key, definition_hash, definition_text
+    """, rows, fetch=True)
+
+    # Existing wordings of the same terms in other Orders, one entry per distinct wording
+    term_keys = sorted({row[1] for row in inserted})
+    existing = {}
+    for start in range(0, len(term_keys), 500):
+        chunk = term_keys[start:start + 500]
+        cur.execute(f"""
+            SELECT term_key, definition_hash, definition_text, variant_id
+            FROM definitions
+            WHERE order_id <> %s AND variant_id IS NOT NULL
+              AND term_key IN ({', '.join(['%s'] * len(chunk))})
+            ORDER BY definition_id
+        """, (order_id, *chunk))
+        for term_key, definition_hash, text, variant_id in cur.fetchall():
+            existing.setdefault(term_key, {}).setdefault(definition_hash, (normalise_definition(text), variant_id))
+
+    updates = []
+    for definition_id, term_key, definition_hash, text in inserted:
+        wordings = existing.get(term_key, {})
+        if definition_hash in wordings:
+            updates.append((wordings[definition_hash][1], 100.0, definition_id))
+            continue
+        normalised = normalise_definition(text)
+        best_similarity, best_variant = 0.0, None
+        for other_text, variant_id in wordings.values():
+            similarity = ratio(normalised, other_text) * 100
+            if similarity > best_similarity:
+                best_similarity, best_variant = similarity, variant_id
+        if best_similarity >= DEFINITION_VARIANT_THRESHOLD:
+            updates.append((best_variant, best_similarity, definition_id))
+        else:
+            updates.append((definition_id, 100.0, definition_id))
+    cur.executemany("""
+        UPDATE definitions SET variant_id = %s, variant_similarity = %s WHERE definition_id = %s
+    """, updates)
+    logging.info(f"Indexed {len(updates)} definitions")
+
 
-    if not new_articles_raw:
-        logging.info("No new articles to process")
+def store_references(cur, order_id: int, references: List[tuple]) -> None:
+    """
+    Replace an Order's cross-references and resolve their targets.
+
+    references holds (source_article_id, kind, target_schedule_number,
+    target_part_number, target_article_number, target_subref, ref, link_text).
+    References to a provision of the same Order get its article_id. A schedule
+    paragraph is matched on schedule and paragraph number and, when the reference
+    names one, on its Part: the reference holds the Part's number ('2') and the
+    article its heading ('PART 2'), so the article's part_number is compared
+    without the 'PART' prefix.
+    """
+    cur.execute("DELETE FROM cross_references WHERE order_id = %s", (order_id,))
+    if not references:
         return
 
-    # Convert to Article objects with precomputed values
-    new_articles = []
-    for art_id, paragraphs in new_articles_raw:
-        try:
-            # Get article metadata from database
-            cur.execute("""
-                SELECT article_number, article_title, title_hash, category, word_count, title_words 
-                FROM articles 
-                WHERE article_id = %s
-            """, (art_id,))
-            metadata = cur.fetchone()
-            article_number, article_title, title_hash, category, word_count, title_words = metadata
-            
+    insert_values(cur, """
+        INSERT INTO cross_references (
+            source_article_id, order_id, reference_kind, target_schedule_number,
+            target_part_number, target_article_number, target_subref, ref, link_text
+        )
+        VALUES %s
+    """, [(reference[0], order_id) + tuple(reference[1:]) for reference in references])
+
+    cur.execute("""
+        UPDATE cross_references SET target_article_id = (
+            SELECT MIN(a.article_id)
+            FROM articles a
+            WHERE a.order_id = cross_references.order_id
+              AND a.provision_kind = cross_references.reference_kind
+              AND a.schedule_number = cross_references.target_schedule_number
+              AND a.article_number = cross_references.target_article_number
+              AND (cross_references.target_part_number = ''
+                   OR LOWER(TRIM(REPLACE(UPPER(a.part_number), 'PART', '')))
+                      = LOWER(cross_references.target_part_number))
+        )
+        WHERE order_id = %s AND reference_kind <> 'legislation'
+    """, (order_id,))
+    logging.info(f"Stored {len(references)} cross-references")
+
+
+def process_prepared_order(prepared: PreparedOrder, conn, cur, sink: 'MetricsSink' = None,
+                           earlier_only: bool = False) -> int:
+    """
+    Insert a prepared Order and match its articles against every other Order.
+    With `earlier_only`, as for a backfill, they are matched only against Orders
+    made before it, and any similarities they hold to later Orders are deleted.
+    Returns: The order_id of the inserted Order.
+    """
+    start_time = time.time()
+    logging.info(f"Loaded {len(prepared.articles)} articles from {prepared.file_path}")
+
+    metrics = MatcherMetrics(prepared.order_name)
+    metrics.stage_seconds['xml_parse'] = prepared.parse_seconds
+    round_trips_at_start = getattr(cur, 'round_trips', 0)
+
+    def finish(order_id: int) -> int:
+        """Commit the Order and emit its metrics, on every path out"""
+        with metrics.stage('writes'):
+            conn.commit()
+        metrics.count('sql_round_trips', getattr(cur, 'round_trips', 0) - round_trips_at_start)
+        end_time = time.time()
+        metrics.wall_seconds = end_time - start_time
+        logging.info(f"Completed {log_order_name} in {end_time - start_time:.2f} seconds. A total of {metrics.counters['levenshtein_comparisons']} articles were checked using Levenshtein.")
+        if sink is not None:
+            sink.emit(metrics)
+        return order_id
+
+    # Process order
+    order_data = [(
+        prepared.order_name,
+        prepared.order_year,
+        prepared.order_si_number
+    )]
+    log_order_name = prepared.order_name
+
+    with metrics.stage('order_upsert'):
+        insert_values(cur, """
+            INSERT INTO orders (
+                order_name, order_year, order_SI_number
+            )
+            VALUES %s
+            ON CONFLICT (order_name) DO UPDATE SET 
+                order_year = EXCLUDED.order_year,
+                order_SI_number = EXCLUDED.order_SI_number
+            RETURNING order_id
+        """, order_data)
+
+        result = cur.fetchone()
+        order_id = result[0] if result else None
+
+        if not order_id:
+            cur.execute("SELECT order_id FROM orders WHERE order_name = %s", (prepared.order_name,))
+            order_id = cur.fetchone()[0]
+
+    with metrics.stage('article_upsert'):
+        upserted = upsert_articles(cur, order_id, prepared.articles)
+        logging.info(f"Found {len(upserted)} new articles to process")
+
+        article_ids = {(schedule_number, part_number, article_number): art_id
+                       for art_id, schedule_number, part_number, article_number in upserted}
+        store_definitions(cur, order_id, [
+            (article_ids[(schedule_number, part_number, article_number)], term, text)
+            for schedule_number, part_number, article_number, term, text in prepared.definitions
+            if (schedule_number, part_number, article_number) in article_ids
+        ])
+        store_references(cur, order_id, [
+            (article_ids[(schedule_number, part_number, article_number)],) + tuple(reference)
+            for schedule_number, part_number, article_number, *reference in prepared.references
+            if (schedule_number, part_number, article_number) in article_ids
+        ])
+
+        if not upserted:
+            logging.info("No new articles to process")
+            return finish(order_id)
+
+        # Build Article objects from the prepared rows rather than reading them back
+        prepared_by_key = {(article[10], article[13], article[0]): article for article in prepared.articles}
+        definitions_by_key = {}
+        for schedule_number, part_number, article_number, term, text in prepared.definitions:
+            definitions_by_key.setdefault((schedule_number, part_number, article_number), []).append((term, text))
+        new_articles = []
+        for art_id, schedule_number, part_number, article_number in upserted:
+            (_, title, paragraphs, title_hash, title_words, word_count, first_paragraph, category, hash,
+             provision_kind, _, _, schedule_type, _, _) = prepared_by_key[(schedule_number, part_number, article_number)]
             joined_text = ' '.join(paragraphs)
-            
             new_articles.append(Article(
                 id=art_id,
                 paragraphs=paragraphs,
                 order_id=order_id,
-                hash=calculate_hash(paragraphs),
+                hash=hash,
                 joined_text=joined_text,
                 length=len(joined_text),
                 signature=get_text_signature(joined_text),
                 article_number=article_number,
+                article_title=title,
                 title_hash=title_hash,
                 category=category,
                 word_count=word_count,
-                first_paragraph=paragraphs[0] if paragraphs else '',
-                title_words=title_words
+                first_paragraph=first_paragraph,
+                title_words=title_words,
+                provision_kind=provision_kind,
+                schedule_type=schedule_type,
+                definitions=(scoring_definitions(definitions_by_key.get((schedule_number, part_number, article_number), []))
+                             if category == 'Interpretation' else None)
             ))
-        except Exception as e:
-            logging.error(f"Error processing article {art_id}: {str(e)}")
-            continue
 
     if not new_articles:
         logging.warning("No articles to process after filtering")
-        return
+        return finish(order_id)
+
+    # Match every new article against each target Order as that Order's rows arrive
+    best_matches_by_article = {new_art.id: {} for new_art in new_articles}  # value: {target_order_id: (similarity, target_id, reordered)}
+    candidates_by_article = {new_art.id: 0 for new_art in new_articles}
+    corpus = stream_target_orders(conn, cur, order_id,
+                                  with_definitions=any(new_art.definitions for new_art in new_articles),
+                                  earlier_only=earlier_only)
+    while True:
+        with metrics.stage('corpus_load'):
+            batch = next(corpus, None)
+        if batch is None:
+            break
+        target_order_id, order_articles = batch
+        metrics.count('target_orders')
+
+        articles_by_partition = {}
+        for article in order_articles:
+            articles_by_partition.setdefault(article.partition, []).append(article)
+
+        for new_art in new_articles:
+            with metrics.stage('candidate_generation'):
+                scored_candidates = rank_candidates(new_art, articles_by_partition.get(new_art.partition, []))
+            candidates_by_article[new_art.id] += len(scored_candidates)
+            metrics.count('pruned_pairs', len(order_articles) - len(scored_candidates))
 
-    # Get target articles with all needed fields
-    cur.execute("""
-        SELECT 
-            a.article_id, 
-            a.article_text, 
-            a.order_id, 
-            char_length(concat_ws(' ', a.article_text)),
-            a.title_hash,
-            a.category,
-            a.word_count,
-            a.title_words,
-            o.order_name
-        FROM articles a 
-        JOIN orders o ON a.order_id = o.order_id 
-        WHERE o.order_id != %s
-        ORDER BY o.order_id
-    """, (order_id,))
-    target_articles_raw = cur.fetchall()
+            # Process candidates in order of likelihood
+            with metrics.stage('scoring'):
+                match = best_candidate_match(new_art, scored_candidates, metrics)
+            if match:
+                best_matches_by_article[new_art.id][target_order_id] = match
+
+    metrics.count('articles', len(new_articles))
+    metrics.count('paragraphs', sum(len(article.paragraphs) for article in new_articles))
+
+    previous_target_ids = set()
+    if not isinstance(cur, SQLiteCursor):
+        # Targets that lose a successor when a re-ingested article's best match moves
+        with metrics.stage('writes'):
+            cur.execute("SELECT DISTINCT target_article_id FROM similarities WHERE source_article_id = ANY(%s)",
+                        ([new_art.id for new_art in new_articles],))
+            previous_target_ids = {row[0] for row in cur.fetchall()}
+            if earlier_only:
+                # Matches against later Orders, from an earlier ingest out of chronological order
+                cur.execute("""
+                    DELETE FROM similarities s
+                    USING orders later, orders own
+                    WHERE s.source_article_id = ANY(%s)
+                    AND later.order_id = s.target_order_id
+                    AND own.order_id = %s
+                    AND (later.order_year, later.order_SI_number) > (own.order_year, own.order_SI_number)
+                """, ([new_art.id for new_art in new_articles], order_id))
+
+    matched_target_ids = set()
+    for new_art in new_articles:
+        best_matches = best_matches_by_article[new_art.id]
+        metrics.record_candidates(candidates_by_article[new_art.id])
 
-    # Group target articles by order_id
-    target_articles_by_order = {}
-    for t_order_id, group in groupby(target_articles_raw, key=lambda x: x[2]):
-        target_articles_by_order[t_order_id] = [
-            Article(
-                id=art_id,
-                paragraphs=text,
-                order_id=o_id,
-                hash=calculate_hash(text),
-                joined_text=' '.join(text),
-                length=precomputed_length,
-                signature=get_text_signature(' '.join(text)),
-                title_hash=t_hash,
-                category=cat,
-                word_count=w_count,
-                first_paragraph=text[0] if text else '',
-                title_words=t_words
+        with metrics.stage('writes'):
+            # Update article novelty status
+            cur.execute("""
+                UPDATE articles 
+                SET novel = %s 
+                WHERE article_id = %s
+            """, (not best_matches, new_art.id))
+
+            store_similarities(cur, new_art, best_matches)
+        matched_target_ids.update(target_id for _, target_id, _ in best_matches.values())
+
+    with metrics.stage('writes'):
+        if not isinstance(cur, SQLiteCursor):
+            # The lineage graph and precedent panel read model are Postgres only
+            update_precedent_graph(cur, [new_art.id for new_art in new_articles])
+            refresh_article_precedents(cur, [new_art.id for new_art in new_articles]
+                                       + list(matched_target_ids | previous_target_ids))
+
+    return finish(order_id)
+
+
+_PIPELINE_DONE = object()
+
+
+def _parse_stage(file_paths: List[str], parsed_queue: queue.Queue, stop: threading.Event, workers: int,
+                 parse_cache: ParseCache = None, parser: str = 'legislation') -> None:
+    """
+    Background stage of the pipeline: parse and normalise upcoming files.
+
+    Files are parsed in a process pool with at most `workers` parses in flight, and
+    handed over in their original order. The queue is bounded, so parsing stalls
+    when matching falls behind rather than piling parsed Orders up in memory.
+    """
+    def hand_over(item) -> bool:
+        while not stop.is_set():
+            try:
+                parsed_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            remaining = iter(file_paths)
+            in_flight = deque(
+                (path, executor.submit(prepare_order, path, parse_cache, parser))
+                for path in islice(remaining, workers)
             )
-            for art_id, text, o_id, precomputed_length, t_hash, cat, w_count, t_words, _ in group
+            while in_flight:
+                path, future = in_flight.popleft()
+                try:
+                    item = future.result()
+                except Exception as e:
+                    item = e
+                if not hand_over((path, item)):
+                    for _, pending in in_flight:
+                        pending.cancel()
+                    return
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    in_flight.append((next_path, executor.submit(prepare_order, next_path, parse_cache, parser)))
+    except Exception as e:
+        hand_over((None, e))
+    finally:
+        hand_over(_PIPELINE_DONE)
+
+
+def run_pipeline(file_paths: List[str], conn, cur, prefetch: int = 2, workers: int = 1,
+                 sink: MetricsSink = None, parse_cache: ParseCache = None, parser: str = 'legislation') -> None:
+    """
+    Process files with parsing overlapped with matching.
+
+    Upcoming files are parsed and normalised in the background while the current
+    Order is inserted and matched. Matching still happens strictly in the order of
+    `file_paths`, so every Order is compared against all of the Orders before it.
+    """
+    parsed_queue = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    parser_thread = threading.Thread(
+        target=_parse_stage,
+        args=(file_paths, parsed_queue, stop, max(1, workers), parse_cache, parser),
+        name="parse-stage",
+        daemon=True
+    )
+    parser_thread.start()
+
+    try:
+        while True:
+            item = parsed_queue.get()
+            if item is _PIPELINE_DONE:
+                break
+            file_path, prepared = item
+            if isinstance(prepared, Exception):
+                logging.error(f"Failed to parse {file_path}: {str(prepared)}")
+                raise prepared
+            logging.info(f"Processing {file_path}")
+            process_prepared_order(prepared, conn, cur, sink)
+    finally:
+        stop.set()
+        parser_thread.join()
+
+
+def shard_target_orders(cur, shard_index: int, shard_count: int) -> List[int]:
+    """Target order_ids assigned to one shard of a re-baseline"""
+    cur.execute("""
+        SELECT order_id FROM orders
+        WHERE order_id %% %s = %s
+        ORDER BY order_id
+    """, (shard_count, shard_index))
+    return [row[0] for row in cur.fetchall()]
+
+
+def run_shard(conn, cur, target_order_ids: List[int], output_path: str) -> int:
+    """
+    Match every article against the given target orders and write the best
+    match per (source article, target order) to a local result file.
+
+    An article is only matched against target orders that come before its own
+    Order (by year, then SI number), mirroring a chronological ingest. Only the
+    target orders' articles are held in memory; the source articles are streamed
+    one Order at a time with stream_orders, so a shard's memory does not grow with
+    the corpus. The file is tab-separated in the column order of the similarities
+    table, ready to be loaded by merge_shard_results. Each target order also gets a
+    row with only its target_order_id, recording that the shard covered it even if
+    nothing matched.
+    Returns: Number of matches written.
+    """
+    cur.execute("SELECT order_id, order_year, order_SI_number FROM orders")
+    chronology = {order_id: (year, si_number) for order_id, year, si_number in cur.fetchall()}
+
+    target_order_ids = [order_id for order_id in target_order_ids if order_id in chronology]
+    targets = []
+    if target_order_ids:
+        articles_by_order = {}
+        for article in fetch_articles(cur, f"""
+            SELECT article_id, article_text, order_id, title_hash, category, word_count, title_words, hash,
+                provision_kind, schedule_type
+            FROM articles
+            WHERE order_id IN ({', '.join(['%s'] * len(target_order_ids))})
+            ORDER BY order_id, article_id
+        """, tuple(target_order_ids)):
+            articles_by_order.setdefault(article.order_id, []).append(article)
+        targets = sorted(((chronology[order_id], order_id, articles)
+                          for order_id, articles in articles_by_order.items()), key=lambda target: target[0])
+
+    written = 0
+    partial_path = output_path + '.partial'
+    with open(partial_path, 'w', encoding='utf-8') as f:
+        for target_order_id in target_order_ids:
+            f.write(f"\\N\t\\N\t{target_order_id}\t\\N\t\\N\n")
+
+        if targets:
+            # Sources in chronological order, from the first Order made after the earliest target
+            sources = stream_orders(conn, cur, """
+                SELECT a.article_id, a.article_text, a.order_id, a.title_hash, a.category, a.word_count,
+                    a.title_words, a.hash, a.provision_kind, a.schedule_type
+                FROM articles a
+                JOIN orders o ON a.order_id = o.order_id
+                WHERE (o.order_year, o.order_SI_number) > (%s, %s)
+                ORDER BY o.order_year, o.order_SI_number, a.order_id, a.article_id
+            """, targets[0][0], "shard_sources")
+            for source_order_id, source_articles in sources:
+                start_time = time.time()
+                for chronology_key, target_order_id, target_articles in targets:
+                    if chronology_key >= chronology[source_order_id]:
+                        break
+                    for source_art in source_articles:
+                        match = best_candidate_match(source_art, rank_candidates(source_art, target_articles))
+                        if not match:
+                            continue
+                        similarity, target_id, reordered = match
+                        f.write(f"{source_art.id}\t{target_id}\t{target_order_id}\t{similarity!r}\t{'t' if reordered else 'f'}\n")
+                        written += 1
+
+                logging.info(f"Shard matched source order {source_order_id} in {time.time() - start_time:.2f} seconds")
+
+    # Only publish complete files, so a merge never loads a half-written shard
+    os.replace(partial_path, output_path)
+    logging.info(f"Wrote {written} matches to {output_path}")
+    return written
+
+
+def merge_shard_results(conn, cur, result_paths: List[str]) -> None:
+    """
+    Bulk-load shard result files into similarities.
+
+    Files are copied into a staging table and merged with one set-based upsert.
+    A re-baseline replaces the similarities of every target order the files
+    cover: rows for a (source article, target order) pair the shards no longer
+    matched are deleted. Title patterns are updated from the merged rows, and
+    novelty is recomputed from the similarities table, since a re-baseline covers
+    every article.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE shard_results (
+            source_article_id INTEGER,
+            target_article_id INTEGER,
+            target_order_id INTEGER,
+            similarity_score FLOAT,
+            reordered BOOLEAN
+        ) ON COMMIT DROP
+    """)
+    for path in result_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            cur.copy_expert("COPY shard_results FROM STDIN", f)
+        logging.info(f"Staged {path}")
+
+    # A target order listed in more than one shard keeps its best result
+    cur.execute("""
+        CREATE TEMP TABLE merged_results ON COMMIT DROP AS
+        SELECT DISTINCT ON (source_article_id, target_order_id) *
+        FROM shard_results
+        WHERE source_article_id IS NOT NULL
+        ORDER BY source_article_id, target_order_id, similarity_score DESC
+    """)
+
+    # Best matches from before the re-baseline that no shard found again
+    cur.execute("""
+        DELETE FROM similarities s
+        USING (SELECT DISTINCT target_order_id FROM shard_results) covered
+        WHERE s.target_order_id = covered.target_order_id
+        AND NOT EXISTS (
+            SELECT 1 FROM merged_results m
+            WHERE m.source_article_id = s.source_article_id
+            AND m.target_order_id = s.target_order_id
+        )
+    """)
+    logging.info(f"Deleted {cur.rowcount} similarities no longer matched")
+
+    cur.execute(f"""
+        INSERT INTO similarities (
+            source_article_id,
+            target_article_id,
+            target_order_id,
+            similarity_score,
+            reordered
+        )
+        SELECT source_article_id, target_article_id, target_order_id, similarity_score, reordered
+        FROM merged_results
+        ON CONFLICT (source_article_id, target_order_id)
+        DO UPDATE SET
+            target_article_id = EXCLUDED.target_article_id,
+            similarity_score = EXCLUDED.similarity_score,
+            reordered = EXCLUDED.reordered,
+            updated_at = EXCLUDED.updated_at
+        {SIMILARITY_CHANGED}
+    """)
+    logging.info(f"Merged {cur.rowcount} new or changed similarities")
+
+    cur.execute("""
+        INSERT INTO title_patterns (source_hash, target_hash, frequency, avg_content_similarity)
+        SELECT sa.title_hash, ta.title_hash, COUNT(*), AVG(m.similarity_score)
+        FROM merged_results m
+        JOIN articles sa ON sa.article_id = m.source_article_id
+        JOIN articles ta ON ta.article_id = m.target_article_id
+        GROUP BY sa.title_hash, ta.title_hash
+        ON CONFLICT (source_hash, target_hash)
+        DO UPDATE SET
+            frequency = title_patterns.frequency + EXCLUDED.frequency,
+            avg_content_similarity =
+                (title_patterns.avg_content_similarity * title_patterns.frequency
+                 + EXCLUDED.avg_content_similarity * EXCLUDED.frequency)
+                / (title_patterns.frequency + EXCLUDED.frequency)
+    """)
+
+    cur.execute("""
+        UPDATE articles a
+        SET novel = NOT EXISTS (
+            SELECT 1 FROM similarities s WHERE s.source_article_id = a.article_id
+        )
+    """)
+    rebuild_precedent_graph(cur)
+    cur.execute("SELECT article_id FROM articles")
+    refresh_article_precedents(cur, [row[0] for row in cur.fetchall()])
+    conn.commit()
+
+
+def _run_shard_process(shard_index: int, shard_count: int, output_path: str) -> int:
+    conn = connect_database()
+    cur = conn.cursor()
+    try:
+        target_order_ids = shard_target_orders(cur, shard_index, shard_count)
+        logging.info(f"Shard {shard_index}/{shard_count}: {len(target_order_ids)} target orders")
+        return run_shard(conn, cur, target_order_ids, output_path)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def run_local_shards(shard_count: int, output_dir: str) -> List[str]:
+    """Run every shard as a local process standing in for a worker node"""
+    os.makedirs(output_dir, exist_ok=True)
+    result_paths = [
+        os.path.join(output_dir, f"shard_{shard_index}_of_{shard_count}.tsv")
+        for shard_index in range(shard_count)
+    ]
+    with ProcessPoolExecutor(max_workers=shard_count) as executor:
+        futures = [
+            executor.submit(_run_shard_process, shard_index, shard_count, path)
+            for shard_index, path in enumerate(result_paths)
         ]
-        # logging.debug(f"Number of target articles: {sum(len(articles) for articles in target_articles_by_order.values())}")
+        for future in as_completed(futures):
+            future.result()
+    return result_paths
 
-    total_paragraphs = sum(len(article.paragraphs) for article in new_articles)
 
-    # Process similarities using new comparison logic
-    for new_art in new_articles:
-        best_matches = {}  # key: target_order_id, value: (similarity, target_id, reordered)
+def backfill_order(conn, cur, order_id: int) -> int:
+    """
+    Match later Orders' articles against an Order that was ingested out of
+    chronological order.
 
-        for target_order_id, order_articles in target_articles_by_order.items():
-            scored_candidates = find_candidate_articles(cur, new_art, target_order_id)
-            
-            # Process candidates in order of likelihood
-            for score, candidate in scored_candidates:
-                # Skip if we already found a very high similarity match for this order
-                if target_order_id in best_matches and best_matches[target_order_id][0] >= 95:
-                    continue
-                    
-                # Calculate actual similarity
-                similarity, reordered = compare_articles(new_art.paragraphs, candidate.paragraphs)
-                
-                # Update best match if better
-                if similarity > (best_matches.get(target_order_id, (0, None, None))[0]):
-                    best_matches[target_order_id] = (similarity, candidate.id, reordered)
-                    
-                # Early termination if we found a very good match
-                if similarity >= 95:
-                    # logging.info(f"High similarity match found: {similarity:.2f}% - Article {new_art.id} - Order ID {target_order_id}, Article {candidate.id}")
-                    break  # Stop processing candidates for this order
-            
+    Only later articles that the candidate index can pair with one of the
+    Order's articles are loaded and rescored, so nothing else is re-run.
+    Returns: Number of similarities written.
+    """
+    start_time = time.time()
+    cur.execute("SELECT order_year, order_SI_number FROM orders WHERE order_id = %s", (order_id,))
+    order_year, order_si_number = cur.fetchone()
 
-            # best_candidate = None
-            # best_similarity = 0
-            # is_reordered = False
-
-            # # logging.debug(f"Source paragraphs: {new_art.paragraphs[:2]}")
-            # for candidate in candidates:
-            #     # logging.debug(f"Candidate paragraphs: {candidate.paragraphs[:2]}")
-            # # for candidate in candidates:
-            #     similarity, reordered = compare_articles(new_art.paragraphs, candidate.paragraphs)
-            #     # logging.info(f"Raw similarity score: {similarity}")
-            #     if similarity > best_similarity:
-            #         best_similarity = similarity
-            #         best_candidate = candidate
-            #         is_reordered = reordered
-            #     # logging.info(f"Current best similarity: {best_similarity}")
-            #     if best_similarity > 50:
-            #         best_matches[target_order_id] = (best_similarity, best_candidate.id, is_reordered)
-        # Update article novelty status
-        cur.execute("""
-            UPDATE articles 
-            SET novel = %s 
-            WHERE article_id = %s
-        """, (not best_matches, new_art.id))
-
-        # Convert best_matches to similarity data for database insertion
-        if best_matches:
-            similarity_data = []
-            for target_order_id, (similarity, target_id, reordered) in best_matches.items():
-                similarity_data.append((
-                    new_art.id,
-                    target_id,
-                    target_order_id,
-                    similarity,
-                    reordered
-                ))
-                
-                # Get target article hash
-                cur.execute("SELECT title_hash FROM articles WHERE article_id = %s", (target_id,))
-                target_hash = cur.fetchone()[0]
-                
-                # Update title patterns
-                cur.execute("""
-                    INSERT INTO title_patterns (source_hash, target_hash, frequency, avg_content_similarity)
-                    VALUES (%s, %s, 1, %s)
-                    ON CONFLICT (source_hash, target_hash) 
-                    DO UPDATE SET 
-                        frequency = title_patterns.frequency + 1,
-                        avg_content_similarity = 
-                            (title_patterns.avg_content_similarity * title_patterns.frequency + %s) 
-                            / (title_patterns.frequency + 1)
-                """, (new_art.title_hash, target_hash, similarity, similarity))
-
-            # Insert similarities with reordering flag
-            execute_values(cur, """
-                INSERT INTO similarities (
-                    source_article_id, 
-                    target_article_id, 
-                    target_order_id, 
-                    similarity_score,
-                    reordered
-                )
-                VALUES %s
-                ON CONFLICT (source_article_id, target_order_id) 
-                DO UPDATE SET 
-                    target_article_id = EXCLUDED.target_article_id,
-                    similarity_score = EXCLUDED.similarity_score,
-                    reordered = EXCLUDED.reordered
-            """, similarity_data)
+    order_articles = fetch_articles(cur, """
+        SELECT article_id, article_text, order_id, title_hash, category, word_count, title_words, hash,
+            provision_kind, schedule_type
+        FROM articles
+        WHERE order_id = %s
+    """, (order_id,))
+
+    # Later articles that could have had one of this Order's articles as a candidate:
+    # within the same partition, an identical hash, or the same category within the widest word count range
+    # (get_word_count_range never goes beyond half or double). The exact range is
+    # applied by rank_candidates.
+    affected_articles = fetch_articles(cur, """
+        SELECT a.article_id, a.article_text, a.order_id, a.title_hash, a.category, a.word_count, a.title_words, a.hash,
+            a.provision_kind, a.schedule_type
+        FROM articles a
+        JOIN orders o ON a.order_id = o.order_id
+        WHERE (o.order_year, o.order_SI_number) > (%s, %s)
+        AND a.article_id IN (
+            SELECT later.article_id
+            FROM articles x
+            JOIN articles later
+                ON later.hash = x.hash
+                AND later.provision_kind = x.provision_kind
+                AND later.schedule_type IS NOT DISTINCT FROM x.schedule_type
+            WHERE x.order_id = %s
+            UNION
+            SELECT later.article_id
+            FROM articles x
+            JOIN articles later
+                ON later.provision_kind = x.provision_kind
+                AND later.schedule_type IS NOT DISTINCT FROM x.schedule_type
+                AND later.category = x.category
+                AND later.word_count BETWEEN x.word_count / 2.0 AND x.word_count * 2.0
+            WHERE x.order_id = %s
+        )
+    """, (order_year, order_si_number, order_id, order_id))
+    logging.info(f"Backfill of order {order_id}: {len(affected_articles)} later articles to rescore")
+
+    matched_ids = []
+    for later_art in affected_articles:
+        match = best_candidate_match(later_art, rank_candidates(later_art, order_articles))
+        if match:
+            store_similarities(cur, later_art, {order_id: match})
+            matched_ids.append(later_art.id)
+
+    if matched_ids:
+        cur.execute("""
+            UPDATE articles
+            SET novel = FALSE
+            WHERE article_id = ANY(%s)
+        """, (matched_ids,))
+        update_precedent_graph(cur, matched_ids)
+        refresh_article_precedents(cur, matched_ids + [art.id for art in order_articles])
 
     conn.commit()
-    end_time = time.time()
-    logging.info(f"Completed {log_order_name} in {end_time - start_time:.2f} seconds. A total of {levcount} articles were checked using Levenshtein.")
-    # logging.info(f"Completed in {end_time - start_time:.2f} seconds")    
-    
+    logging.info(f"Backfilled {len(matched_ids)} similarities for order {order_id} in {time.time() - start_time:.2f} seconds")
+    return len(matched_ids)
+
+
+# Columns of the analyst export and their Parquet types
+EXPORT_COLUMNS = [
+    ('similarity_id', 'int64'),
+    ('order_year', 'int32'),
+    ('source_order_name', 'string'),
+    ('source_order_si_number', 'int32'),
+    ('source_article_id', 'int64'),
+    ('source_provision_kind', 'string'),
+    ('source_schedule_number', 'string'),
+    ('source_article_number', 'string'),
+    ('source_article_title', 'string'),
+    ('source_category', 'string'),
+    ('target_order_name', 'string'),
+    ('target_order_year', 'int32'),
+    ('target_order_si_number', 'int32'),
+    ('target_article_id', 'int64'),
+    ('target_provision_kind', 'string'),
+    ('target_schedule_number', 'string'),
+    ('target_article_number', 'string'),
+    ('target_article_title', 'string'),
+    ('target_category', 'string'),
+    ('similarity_score', 'float64'),
+    ('reordered', 'bool'),
+    ('updated_at', 'timestamp[us]')
+]
+
+# Tombstones written by an incremental export for similarities deleted since the last one
+DELETION_EXPORT_COLUMNS = [
+    ('similarity_id', 'int64'),
+    ('source_article_id', 'int64'),
+    ('target_article_id', 'int64'),
+    ('target_order_id', 'int64'),
+    ('deleted_at', 'timestamp[us]')
+]
+
+
+def _csv_to_parquet(csv_path: str, parquet_path: str, columns: List[tuple] = EXPORT_COLUMNS) -> None:
+    """Convert an export CSV to Parquet in streamed record batches"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+    reader = pa_csv.open_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=schema,
+            true_values=['t', 'true', '1'],
+            false_values=['f', 'false', '0'],
+            strings_can_be_null=True
+        )
+    )
+    with pq.ParquetWriter(parquet_path, schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def export_similarities(cur, output_dir: str, export_format: str = 'csv', incremental: bool = False,
+                        watermark_path: str = None) -> List[str]:
+    """
+    Export similarities joined to their source and target articles and Orders,
+    as one file per source order year under output_dir/order_year=YYYY/.
+
+    Postgres streams each partition straight to disk with COPY ... TO STDOUT, so
+    memory use does not grow with the table; Parquet files are converted from
+    that CSV in record batches. With `incremental`, only rows changed since the
+    watermark left by the previous export are written, and each export's rows are
+    bounded above by its own watermark, which follows commit order: a row written by
+    a transaction that commits after the export is picked up by the next one.
+
+    On Postgres the watermark is the xmin of the export's snapshot and rows are
+    selected by change_xid, the transaction that last changed them: every transaction
+    below xmin has finished, and those still running are at or above it. SQLite has
+    one writer at a time, so the newest committed updated_at is already such a bound.
+
+    Rows deleted since the previous export (a re-baseline merge dropping matches no
+    shard found again, a backfill dropping matches to later Orders) are written as
+    tombstones to output_dir/deletions/, selected from similarity_deletions by the
+    same change_xid window. Only Postgres deletes similarities.
+    Returns: Paths of the files written.
+    """
+    embedded = isinstance(cur, SQLiteCursor)
+    watermark_path = watermark_path or os.path.join(output_dir, 'export_watermark.json')
+    # updated_at as UTC text
+    if embedded:
+        updated_at_text = "s.updated_at"
+        watermark_key, change_column, change_param = 'updated_at', "s.updated_at", "%s"
+        since_op, until_op = '>', '<='
+        cur.execute("SELECT MAX(updated_at) FROM similarities")
+    else:
+        updated_at_text = "to_char(s.updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')"
+        watermark_key, change_column, change_param = 'change_xid', "s.change_xid", "%s::xid8"
+        since_op, until_op = '>=', '<'
+        cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+    row = cur.fetchone()
+    until = row[0] if row else None
+
+    watermark = {}
+    if incremental and os.path.exists(watermark_path):
+        with open(watermark_path, 'r', encoding='utf-8') as f:
+            watermark = json.load(f)
+    since = watermark.get(watermark_key)
+    if until is None or until == since:
+        logging.info("No similarities changed since the last export")
+        return []
+
+    conditions = [f"{change_column} {until_op} {change_param}"]
+    params = [until]
+    if since is not None:
+        conditions.append(f"{change_column} {since_op} {change_param}")
+        params.append(since)
+    elif not embedded and 'updated_at' in watermark:
+        # A watermark written before change_xid was recorded
+        conditions.append("s.updated_at > (%s::timestamp AT TIME ZONE 'UTC')")
+        params.append(watermark['updated_at'])
+    where = ' AND '.join(conditions)
+
+    deletion_where = None
+    if not embedded and since is not None:
+        deletion_where = "d.change_xid < %s::xid8 AND d.change_xid >= %s::xid8"
+    elif not embedded and 'updated_at' in watermark:
+        deletion_where = "d.change_xid < %s::xid8 AND d.deleted_at > (%s::timestamp AT TIME ZONE 'UTC')"
+    deletions = 0
+    if deletion_where:
+        cur.execute(f"SELECT COUNT(*) FROM similarity_deletions d WHERE {deletion_where}", tuple(params))
+        deletions = cur.fetchone()[0]
+
+    joins = """
+        FROM similarities s
+        JOIN articles sa ON sa.article_id = s.source_article_id
+        JOIN orders so ON so.order_id = sa.order_id
+        JOIN articles ta ON ta.article_id = s.target_article_id
+        JOIN orders t ON t.order_id = ta.order_id
+    """
+
+    cur.execute(f"SELECT DISTINCT so.order_year {joins} WHERE {where} ORDER BY so.order_year", tuple(params))
+    years = [year for (year,) in cur.fetchall()]
+    if not years and not deletions:
+        logging.info("No similarities changed since the last export")
+        return []
+
+    run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    written = []
+    if deletions:
+        deletions_dir = os.path.join(output_dir, 'deletions')
+        os.makedirs(deletions_dir, exist_ok=True)
+        csv_path = os.path.join(deletions_dir, f"similarity-deletions-{run_id}.csv")
+        query = cur.mogrify(f"""
+            SELECT
+                d.similarity_id,
+                d.source_article_id,
+                d.target_article_id,
+                d.target_order_id,
+                to_char(d.deleted_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US') AS deleted_at
+            FROM similarity_deletions d
+            WHERE {deletion_where}
+            ORDER BY d.change_xid, d.similarity_id
+        """, tuple(params)).decode()
+        with open(csv_path + '.partial', 'w', encoding='utf-8', newline='') as f:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        if export_format == 'parquet':
+            parquet_path = os.path.join(deletions_dir, f"similarity-deletions-{run_id}.parquet")
+            _csv_to_parquet(csv_path + '.partial', parquet_path + '.partial', DELETION_EXPORT_COLUMNS)
+            os.remove(csv_path + '.partial')
+            os.replace(parquet_path + '.partial', parquet_path)
+            written.append(parquet_path)
+        else:
+            os.replace(csv_path + '.partial', csv_path)
+            written.append(csv_path)
+        logging.info(f"Exported {deletions} deleted similarities to {written[-1]}")
+
+    for year in years:
+        query = f"""
+            SELECT
+                s.id AS similarity_id,
+                so.order_year AS order_year,
+                so.order_name AS source_order_name,
+                so.order_SI_number AS source_order_si_number,
+                sa.article_id AS source_article_id,
+                sa.provision_kind AS source_provision_kind,
+                NULLIF(sa.schedule_number, '') AS source_schedule_number,
+                sa.article_number AS source_article_number,
+                sa.article_title AS source_article_title,
+                sa.category AS source_category,
+                t.order_name AS target_order_name,
+                t.order_year AS target_order_year,
+                t.order_SI_number AS target_order_si_number,
+                ta.article_id AS target_article_id,
+                ta.provision_kind AS target_provision_kind,
+                NULLIF(ta.schedule_number, '') AS target_schedule_number,
+                ta.article_number AS target_article_number,
+                ta.article_title AS target_article_title,
+                ta.category AS target_category,
+                s.similarity_score AS similarity_score,
+                s.reordered AS reordered,
+                {updated_at_text} AS updated_at
+            {joins}
+            WHERE so.order_year = %s AND {where}
+            ORDER BY s.id
+        """
+        partition_dir = os.path.join(output_dir, f"order_year={year}")
+        os.makedirs(partition_dir, exist_ok=True)
+        csv_path = os.path.join(partition_dir, f"similarities-{run_id}.csv")
+
+        with open(csv_path + '.partial', 'w', encoding='utf-8', newline='') as f:
+            if embedded:
+                cur.execute(query, (year,) + tuple(params))
+                writer = csv.writer(f)
+                writer.writerow([name for name, _ in EXPORT_COLUMNS])
+                while True:
+                    rows = cur.fetchmany(CORPUS_BATCH_SIZE)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+            else:
+                copy_query = cur.mogrify(query, (year,) + tuple(params)).decode()
+                cur.copy_expert(f"COPY ({copy_query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+
+        if export_format == 'parquet':
+            parquet_path = os.path.join(partition_dir, f"similarities-{run_id}.parquet")
+            _csv_to_parquet(csv_path + '.partial', parquet_path + '.partial')
+            os.remove(csv_path + '.partial')
+            os.replace(parquet_path + '.partial', parquet_path)
+            written.append(parquet_path)
+        else:
+            os.replace(csv_path + '.partial', csv_path)
+            written.append(csv_path)
+        logging.info(f"Exported order year {year} to {written[-1]}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(watermark_path)), exist_ok=True)
+    with open(watermark_path + '.partial', 'w', encoding='utf-8') as f:
+        json.dump({watermark_key: until, 'exported_at': run_id}, f)
+    os.replace(watermark_path + '.partial', watermark_path)
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Match DCO articles against previously loaded Orders")
+    parser.add_argument('--directory', default='newfolderomg',
+                        help="Directory of legislation.gov.uk XML files named YEAR_NUMBER.xml")
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help="Number of parsed Orders to hold ready ahead of matching")
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help="Number of processes parsing upcoming files")
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help="Parse, insert and match each file in turn")
+    parser.add_argument('--parser', choices=PARSERS, default='legislation',
+                        help="Stream LegislationXMLParser's provision records, schedules included, straight "
+                             "into the article insert, or read Orders with the legacy XMLDataExtractor")
+    parser.add_argument('--parse-cache', default='parse_cache', metavar='CACHE_DIR',
+                        help="Reuse parses of unchanged XML files from this directory")
+    parser.add_argument('--parse-cache-max-mb', type=int, default=1024,
+                        help="Evict the least recently used cached parses beyond this size")
+    parser.add_argument('--no-parse-cache', action='store_true',
+                        help="Parse every file, without reading or filling the parse cache")
+    parser.add_argument('--metrics-jsonl',
+                        help="Append per-Order stage timings and counters to this JSON lines file")
+    parser.add_argument('--metrics-prom',
+                        help="Write the latest metrics to this Prometheus textfile")
+    parser.add_argument('--sqlite', metavar='DB_FILE',
+                        help="Use an embedded SQLite database file instead of the Postgres server")
+
+    shard = parser.add_argument_group("sharded re-baseline")
+    shard.add_argument('--shard-index', type=int,
+                       help="Run as a worker node for this shard, matching against its target orders")
+    shard.add_argument('--shard-count', type=int,
+                       help="Total number of shards; target orders are split by order_id modulo this")
+    shard.add_argument('--target-orders', type=lambda value: [int(v) for v in value.split(',')],
+                       help="Comma-separated target order_ids for this worker, instead of --shard-index")
+    shard.add_argument('--shard-output', default='shard_results.tsv',
+                       help="Result file written by a shard worker")
+    shard.add_argument('--local-shards', type=int,
+                       help="Run this many shards as local processes, then merge their results")
+    shard.add_argument('--shard-dir', default='shards',
+                       help="Directory for result files written by --local-shards")
+    shard.add_argument('--merge', nargs='+', metavar='RESULT_FILE',
+                       help="Bulk-load shard result files into similarities")
+
+    parser.add_argument('--backfill', nargs='+', metavar='XML_FILE',
+                        help="Ingest Orders added out of chronological order, then match later Orders against them")
+    parser.add_argument('--rebuild-graph', action='store_true',
+                        help="Rebuild the precedent lineage graph from similarities")
+
+    export = parser.add_argument_group("analyst export")
+    export.add_argument('--export', metavar='OUTPUT_DIR',
+                        help="Export similarities with their articles and Orders, partitioned by order year")
+    export.add_argument('--export-format', choices=['csv', 'parquet'], default='csv')
+    export.add_argument('--incremental', action='store_true',
+                        help="Only export similarities changed since the last export's watermark")
+    export.add_argument('--watermark',
+                        help="Watermark file for --incremental (default OUTPUT_DIR/export_watermark.json)")
+    args = parser.parse_args()
+
+    postgres_only = (args.shard_index is not None or args.target_orders is not None or args.local_shards
+                     or args.merge or args.backfill or args.rebuild_graph)
+    if args.sqlite and postgres_only:
+        parser.error("sharded re-baseline, --backfill and --rebuild-graph need the Postgres backend")
+    if (args.shard_index is None) != (args.shard_count is None):
+        parser.error("--shard-index and --shard-count must be given together")
+    if args.shard_index is not None:
+        if args.target_orders is not None:
+            parser.error("--target-orders replaces --shard-index/--shard-count; give one or the other")
+        if not 0 <= args.shard_index < args.shard_count:
+            parser.error("--shard-index must be at least 0 and less than --shard-count")
+    if args.local_shards is not None and args.local_shards < 1:
+        parser.error("--local-shards must be at least 1")
+    return args
 
 
 def main():
+    args = parse_args()
+
     # Start timing the entire script
     total_start_time = time.time()
     logging.info("Script started")
-    
+
     try:
         # create_database()
-        conn, cur = setup_tables()
-    
-        directory = 'newfolderomg'
-        files = sorted(os.listdir(directory), 
+        if args.sqlite:
+            conn, cur = setup_sqlite_tables(args.sqlite)
+        else:
+            conn, cur = setup_tables()
+
+        if args.target_orders is not None or args.shard_index is not None:
+            target_order_ids = args.target_orders
+            if target_order_ids is None:
+                target_order_ids = shard_target_orders(cur, args.shard_index, args.shard_count)
+            run_shard(conn, cur, target_order_ids, args.shard_output)
+            return
+        if args.local_shards:
+            merge_shard_results(conn, cur, run_local_shards(args.local_shards, args.shard_dir))
+            return
+        if args.merge:
+            merge_shard_results(conn, cur, args.merge)
+            return
+        if args.rebuild_graph:
+            rebuild_precedent_graph(cur)
+            conn.commit()
+            return
+        if args.export:
+            export_similarities(cur, args.export, args.export_format, args.incremental, args.watermark)
+            return
+        parse_cache = (None if args.no_parse_cache
+                       else open_parse_cache(args.parse_cache, args.parse_cache_max_mb, args.parser))
+        if args.backfill:
+            for file_path in args.backfill:
+                backfill_order(conn, cur, process_file(file_path, conn, cur, parse_cache=parse_cache,
+                                                       parser=args.parser, earlier_only=True))
+            return
+
+        directory = args.directory
+        files = sorted(os.listdir(directory),
                     key=lambda x: (int(x.split('_')[0]), int(x.split('_')[1].split('.')[0])))
-        
-        for idx, filename in enumerate(files, 1):
-            file_path = os.path.join(directory, filename)
-            if os.path.isfile(file_path):
-                process_file(file_path, conn, cur)
-                
-        cur.close()
-        conn.close()
+        file_paths = [os.path.join(directory, filename) for filename in files
+                      if os.path.isfile(os.path.join(directory, filename))]
+
+        sink = MetricsSink(args.metrics_jsonl, args.metrics_prom)
+        if args.no_pipeline:
+            for file_path in file_paths:
+                process_file(file_path, conn, cur, sink, parse_cache, args.parser)
+        else:
+            run_pipeline(file_paths, conn, cur, prefetch=args.prefetch, workers=args.parse_workers, sink=sink,
+                         parse_cache=parse_cache, parser=args.parser)
     finally:
         if 'cur' in locals() and cur is not None:
             cur.close()
@@ -1,11 +1,51 @@
 # LegislationXMLParser.py
 
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import re
+import sys
 import xml.etree.ElementTree as ET
 import pandas as pd
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Any
+from dataclasses import dataclass, field
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
 import logging
 from datetime import datetime
+from ParseCache import ParseCache, source_version
+
+# The reference extraction shared with XMLDataExtractor lives beside it in the original toolkit
+LEGISLATION_REFERENCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           '..', 'Original', 'LegislationReferences.py')
+
+
+def _load_legislation_references():
+    """LegislationReferences, loaded from its file so importing the parser leaves sys.path alone"""
+    module = sys.modules.get('LegislationReferences')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('LegislationReferences', LEGISLATION_REFERENCES_PATH)
+        module = importlib.util.module_from_spec(spec)
+        # Registered by name, so XMLDataExtractor shares this copy if both are loaded
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+_references = _load_legislation_references()
+REFERENCE_FIELDS = _references.REFERENCE_FIELDS
+reference_items = _references.reference_items
+resolve_references = _references.resolve_references
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 # Set up logging
 logging.basicConfig(
@@ -36,6 +76,107 @@ class LegislationMetadata:
     def __post_init__(self):
         self.extent = self.extent or []
 
+@dataclass
+class ProvisionRecord:
+    """
+    One provision of an Order: an article in the Body or a section of a selected
+    schedule. as_row() gives the row parse_xml builds from it.
+    """
+    order: str
+    year: int
+    number: int
+    title: str
+    art: str
+    text: List[str]
+    references: List[tuple]
+    link: str
+    schedule: Optional[str] = None
+    schedule_name: Optional[str] = None
+    part_number: Optional[str] = None
+    part_title: Optional[str] = None
+    # (term, definition text) per definition list item; filled only with LegislationXMLParser(definitions=True)
+    definitions: List[tuple] = field(default_factory=list)
+
+    @property
+    def in_schedule(self) -> bool:
+        return self.schedule is not None
+
+    def as_row(self) -> Dict:
+        """The parse_xml row for this provision; only schedule sections have the Part columns"""
+        row = {
+            'Order': self.order,
+            'Year': self.year,
+            'No.': self.number,
+            'Title': self.title,
+            'Art': self.art,
+            'Text': self.text,
+            'Schedule': self.schedule,
+            'Schedule_Name': self.schedule_name,
+        }
+        if self.in_schedule:
+            row['Part_Number'] = self.part_number
+            row['Part_Title'] = self.part_title
+        # Not copied: in streaming mode footnote citations are added to the list later
+        row['References'] = self.references
+        row['Link'] = self.link
+        return row
+
+class StructureIndex:
+    """
+    Every element of a document numbered in document order, from one walk.
+
+    Each tag's positions are kept in a sorted list and an element's descendants
+    occupy the positions up to the end of its subtree, so a './/ns0:Tag' find or
+    findall on any element is two binary searches rather than a scan of its
+    subtree, and repeated lookups on the same element cost nothing extra.
+    """
+
+    def __init__(self, root: ET.Element, link_tags: List[str], p1_tag: str, pnumber_tag: str):
+        self.root = root
+        self.elements = list(root.iter())
+        self.position = {element: i for i, element in enumerate(self.elements)}
+        self.tag_positions = {}
+        for i, element in enumerate(self.elements):
+            positions = self.tag_positions.get(element.tag)
+            if positions is None:
+                self.tag_positions[element.tag] = [i]
+            else:
+                positions.append(i)
+        self.link_positions = sorted(i for tag in link_tags for i in self.tag_positions.get(tag, []))
+        # Pnumbers that are children of a P1, for './/ns0:P1/ns0:Pnumber'
+        self.p1_pnumber_positions = sorted(
+            self.position[child]
+            for i in self.tag_positions.get(p1_tag, [])
+            for child in self.elements[i] if child.tag == pnumber_tag
+        )
+        self._ends = {}
+
+    def covers(self, element: ET.Element) -> bool:
+        return element in self.position
+
+    def _range(self, element: ET.Element, positions: List[int]) -> range:
+        start = self.position[element]
+        end = self._ends.get(element)
+        if end is None:
+            end = self._ends[element] = start + sum(1 for _ in element.iter())
+        return range(bisect_right(positions, start), bisect_left(positions, end))
+
+    def descendants(self, element: ET.Element, tag: str) -> List[ET.Element]:
+        positions = self.tag_positions.get(tag, [])
+        return [self.elements[positions[i]] for i in self._range(element, positions)]
+
+    def first(self, element: ET.Element, tag: str) -> Optional[ET.Element]:
+        positions = self.tag_positions.get(tag, [])
+        found = self._range(element, positions)
+        return self.elements[positions[found.start]] if found else None
+
+    def first_p1_pnumber(self, element: ET.Element) -> Optional[ET.Element]:
+        found = self._range(element, self.p1_pnumber_positions)
+        return self.elements[self.p1_pnumber_positions[found.start]] if found else None
+
+    def links(self, element: ET.Element) -> List[ET.Element]:
+        return [self.elements[self.link_positions[i]] for i in self._range(element, self.link_positions)]
+
 class LegislationParsingError(Exception):
     """Custom exception for legislation parsing errors"""
     pass
@@ -49,6 +190,61 @@ class ScheduleConfig:
         """Add user's selection for a specific schedule"""
         self.selected_schedules[schedule_number] = extract
 
+@dataclass
+class SchedulePolicy:
+    """
+    Rule for choosing schedules without prompting.
+
+    Patterns are case-insensitive regular expressions searched for in the schedule
+    title. A schedule is extracted when it matches an include pattern and no exclude
+    pattern; one matching neither is extracted only if include_unmatched is set, so
+    SchedulePolicy(include_unmatched=True) takes every schedule and SchedulePolicy()
+    takes none.
+    """
+    include: List[str] = field(default_factory=list)
+    exclude: List[str] = field(default_factory=list)
+    include_unmatched: bool = False
+
+    def __post_init__(self):
+        for name in ('include', 'exclude'):
+            patterns = getattr(self, name)
+            if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+                raise ValueError(f"Schedule policy {name} must be a list of strings, not {patterns!r}")
+        if not isinstance(self.include_unmatched, bool):
+            raise ValueError(f"Schedule policy include_unmatched must be true or false, not {self.include_unmatched!r}")
+        try:
+            self._include = [re.compile(pattern, re.IGNORECASE) for pattern in self.include]
+            self._exclude = [re.compile(pattern, re.IGNORECASE) for pattern in self.exclude]
+        except re.error as e:
+            raise ValueError(f"Invalid schedule pattern: {e}")
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SchedulePolicy':
+        """
+        Load a policy from a JSON file such as
+        {"include": ["protective provisions"], "exclude": ["book of reference"], "include_unmatched": false}
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            policy = json.load(f)
+        if not isinstance(policy, dict):
+            raise ValueError(f"Schedule policy in {path} must be a JSON object")
+        unknown = set(policy) - {'include', 'exclude', 'include_unmatched'}
+        if unknown:
+            raise ValueError(f"Unknown schedule policy keys in {path}: {', '.join(sorted(unknown))}")
+        return cls(**policy)
+
+    def cache_key(self) -> str:
+        """The policy as a string, for keying cached parses"""
+        return json.dumps({'include': self.include, 'exclude': self.exclude,
+                           'include_unmatched': self.include_unmatched}, sort_keys=True)
+
+    def selects(self, title: str) -> bool:
+        if any(pattern.search(title) for pattern in self._exclude):
+            return False
+        if any(pattern.search(title) for pattern in self._include):
+            return True
+        return self.include_unmatched
+
 class LegislationXMLParser:
     """Enhanced parser for legislation.gov.uk XML documents"""
     
@@ -63,94 +259,116 @@ class LegislationXMLParser:
         'xhv': 'http://www.w3.org/1999/xhtml/vocab#'
     }
 
-    def __init__(self):
+    # clean_text's replacements, applied in this order
+    TEXT_REPLACEMENTS = {
+        # Smart Quotes
+        '\x93': '"',    # Windows "smart" opening quote
+        '\x94': '"',    # Windows "smart" closing quote
+        '\x91': "'",    # Windows "smart" opening single quote
+        '\x92': "'",    # Windows "smart" closing single quote
+
+        # Unicode quotes
+        '\u2018': "'",  # Left single quotation mark
+        '\u2019': "'",  # Right single quotation mark
+        '\u201c': '"',  # Left double quotation mark
+        '\u201d': '"',  # Right double quotation mark
+
+        # Special characters
+        'ô': 'o',       # o with circumflex
+        '\u00F4': 'o',  # o with circumflex (Unicode)
+
+        # Dashes
+        '\x96': '-',    # Windows en-dash
+        '\x97': '-',    # Windows em-dash
+        '\u2013': '-',  # En dash
+        '\u2014': '-',  # Em dash
+        '\u2015': '-',  # Horizontal bar
+
+        # Other special characters
+        '\x85': '...',  # Windows ellipsis
+        '\u2026': '...', # Ellipsis
+        '\x95': '•',    # Windows bullet
+        '\u2022': '•',  # Bullet
+
+        # Common HTML entities
+        '&quot;': '"',
+        '&apos;': "'",
+        '&amp;': '&',
+        '&lt;': '<',
+        '&gt;': '>',
+        '&ndash;': '-',
+        '&mdash;': '-',
+        '&hellip;': '...',
+
+        # Spaces and whitespace
+        '\xa0': ' ',    # Non-breaking space
+        '\t': ' ',      # Tab
+        '\r': ' ',      # Carriage return
+        '\xA0': ' ',    # Another form of non-breaking space
+    }
+
+    # Single characters are replaced in one regex pass that only does work where
+    # one occurs (str.translate looks up every character of non-ASCII text, which
+    # is several times slower). The HTML entities are multi-character and
+    # order-dependent ('&amp;lt;' becomes '<'), so they are still replaced one
+    # after another, and only in text containing '&'
+    CHAR_REPLACEMENTS = {old: new for old, new in TEXT_REPLACEMENTS.items() if len(old) == 1}
+    REPLACED_CHARS = re.compile('[' + re.escape(''.join(CHAR_REPLACEMENTS)) + ']')
+    HTML_ENTITIES = tuple((old, new) for old, new in TEXT_REPLACEMENTS.items() if len(old) > 1)
+
+    # Non-ASCII characters are dropped, except the Welsh ones
+    WELSH_CHARS = 'ŴŵŶŷÊêÎîÔôÛûÁáÉéÍíÓóÚúÝý'
+    NON_ASCII_CHARS = re.compile('[^\\x00-\\x7f' + WELSH_CHARS + ']+')
+
+    # Elements that carry a provision's cross-references
+    LINK_TAGS = ('InternalLink', 'Citation', 'FootnoteRef')
+
+    # XPath selectors of the lxml backend, compiled once per process
+    _compiled_xpaths = {}
+
+    def __init__(self, use_structure_index: bool = True, backend: str = 'etree', definitions: bool = False):
         self.logger = logging.getLogger(__name__)
+        # With definitions=True every record also carries its definition lists (extract_definitions)
+        self.definitions = definitions
+        # Footnote id -> Citation elements, for the document being parsed
+        self.footnote_citations = {}
+        # With use_structure_index=False every lookup is an XPath search, as before the index
+        self.use_structure_index = use_structure_index
+        self.structure_index = None
+        # 'etree' parses with xml.etree.ElementTree; 'lxml' parses with lxml and answers the
+        # lookups the structure index does not cover with precompiled XPath selectors
+        if backend not in ('etree', 'lxml'):
+            raise ValueError(f"Unknown XML backend: {backend}")
+        if backend == 'lxml' and lxml_etree is None:
+            self.logger.warning("lxml is not installed; parsing with ElementTree")
+            backend = 'etree'
+        self.backend = backend
 
     def clean_text(self, text: str) -> str:
         """Clean and normalize text content with robust character handling"""
         if not text:
             return ""
-        if text is None:
-            return ""
-            
-        # Define replacements using ASCII and Unicode codes
-        replacements = {
-            # Smart Quotes
-            '\x93': '"',    # Windows "smart" opening quote
-            '\x94': '"',    # Windows "smart" closing quote
-            '\x91': "'",    # Windows "smart" opening single quote
-            '\x92': "'",    # Windows "smart" closing single quote
-            
-            # Unicode quotes
-            '\u2018': "'",  # Left single quotation mark
-            '\u2019': "'",  # Right single quotation mark
-            '\u201c': '"',  # Left double quotation mark
-            '\u201d': '"',  # Right double quotation mark
-
-            # Special characters
-            'ô': 'o',       # o with circumflex
-            '\u00F4': 'o',  # o with circumflex (Unicode)
-            
-            # Dashes
-            '\x96': '-',    # Windows en-dash
-            '\x97': '-',    # Windows em-dash
-            '\u2013': '-',  # En dash
-            '\u2014': '-',  # Em dash
-            '\u2015': '-',  # Horizontal bar
-            
-            # Other special characters
-            '\x85': '...',  # Windows ellipsis
-            '\u2026': '...', # Ellipsis
-            '\x95': '•',    # Windows bullet
-            '\u2022': '•',  # Bullet
-            
-            # Common HTML entities
-            '&quot;': '"',
-            '&apos;': "'",
-            '&amp;': '&',
-            '&lt;': '<',
-            '&gt;': '>',
-            '&ndash;': '-',
-            '&mdash;': '-',
-            '&hellip;': '...',
-            
-            # Spaces and whitespace
-            '\xa0': ' ',    # Non-breaking space
-            '\t': ' ',      # Tab
-            '\r': ' ',      # Carriage return
-            '\xA0': ' ',    # Another form of non-breaking space
-        }
-        
-        # First, try to handle UTF-8 encoding issues
-        try:
-            # Try to encode then decode to catch any encoding issues
-            text = text.encode('utf-8', 'ignore').decode('utf-8')
-        except UnicodeError:
-            # If that fails, try to force ASCII
-            text = text.encode('ascii', 'ignore').decode('ascii')
-        
-        # Apply all replacements
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-
-        # Instead of removing all non-ASCII characters, we'll preserve known Welsh characters
-        welsh_chars = {'Ŵ', 'ŵ', 'Ŷ', 'ŷ', 'Ê', 'ê', 'Î', 'î', 'Ô', 'ô', 'Û', 'û', 'Á', 'á', 'É', 'é', 'Í', 'í', 'Ó', 'ó', 'Ú', 'ú', 'Ý', 'ý'}
 
+        if text.isascii():
+            # Tabs and carriage returns are the only ASCII replacements, and split() handles those
+            if '&' in text:
+                for old, new in self.HTML_ENTITIES:
+                    text = text.replace(old, new)
+            return ' '.join(text.split())
+
+        # Drop anything that is not valid UTF-8 (lone surrogates) before the replacements
+        text = text.encode('utf-8', 'ignore').decode('utf-8')
+        text = self.REPLACED_CHARS.sub(self._replace_char, text)
+        if '&' in text:
+            for old, new in self.HTML_ENTITIES:
+                text = text.replace(old, new)
+        text = self.NON_ASCII_CHARS.sub('', text)
 
-        # Create a function to determine if a character should be kept
-        def should_keep_char(char):
-            return ord(char) < 128 or char in welsh_chars
-        
-        # Filter characters while preserving Welsh characters
-        text = ''.join(char for char in text if should_keep_char(char))    
-
-        # # Remove any remaining non-ASCII characters
-        # text = ''.join(char for char in text if ord(char) < 128)
-        
         # Normalize whitespace: collapse multiple spaces and trim
-        text = ' '.join(text.split())
-        # self.logger.info("Attempting to export cleaned text")
-        return text.strip()
+        return ' '.join(text.split())
+
+    def _replace_char(self, match: re.Match) -> str:
+        return self.CHAR_REPLACEMENTS[match.group()]
 
     def extract_text_content(self, element: ET.Element) -> str:
         """Extract text with proper encoding handling"""
@@ -174,6 +392,82 @@ class LegislationXMLParser:
         except AttributeError:
             return default
 
+    def _tag(self, name: str) -> str:
+        return f"{{{self.NAMESPACES['ns0']}}}{name}"
+
+    def build_structure_index(self, root: ET.Element) -> StructureIndex:
+        """Index the tree under root for the extractors' descendant lookups"""
+        return StructureIndex(root, [self._tag(name) for name in self.LINK_TAGS], self._tag('P1'), self._tag('Pnumber'))
+
+    def _xpath(self, path: str):
+        """path as a compiled lxml XPath over NAMESPACES"""
+        compiled = self._compiled_xpaths.get(path)
+        if compiled is None:
+            compiled = self._compiled_xpaths[path] = lxml_etree.XPath(path, namespaces=self.NAMESPACES)
+        return compiled
+
+    def _child(self, element: ET.Element, name: str) -> Optional[ET.Element]:
+        """First ns0:name child of element"""
+        if self.backend == 'lxml':
+            found = self._xpath(f'ns0:{name}[1]')(element)
+            return found[0] if found else None
+        return element.find(f'./ns0:{name}', self.NAMESPACES)
+
+    def _children(self, element: ET.Element, name: str) -> List[ET.Element]:
+        if self.backend == 'lxml':
+            return self._xpath(f'ns0:{name}')(element)
+        return element.findall(f'./ns0:{name}', self.NAMESPACES)
+
+    def _indexed(self, element: ET.Element) -> bool:
+        return self.structure_index is not None and self.structure_index.covers(element)
+
+    def _first(self, element: ET.Element, name: str) -> Optional[ET.Element]:
+        """First ns0:name descendant of element, from the structure index when it covers element"""
+        if self._indexed(element):
+            return self.structure_index.first(element, self._tag(name))
+        if self.backend == 'lxml':
+            found = self._xpath(f'descendant::ns0:{name}[1]')(element)
+            return found[0] if found else None
+        return element.find(f'.//ns0:{name}', self.NAMESPACES)
+
+    def _all(self, element: ET.Element, name: str) -> List[ET.Element]:
+        """Every ns0:name descendant of element, in document order"""
+        if self._indexed(element):
+            return self.structure_index.descendants(element, self._tag(name))
+        if self.backend == 'lxml':
+            return self._xpath(f'descendant::ns0:{name}')(element)
+        return element.findall(f'.//ns0:{name}', self.NAMESPACES)
+
+    def _first_text(self, element: ET.Element, name: str, default: str = '') -> str:
+        """_get_text(element, './/ns0:name') through the structure index"""
+        found = self._first(element, name)
+        return found.text.strip() if found is not None and found.text else default
+
+    def _p1_pnumber(self, element: ET.Element) -> Optional[ET.Element]:
+        """The element's first P1/Pnumber descendant"""
+        if self._indexed(element):
+            return self.structure_index.first_p1_pnumber(element)
+        if self.backend == 'lxml':
+            found = self._xpath('(descendant::ns0:P1/ns0:Pnumber)[1]')(element)
+            return found[0] if found else None
+        return element.find('.//ns0:P1/ns0:Pnumber', self.NAMESPACES)
+
+    def _etree(self):
+        return lxml_etree if self.backend == 'lxml' else ET
+
+    def _parse_tree(self, xml_file: str) -> ET.Element:
+        """The root of xml_file parsed with the parser's backend"""
+        if self.backend == 'lxml':
+            # ElementTree drops comments and processing instructions; lxml keeps them unless told not to
+            parser = lxml_etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+            return lxml_etree.parse(xml_file, parser).getroot()
+        # Parse XML file with explicit encoding handling
+        parser = ET.XMLParser(encoding="utf-8")
+        # Force utf-8 reading of the file
+        with open(xml_file, 'r', encoding='utf-8') as f:
+            tree = ET.parse(f, parser=parser)
+        return tree.getroot()
+
     def _get_spatial_extent(self, root: ET.Element) -> List[str]:
         """Extract geographical extent information"""
         extents = []
@@ -224,7 +518,7 @@ class LegislationXMLParser:
         """Extract article text content with proper handling of nested elements"""
         text_content = []
         
-        for text_elem in element.findall('.//ns0:Text', self.NAMESPACES):
+        for text_elem in self._all(element, 'Text'):
             # Get all text content including nested elements
             full_text = ''.join(text_elem.itertext())
             cleaned_text = self.clean_text(full_text)
@@ -233,6 +527,54 @@ class LegislationXMLParser:
                 
         return text_content
 
+    def extract_definitions(self, element: ET.Element) -> List[tuple]:
+        """
+        Extract the definitions a provision makes: one (term, definition text) tuple per
+        item of its definition lists that has a Term, in document order.
+        """
+        definitions = []
+        for definition_list in self._all(element, 'UnorderedList'):
+            if definition_list.get('Class') != 'Definition':
+                continue
+            for item in self._children(definition_list, 'ListItem'):
+                term = self._first(item, 'Term')
+                if term is None:
+                    continue
+                text = ' '.join(self.clean_text(''.join(text_elem.itertext())) for text_elem in self._all(item, 'Text'))
+                definitions.append((self.clean_text(''.join(term.itertext())), text))
+        return definitions
+
+    def _build_footnote_citations(self, root: ET.Element) -> Dict[str, List[ET.Element]]:
+        """Map each footnote id to the Citations in it; provisions cite other legislation through FootnoteRefs"""
+        return {
+            footnote.get('id'): footnote.findall('.//ns0:Citation', self.NAMESPACES)
+            for footnote in root.iterfind('.//ns0:Footnote', self.NAMESPACES)
+        }
+
+    def extract_references(self, element: ET.Element) -> List[tuple]:
+        """
+        Extract the cross-references made by a provision.
+
+        Returns one (kind, schedule_number, part_number, article_number, subref, ref, text)
+        tuple per distinct reference, in document order (LegislationReferences). kind is
+        'article' or 'schedule' for an InternalLink to a provision of the same Order, and
+        'legislation' for a Citation, either inline or in a footnote the provision refers
+        to, with the legislation URI as ref.
+        """
+        return self._resolve_references(self._reference_items(element))
+
+    def _link_text(self, element: ET.Element) -> str:
+        return self.clean_text(''.join(element.itertext()))
+
+    def _reference_items(self, element: ET.Element) -> List[tuple]:
+        """References in document order, with each FootnoteRef left as ('footnote', id) for _resolve_references"""
+        links = self.structure_index.links(element) if self._indexed(element) else element.iter()
+        return reference_items(links, self.NAMESPACES['ns0'], self._link_text)
+
+    def _resolve_references(self, items: List[tuple]) -> List[tuple]:
+        """Expand footnote items into the footnotes' Citations and drop repeated references"""
+        return resolve_references(items, self.footnote_citations, self._link_text)
+
     def find_all_parts(self, element: ET.Element) -> List[ET.Element]:
         """
         Recursively find all Part elements in the XML tree.
@@ -265,14 +607,15 @@ class LegislationXMLParser:
     def _build_navigation_links(self, root: ET.Element) -> Dict[str, Dict[str, Optional[str]]]:
         """Build previous/next navigation links based on document structure"""
         navigation = {}
-        sections = root.findall('.//ns0:P1group', self.NAMESPACES)
+        sections = self._all(root, 'P1group')
+        # Each section's number is looked up once rather than once per neighbour
+        numbers = [self._first_text(section, 'Pnumber') for section in sections]
         
-        for i, section in enumerate(sections):
-            number = self._get_text(section, './/ns0:Pnumber')
+        for i, number in enumerate(numbers):
             if number:
                 navigation[number] = {
-                    'prev': self._get_text(sections[i-1], './/ns0:Pnumber') if i > 0 else None,
-                    'next': self._get_text(sections[i+1], './/ns0:Pnumber') if i < len(sections)-1 else None
+                    'prev': numbers[i-1] if i > 0 else None,
+                    'next': numbers[i+1] if i < len(numbers)-1 else None
                 }
         
         return navigation
@@ -310,161 +653,462 @@ class LegislationXMLParser:
         return f"{metadata.year}_{metadata.number}"
 
 
-    def parse_xml(self, xml_file: str) -> pd.DataFrame:
-        """Main parsing function with interactive schedule selection"""
-        self.logger.info(f"Starting to parse {xml_file}")
+    def _prompt_schedule_selection(self, config: ScheduleConfig, number: str, title: str) -> None:
+        """Ask whether to extract a schedule and record the answer in config"""
+        while True:
+            response = input(f"\nExtract Schedule {number}: {title}? (Y/N): ").upper()
+            if response in ['Y', 'N']:
+                config.add_schedule_selection(number, response == 'Y')
+                break
+            print("Please enter Y or N")
+
+    def _select_schedule(self, config: ScheduleConfig, number: str, title: str,
+                         policy: Optional[SchedulePolicy]) -> None:
+        """Record whether to extract a schedule, from the policy if there is one or else by asking"""
+        if policy is None:
+            self._prompt_schedule_selection(config, number, title)
+            return
+        extract = policy.selects(title)
+        config.add_schedule_selection(number, extract)
+        self.logger.info(f"Schedule {number}: {title} - {'extracting' if extract else 'skipping'} by policy")
+
+    def _build_article_record(self, p1group: ET.Element, metadata: LegislationMetadata, base_uri: str,
+                              references: Optional[List[tuple]] = None) -> ProvisionRecord:
+        """Build the record for an article P1group in the Body"""
+        # Try multiple XPath patterns to find the article number
+        article_number_elem = (
+            self._p1_pnumber(p1group) or 
+            self._first(p1group, 'Pnumber')
+        )
+        # Add debug logging
+        if article_number_elem is None:
+            self.logger.debug(f"No article number found in P1group: {self._etree().tostring(p1group, encoding='unicode')[:200]}...")
+        # # More defensive text extraction
+        # article_number_elem = p1group.find('./ns0:P1/ns0:Pnumber', self.NAMESPACES)
+        article_art = self.clean_text(article_number_elem.text) if article_number_elem is not None else ''
         
+        title_elem = self._child(p1group, 'Title')
+        title = self.clean_text(title_elem.text) if title_elem is not None else ''
+        
+        return ProvisionRecord(
+            order=self.clean_text(metadata.title),
+            year=metadata.year,
+            number=metadata.number,
+            title=title,
+            art=article_art,
+            text=self.extract_article_text(p1group),
+            references=self.extract_references(p1group) if references is None else references,
+            # link=f"{base_uri}/article/{article_art}/made" if article_art else base_uri
+            link=f"{base_uri}/article/{article_art}/made" if article_art else f"{base_uri}/made",
+            definitions=self.extract_definitions(p1group) if self.definitions else []
+        )
+
+    def _build_schedule_record(self, metadata: LegislationMetadata, schedule_number: str, schedule_name: str,
+                               content: Dict) -> ProvisionRecord:
+        """Build the record for a section extracted from a schedule"""
+        return ProvisionRecord(
+            order=self.clean_text(metadata.title),
+            year=metadata.year,
+            number=metadata.number,
+            title=content['title'],  # Just the section title without Schedule prefix
+            art=content['article_number'],  # Use the article number directly
+            text=content['text'],
+            references=content['references'],
+            link=content['Link'],  # Now using the link generated during processing
+            # link=f"{base_uri}/schedule/{schedule['number']}/made"
+            schedule=schedule_number,
+            schedule_name=schedule_name,
+            part_number=content.get('part_number'),
+            part_title=content.get('part_title'),
+            definitions=content.get('definitions', [])
+        )
+
+    def parse_xml(self, xml_file: str, schedule_config: Optional[ScheduleConfig] = None,
+                  streaming: bool = False, schedule_policy: Optional[SchedulePolicy] = None) -> pd.DataFrame:
+        """
+        Main parsing function with interactive schedule selection.
+
+        Schedules are chosen interactively unless schedule_config is given, in which
+        case only the schedules it selects are extracted, or schedule_policy is given,
+        in which case they are chosen by title without prompting. With streaming=True
+        the file is read in one pass with iterparse (see _iter_provisions_streaming)
+        instead of being loaded as a tree; the output is the same.
+
+        The rows are those of iter_provisions; use that directly to consume them
+        without building a DataFrame.
+        """
+        articles_data = [record.as_row() for record in
+                         self.iter_provisions(xml_file, schedule_config, streaming, schedule_policy)]
+        self.logger.info(f"Processed {len(articles_data)} provisions")
+        return pd.DataFrame(articles_data)
+
+    def iter_provisions(self, xml_file: str, schedule_config: Optional[ScheduleConfig] = None,
+                        streaming: bool = False,
+                        schedule_policy: Optional[SchedulePolicy] = None) -> Iterator[ProvisionRecord]:
+        """
+        Yield the provisions of xml_file as ProvisionRecords, in parse_xml's row order.
+
+        Arguments are as for parse_xml. Records are built as they are consumed: in
+        tree mode the document is parsed when iteration starts, and in streaming mode
+        it is read as it goes, in which case a record's references are only complete
+        once the iterator is exhausted.
+        """
+        self.logger.info(f"Starting to parse {xml_file}" + (" (streaming)" if streaming else ""))
+        if streaming:
+            records = self._iter_provisions_streaming(xml_file, schedule_config, schedule_policy)
+        else:
+            records = self._iter_provisions_tree(xml_file, schedule_config, schedule_policy)
         try:
-            # Parse XML file with explicit encoding handling
-            parser = ET.XMLParser(encoding="utf-8")
-            # Force utf-8 reading of the file
-            with open(xml_file, 'r', encoding='utf-8') as f:
-                tree = ET.parse(f, parser=parser)
-            root = tree.getroot()
-
-            # Extract metadata with better error handling
-            try:
-                metadata = self.extract_metadata(root)
-                self.logger.info("Metadata extracted successfully")
-                print(f"Processing {metadata.title}")
-            except LegislationParsingError as e:
-                self.logger.error(f"Metadata extraction failed: {str(e)}")
-                raise
-
-            # Build base URI for legislation
-            base_uri = self._build_legislation_uri(metadata)
+            yield from records
+        except Exception as e:
+            raise LegislationParsingError(f"Unexpected error during parsing: {str(e)}")
+        finally:
+            self.structure_index = None
+
+    def _iter_provisions_tree(self, xml_file: str, schedule_config: Optional[ScheduleConfig] = None,
+                              schedule_policy: Optional[SchedulePolicy] = None) -> Iterator[ProvisionRecord]:
+        """Yield the provisions of parse_xml from the whole document loaded as a tree"""
+        root = self._parse_tree(xml_file)
+        if self.use_structure_index:
+            self.structure_index = self.build_structure_index(root)
+
+        # Extract metadata with better error handling. Metadata is the first child of
+        # the root, so searching it alone finds the same elements without a scan of
+        # the whole document for any that are absent.
+        metadata_root = root.find('ukm:Metadata', self.NAMESPACES)
+        try:
+            metadata = self.extract_metadata(metadata_root if metadata_root is not None else root)
+            self.logger.info("Metadata extracted successfully")
+            print(f"Processing {metadata.title}")
+        except LegislationParsingError as e:
+            self.logger.error(f"Metadata extraction failed: {str(e)}")
+            raise
+
+        # Build base URI for legislation
+        base_uri = self._build_legislation_uri(metadata)
+        self.footnote_citations = self._build_footnote_citations(root)
+        
+
+        # First, identify all available schedules
+        available_schedules = []
+        for schedule in self._schedules(root):
+            schedule_number = self._first(schedule, 'Number')
+            schedule_title = self._first(schedule, 'Title')
+            # print(schedule_number, "and", schedule_title)
             
+            if schedule_number is not None and schedule_title is not None:
 
-            # First, identify all available schedules
-            available_schedules = []
-            for schedule in root.findall('.//ns0:Schedule', self.NAMESPACES):
-                schedule_number = schedule.find('.//ns0:Number', self.NAMESPACES)
-                schedule_title = schedule.find('.//ns0:Title', self.NAMESPACES)
-                # print(schedule_number, "and", schedule_title)
+                # # Log the elements themselves
+                # self.logger.info(f"Raw elements - Number: {schedule_number}, Title: {schedule_title}")
                 
-                if schedule_number is not None and schedule_title is not None:
+                # # Log their text content
+                # self.logger.info(f"Text content - Number: {schedule_number.text}, Title: {schedule_title.text}")
 
-                    # # Log the elements themselves
-                    # self.logger.info(f"Raw elements - Number: {schedule_number}, Title: {schedule_title}")
-                    
-                    # # Log their text content
-                    # self.logger.info(f"Text content - Number: {schedule_number.text}, Title: {schedule_title.text}")
-
-                    # # Log the type of each value
-                    # self.logger.info(f"Types - Number text type: {type(schedule_number.text)}, Title text type: {type(schedule_title.text)}")
+                # # Log the type of each value
+                # self.logger.info(f"Types - Number text type: {type(schedule_number.text)}, Title text type: {type(schedule_title.text)}")
 
 
-                    # For number, we need to handle both direct text and CommentaryRef cases
-                    if schedule_number.text is not None:
-                        # self.logger.info(f"Schedule_number.text is not none. Proceeding...")
-                        number_text = schedule_number.text
-                    else:
-                        # self.logger.info(f"Schedule_number.text is none. Using itertext...")
-                        # Try to get the full text including any nested content
-                        number_text = ''.join(schedule_number.itertext())
-                    
-                    title_text = schedule_title.text
+                # For number, we need to handle both direct text and CommentaryRef cases
+                if schedule_number.text is not None:
+                    # self.logger.info(f"Schedule_number.text is not none. Proceeding...")
+                    number_text = schedule_number.text
+                else:
+                    # self.logger.info(f"Schedule_number.text is none. Using itertext...")
+                    # Try to get the full text including any nested content
+                    number_text = ''.join(schedule_number.itertext())
+                
+                title_text = schedule_title.text
 
-                    
-                    
-                    # Try to extract and log the text separately before cleaning
-                    # number_text = schedule_number.text
-                    # title_text = schedule_title.text
-                    # self.logger.info(f"Raw text before cleaning - Number: '{number_text}', Title: '{title_text}'")
+                
+                
+                # Try to extract and log the text separately before cleaning
+                # number_text = schedule_number.text
+                # title_text = schedule_title.text
+                # self.logger.info(f"Raw text before cleaning - Number: '{number_text}', Title: '{title_text}'")
 
-                    number = number_text.strip().replace('SCHEDULE ', '')
-                    title = title_text.strip()
-                    available_schedules.append((number, title))
+                number = number_text.strip().replace('SCHEDULE ', '')
+                title = title_text.strip()
+                available_schedules.append((number, title))
 
-            # Get user selection for each schedule
+        # Get user selection for each schedule, unless the caller has already chosen
+        if schedule_config is None:
             schedule_config = ScheduleConfig()
             for number, title in available_schedules:
-                while True:
-                    response = input(f"\nExtract Schedule {number}: {title}? (Y/N): ").upper()
-                    if response in ['Y', 'N']:
-                        schedule_config.add_schedule_selection(number, response == 'Y')
-                        break
-                    print("Please enter Y or N")
-
-            # Process articles with proper text cleaning
-            articles_data = []
-            body = root.find('.//ns0:Body', self.NAMESPACES)  # Find the main body section
-
-            if body is None:
-                self.logger.warning("No Body element found in XML")
-                return pd.DataFrame()  # Return empty DataFrame if no body found
-            
-            p1groups = body.findall('.//ns0:P1group', self.NAMESPACES)
-            self.logger.info(f"Found {len(p1groups)} articles")
-
-
-            if body:
-                for p1group in p1groups:
-                    try:
-                        # Try multiple XPath patterns to find the article number
-                        article_number_elem = (
-                            p1group.find('.//ns0:P1/ns0:Pnumber', self.NAMESPACES) or 
-                            p1group.find('.//ns0:Pnumber', self.NAMESPACES)
-                        )
-                        # Add debug logging
-                        if article_number_elem is None:
-                            self.logger.debug(f"No article number found in P1group: {ET.tostring(p1group, encoding='unicode')[:200]}...")
-                        # # More defensive text extraction
-                        # article_number_elem = p1group.find('./ns0:P1/ns0:Pnumber', self.NAMESPACES)
-                        article_art = self.clean_text(article_number_elem.text) if article_number_elem is not None else ''
-                        
-                        title_elem = p1group.find('./ns0:Title', self.NAMESPACES)
-                        title = self.clean_text(title_elem.text) if title_elem is not None else ''
-                        
-                        article_data = {
-                            'Order': self.clean_text(metadata.title),
-                            'Year': metadata.year,
-                            'No.': metadata.number,
-                            'Title': title,
-                            'Art': article_art,
-                            'Text': [self.clean_text(text) for text in self.extract_article_text(p1group)],
-                            'Schedule': None,
-                            'Schedule_Name': None,
-                            # 'Link': f"{base_uri}/article/{article_art}/made" if article_art else base_uri
-                            'Link': f"{base_uri}/article/{article_art}/made" if article_art else f"{base_uri}/made"
-                        }
-                        articles_data.append(article_data)
-                    except Exception as e:
-                        self.logger.warning(f"Error processing P1group: {str(e)}")
-                        continue
+                self._select_schedule(schedule_config, number, title, schedule_policy)
 
-            # Process selected schedules
-            # schedules = self.extract_schedules(root, schedule_config, base_uri)
-            schedules = self.extract_schedules(root, schedule_config, base_uri)
-            
-            # Add schedule data if present
-            for schedule in schedules:
-                for content in schedule['content']:
-                    schedule_data = {
-                        'Order': self.clean_text(metadata.title),
-                        'Year': metadata.year,
-                        'No.': metadata.number,
-                        'Title': content['title'],  # Just the section title without Schedule prefix
-                        'Art': content['article_number'],  # Use the article number directly
-                        'Text': content['text'],
-                        'Schedule': schedule['number'],
-                        'Schedule_Name': schedule['name'],  # Add the new schedule name column
-                        'Part_Number': content.get('part_number'),
-                        'Part_Title': content.get('part_title'),
-                        'Link': content['Link']  # Now using the link generated during processing
-                        # 'Link': f"{base_uri}/schedule/{schedule['number']}/made"
-                    }
-                    articles_data.append(schedule_data)
+        # Process articles with proper text cleaning
+        body = self._first(root, 'Body')  # Find the main body section
 
-            self.logger.info(f"Processed {len(articles_data)} provisions")
+        if body is None:
+            self.logger.warning("No Body element found in XML")
+            return  # No provisions if no body found
+        
+        p1groups = self._all(body, 'P1group')
+        self.logger.info(f"Found {len(p1groups)} articles")
 
-            # Create DataFrame
-            df = pd.DataFrame(articles_data)
-            return df
 
-        except Exception as e:
-            raise LegislationParsingError(f"Unexpected error during parsing: {str(e)}")
+        if body:
+            for p1group in p1groups:
+                try:
+                    yield self._build_article_record(p1group, metadata, base_uri)
+                except Exception as e:
+                    self.logger.warning(f"Error processing P1group: {str(e)}")
+                    continue
+
+        # Process selected schedules
+        # schedules = self.extract_schedules(root, schedule_config, base_uri)
+        schedules = self.extract_schedules(root, schedule_config, base_uri)
+        
+        # Add schedule data if present
+        for schedule in schedules:
+            for content in schedule['content']:
+                yield self._build_schedule_record(metadata, schedule['number'], schedule['name'], content)
+
+    def _iter_provisions_streaming(self, xml_file: str, schedule_config: Optional[ScheduleConfig] = None,
+                                   schedule_policy: Optional[SchedulePolicy] = None) -> Iterator[ProvisionRecord]:
+        """
+        Yield the provisions of parse_xml in one pass over the file with iterparse.
+
+        Each article is built when its P1group closes and each schedule section when its
+        P1group or P1 closes, after which the subtree is cleared and detached, so only the
+        open path and the few elements still needed are held in memory. The rows, their
+        order and the schedule prompts match the tree mode, including its lookups (the
+        first Number and Title of a schedule or part, sections outside Parts ignored in
+        a schedule that has Parts, Parts without a number or title skipped).
+
+        Citations reached through footnotes are added to each row's References list once
+        the Footnotes section at the end of the document has been read, so read those
+        lists only after the iterator is exhausted.
+        """
+        ns0 = self.NAMESPACES['ns0']
+        tags = {name: f'{{{ns0}}}{name}' for name in (
+            'Body', 'Schedule', 'ScheduleBody', 'Part', 'P1group', 'P1', 'Number', 'Title', 'Footnote')}
+        metadata_tag = f"{{{self.NAMESPACES['ukm']}}}Metadata"
+
+        prompt = schedule_config is None
+        if prompt:
+            schedule_config = ScheduleConfig()
+
+        self.footnote_citations = {}
+        deferred_references = []  # (record references list, reference items) to resolve after the Footnotes
+        metadata = None
+        base_uri = None
+        body = None
+        body_closed = False
+        queued_rows = []  # schedule records reached before the Body closed
+        schedules = []  # open Schedule contexts, innermost last
+        stack = []  # open elements
+        held = {}  # open element -> why its subtree is kept until it closes
+
+        def require_metadata() -> None:
+            if metadata is None:
+                raise LegislationParsingError("Required SecondaryMetadata section missing")
+
+        def references_for(element: ET.Element) -> List[tuple]:
+            items = self._reference_items(element)
+            if any(item[0] == 'footnote' for item in items):
+                references = []
+                deferred_references.append((references, items))
+                return references
+            return self._resolve_references(items)
+
+        def index_subtree(element: ET.Element) -> None:
+            # A closed provision is indexed on its own before its row is built
+            if self.use_structure_index:
+                self.structure_index = self.build_structure_index(element)
+
+        def release(element: ET.Element, parent: Optional[ET.Element]) -> None:
+            element.clear()
+            if parent is not None:
+                parent.remove(element)
+
+        def decide(schedule: Dict) -> None:
+            # The tree mode's prompt loop and extract_schedules tests, in the same order
+            schedule['decided'] = True
+            if 'number_text' not in schedule:
+                return
+            if prompt:
+                if 'title_text' not in schedule:
+                    return
+                number_text = schedule['number_text']
+                if number_text is None:
+                    number_text = schedule['number_itertext']
+                self._select_schedule(schedule_config, number_text.strip().replace('SCHEDULE ', ''),
+                                      schedule['title_text'].strip(), schedule_policy)
+            if schedule['number_text'] is None:
+                self.logger.warning("Skipping malformed schedule: Number has no text")
+                return
+            number = self.clean_text(schedule['number_text']).replace('SCHEDULE ', '')
+            if schedule_config.selected_schedules.get(number):
+                schedule['selected'] = True
+                schedule['number'] = number
+                schedule['name'] = (schedule.get('title_text') or '').strip()
+
+        def emit(schedule: Dict, contents: List[Dict]) -> List[ProvisionRecord]:
+            rows = [self._build_schedule_record(metadata, schedule['number'], schedule['name'], content)
+                    for content in contents]
+            schedule['rows'] += len(rows)
+            if body_closed:
+                return rows
+            queued_rows.extend(rows)
+            return []
+
+        def emit_part_sections(schedule: Dict) -> List[ProvisionRecord]:
+            if not schedule['selected']:
+                return []
+            contents = schedule['part_sections'][schedule['emitted']:]
+            schedule['emitted'] = len(schedule['part_sections'])
+            for content in contents:
+                part_info = PartInfo(number=content['part_number'], title=content['part_title'])
+                content['Link'] = self._build_schedule_link(base_uri, schedule['number'], part_info)
+            return emit(schedule, contents)
+
+        def add_part_sections(schedule: Dict, part: Dict) -> List[ProvisionRecord]:
+            # A Part's sections are extracted once its first Number and Title are known
+            if part['number'] is None or part['title'] is None:
+                return []
+            pending, part['pending'] = part['pending'], []
+            for element, parent in pending:
+                if part['number'] and part['title']:
+                    index_subtree(element)
+                    content = self._extract_p1group_content(element, len(schedule['part_sections']),
+                                                             references_for(element))
+                    content.update({'part_number': part['number'], 'part_title': part['title']})
+                    schedule['part_sections'].append(content)
+                release(element, parent)
+            return emit_part_sections(schedule)
+
+        with open(xml_file, 'rb') as f:
+            if self.backend == 'lxml':
+                events = lxml_etree.iterparse(f, events=('start', 'end'), remove_comments=True, remove_pis=True)
+            else:
+                events = ET.iterparse(f, events=('start', 'end'))
+            for event, elem in events:
+                if event == 'start':
+                    parent = stack[-1] if stack else None
+                    stack.append(elem)
+                    schedule = schedules[-1] if schedules else None
+                    part = schedule['parts'][-1] if schedule and schedule['parts'] else None
+                    part = part if part is not None and part['open'] else None
+
+                    if elem.tag == metadata_tag or elem.tag == tags['Footnote']:
+                        held[elem] = 'whole'
+                    elif elem.tag == tags['Body'] and body is None:
+                        body = elem
+                    elif elem.tag == tags['Schedule']:
+                        schedules.append({'body': None, 'number_elem': None, 'title_elem': None,
+                                          'decided': False, 'selected': False, 'number': None, 'name': None,
+                                          'parts': [], 'direct_sections': [], 'part_sections': [],
+                                          'emitted': 0, 'rows': 0})
+                    elif elem.tag == tags['ScheduleBody'] and schedule is not None and schedule['body'] is None:
+                        schedule['body'] = elem
+                    elif elem.tag == tags['Part'] and schedule is not None and parent is schedule['body']:
+                        schedule['parts'].append({'elem': elem, 'open': True, 'number_elem': None,
+                                                  'title_elem': None, 'number': None, 'title': None,
+                                                  'pending': []})
+                    elif elem.tag in (tags['Number'], tags['Title']) and schedule is not None:
+                        key = 'number_elem' if elem.tag == tags['Number'] else 'title_elem'
+                        for context in (schedule, part):
+                            if context is not None and context[key] is None:
+                                context[key] = elem
+                                held[elem] = 'value'
+                    elif elem.tag in (tags['P1group'], tags['P1']) and not held:
+                        # An outermost provision: a P1group in the Body, or a P1group or P1
+                        # directly in a ScheduleBody or in one of its Parts
+                        if schedule is not None and schedule['body'] is not None:
+                            if parent is schedule['body']:
+                                held[elem] = 'direct'
+                            elif part is not None and parent is part['elem']:
+                                held[elem] = 'part'
+                        elif body is not None and not body_closed and elem.tag == tags['P1group']:
+                            held[elem] = 'article'
+                    continue
 
+                stack.pop()
+                parent = stack[-1] if stack else None
+                schedule = schedules[-1] if schedules else None
+                part = schedule['parts'][-1] if schedule and schedule['parts'] else None
+                part = part if part is not None and part['open'] else None
+                reason = held.pop(elem, None)
+
+                if elem.tag == metadata_tag:
+                    metadata = self.extract_metadata(elem)
+                    self.logger.info("Metadata extracted successfully")
+                    print(f"Processing {metadata.title}")
+                    base_uri = self._build_legislation_uri(metadata)
+                elif elem.tag == tags['Footnote']:
+                    self.footnote_citations[elem.get('id')] = elem.findall('.//ns0:Citation', self.NAMESPACES)
+                elif elem is body:
+                    body_closed = True
+                    yield from queued_rows
+                    queued_rows = []
+                elif reason == 'article':
+                    require_metadata()
+                    index_subtree(elem)
+                    for p1group in elem.iter(tags['P1group']):
+                        try:
+                            yield self._build_article_record(p1group, metadata, base_uri, references_for(p1group))
+                        except Exception as e:
+                            self.logger.warning(f"Error processing P1group: {str(e)}")
+                elif reason == 'direct':
+                    # Only used if the schedule turns out to have no Parts
+                    if not schedule['parts']:
+                        index_subtree(elem)
+                        schedule['direct_sections'].append(self._extract_p1group_content(
+                            elem, len(schedule['direct_sections']), references_for(elem)))
+                elif reason == 'part':
+                    part['pending'].append((elem, parent))
+                    yield from add_part_sections(schedule, part)
+                elif reason == 'value':
+                    if elem is schedule['number_elem']:
+                        schedule['number_text'] = elem.text
+                        schedule['number_itertext'] = ''.join(elem.itertext())
+                    if elem is schedule['title_elem']:
+                        schedule['title_text'] = elem.text
+                    if part is not None and elem is part['number_elem']:
+                        part['number'] = elem.text.strip() if elem.text else ''
+                    if part is not None and elem is part['title_elem']:
+                        part['title'] = elem.text.strip() if elem.text else ''
+                    if not schedule['decided'] and 'number_text' in schedule and 'title_text' in schedule:
+                        require_metadata()
+                        decide(schedule)
+                    if part is not None:
+                        yield from add_part_sections(schedule, part)
+                    yield from emit_part_sections(schedule)
+                elif part is not None and elem is part['elem']:
+                    # No first Number or Title can appear in the Part any more
+                    part['open'] = False
+                    part['number'] = part['number'] if part['number'] is not None else ''
+                    part['title'] = part['title'] if part['title'] is not None else ''
+                    yield from add_part_sections(schedule, part)
+                elif schedule is not None and elem.tag == tags['Schedule']:
+                    require_metadata()
+                    if not schedule['decided']:
+                        decide(schedule)
+                    if schedule['selected'] and not schedule['parts']:
+                        link = self._build_schedule_link(base_uri, schedule['number'], None)
+                        for content in schedule['direct_sections']:
+                            content.update({'part_number': None, 'part_title': None, 'Link': link})
+                        yield from emit(schedule, schedule['direct_sections'])
+                    else:
+                        yield from emit_part_sections(schedule)
+                    if schedule['rows']:
+                        self.logger.info(f"Extracted Schedule {schedule['number']} ({schedule['name']}) "
+                                         f"with {schedule['rows']} sections")
+                    schedules.pop()
+
+                # Held elements are all open ancestors, so nothing inside one is released.
+                # Part sections are released by add_part_sections once extracted.
+                if not held and reason != 'part':
+                    release(elem, parent)
+                self.structure_index = None
+
+        require_metadata()
+        if body is None:
+            self.logger.warning("No Body element found in XML")
+            return
+        for references, items in deferred_references:
+            references.extend(self._resolve_references(items))
 
     # def extract_schedules(self, root: ET.Element, config: ScheduleConfig) -> List[Dict]:
     #     """Extract schedules based on user selection"""
@@ -673,14 +1317,18 @@ class LegislationXMLParser:
         else:
             return f"{base_uri}/schedule/{schedule_number}/made"
 
+    def _schedules(self, root: ET.Element) -> List[ET.Element]:
+        """Every Schedule under root, in document order"""
+        return self._all(root, 'Schedule')
+
     def extract_schedules(self, root: ET.Element, config: ScheduleConfig, base_uri: str) -> List[Dict]:
         """Extract schedules based on user selection"""
         schedules = []
         
         try:
-            for schedule in root.findall('.//ns0:Schedule', self.NAMESPACES):
+            for schedule in self._schedules(root):
                 try:
-                    schedule_number_elem = schedule.find('.//ns0:Number', self.NAMESPACES)
+                    schedule_number_elem = self._first(schedule, 'Number')
                     if schedule_number_elem is None:
                         continue
                     
@@ -689,7 +1337,7 @@ class LegislationXMLParser:
                     if number not in config.selected_schedules or not config.selected_schedules[number]:
                         continue
                     
-                    schedule_title = self._get_text(schedule, './/ns0:Title')
+                    schedule_title = self._first_text(schedule, 'Title')
                     
                     schedule_data = {
                         'number': number,
@@ -697,11 +1345,11 @@ class LegislationXMLParser:
                         'content': []
                     }
                     
-                    schedule_body = schedule.find('.//ns0:ScheduleBody', self.NAMESPACES)
+                    schedule_body = self._first(schedule, 'ScheduleBody')
                     if schedule_body is None:
                         continue
                     
-                    parts = schedule_body.findall('./ns0:Part', self.NAMESPACES)
+                    parts = self._children(schedule_body, 'Part')
                     
                     if parts:
                         # Pass base_uri to _process_schedule_with_parts
@@ -808,8 +1456,8 @@ class LegislationXMLParser:
             schedule_data: Dictionary to store the extracted content
         """
         for part in parts:
-            part_number = self._get_text(part, './/ns0:Number')
-            part_title = self._get_text(part, './/ns0:Title')
+            part_number = self._first_text(part, 'Number')
+            part_title = self._first_text(part, 'Title')
             
             if not (part_number and part_title):
                 self.logger.warning(f"Part found without number or title - skipping")
@@ -873,10 +1521,6 @@ class LegislationXMLParser:
             schedule_body: ScheduleBody XML element
             schedule_data: Dictionary to store the extracted content
         """
-        # Find both P1group elements and direct P1 elements
-        p1groups = schedule_body.findall('./ns0:P1group', self.NAMESPACES)
-        direct_p1s = schedule_body.findall('./ns0:P1', self.NAMESPACES)
-        
         # Process all elements in order they appear in the document
         all_elements = []
         for element in schedule_body:
@@ -899,42 +1543,48 @@ class LegislationXMLParser:
             })
             schedule_data['content'].append(section_content)
 
-    def _extract_p1group_content(self, element: ET.Element, content_count: int) -> Dict:
+    def _extract_p1group_content(self, element: ET.Element, content_count: int,
+                                 references: Optional[List[tuple]] = None) -> Dict:
         """
         Extract content from either a P1group or direct P1 element.
         
         Args:
             element: XML element (either P1group or P1)
             content_count: Current count of content items
+            references: The element's cross-references, if already extracted
             
         Returns:
             Dictionary containing the extracted content
         """
         # Handle P1group structure
         if element.tag.endswith('P1group'):
-            section_title = self._get_text(element, './/ns0:Title')
-            p_number = self._get_text(element, './/ns0:P1/ns0:Pnumber')
+            section_title = self._first_text(element, 'Title')
+            p_number_elem = self._p1_pnumber(element)
+            p_number = p_number_elem.text.strip() if p_number_elem is not None and p_number_elem.text else ''
         # Handle direct P1 structure
         else:
             section_title = ""  # Direct P1 elements may not have titles
-            p_number = self._get_text(element, './/ns0:Pnumber')
+            p_number = self._first_text(element, 'Pnumber')
         
         if not p_number:
             p_number = str(content_count + 1)
         
-        return {
+        content = {
             'article_number': p_number,
             'title': section_title,
-            'text': self.extract_article_text(element)
+            'text': self.extract_article_text(element),
+            'references': self.extract_references(element) if references is None else references
         }
+        if self.definitions:
+            content['definitions'] = self.extract_definitions(element)
+        return content
 
     def extract_section_content(self, section: ET.Element) -> Dict:
         """Extract content from a section in a schedule"""
         try:
             return {
                 'title': self._get_text(section, 'Title'),
-                'text': [self.clean_text(text) 
-                        for text in self.extract_article_text(section)]
+                'text': self.extract_article_text(section)
             }
         except Exception as e:
             self.logger.warning(f"Error extracting section content: {str(e)}")
@@ -1003,5 +1653,314 @@ def main():
     
     print("\nTesting complete!")
 
+def xml_files(inputs: List[str]) -> List[str]:
+    """
+    The XML files named in inputs, in a stable order: each directory is expanded to
+    the XML files in it and each glob pattern to its matches, sorted by name, and a
+    file named more than once is kept at its first position
+    """
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.xml')))
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+def policy_from_args(args) -> SchedulePolicy:
+    """The --policy file, if any, extended by --include/--exclude/--all-schedules"""
+    policy = SchedulePolicy.from_file(args.policy) if args.policy else SchedulePolicy()
+    return SchedulePolicy(include=policy.include + args.include,
+                          exclude=policy.exclude + args.exclude,
+                          include_unmatched=policy.include_unmatched or args.all_schedules)
+
+def open_parse_cache(directory: str, max_mb: int = 1024) -> ParseCache:
+    """A ParseCache for this parser, invalidated whenever this file changes"""
+    return ParseCache(directory, parser_version=source_version(__file__, LEGISLATION_REFERENCES_PATH),
+                      max_bytes=max_mb * 1024 * 1024)
+
+def _parse_file(xml_file: str, policy: SchedulePolicy, streaming: bool,
+                cache: Optional[ParseCache] = None, backend: str = 'etree') -> pd.DataFrame:
+    """Parse one file under the policy, through the cache if there is one; the unit of work of parse_files"""
+    def parse(path: str) -> pd.DataFrame:
+        return LegislationXMLParser(backend=backend).parse_xml(path, streaming=streaming, schedule_policy=policy)
+    if cache is None:
+        return parse(xml_file)
+    return cache.get_or_parse(xml_file, parse, policy.cache_key())
+
+def _parse_file_isolated(xml_file: str, policy: SchedulePolicy, streaming: bool,
+                         cache: Optional[ParseCache] = None, backend: str = 'etree'):
+    """_parse_file in a process of its own, returning its DataFrame or the exception it failed with"""
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_parse_file, xml_file, policy, streaming, cache, backend).result()
+    except Exception as e:
+        return e
+
+def parse_files(files: List[str], policy: SchedulePolicy, workers: Optional[int] = None, streaming: bool = False,
+                cache: Optional[ParseCache] = None, backend: str = 'etree'):
+    """
+    Parse files in a process pool, yielding (xml_file, DataFrame or exception) in the order of files.
+
+    A file that fails yields its exception instead of stopping the run. At most twice
+    `workers` parses are in flight, so results are handed on in order as they finish
+    rather than the whole corpus being held in memory. With one worker the files are
+    parsed in this process. Files already in the cache are read from it instead.
+
+    A worker that dies (killed for memory, or crashed in a C extension) breaks the
+    pool and every parse in flight with it. Those files are then parsed again one at
+    a time in a process of their own, so only the file that kills its worker fails,
+    and the rest of the files go to a new pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for xml_file in files:
+            try:
+                yield xml_file, _parse_file(xml_file, policy, streaming, cache, backend)
+            except Exception as e:
+                yield xml_file, e
+        return
+
+    def submit(xml_file: str) -> Future:
+        try:
+            return executor.submit(_parse_file, xml_file, policy, streaming, cache, backend)
+        except BrokenProcessPool as e:
+            # Handled like a parse lost with the pool when its turn comes
+            lost = Future()
+            lost.set_exception(e)
+            return lost
+
+    remaining = iter(files)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        in_flight = deque((xml_file, submit(xml_file)) for xml_file in islice(remaining, 2 * workers))
+        while in_flight:
+            xml_file, future = in_flight.popleft()
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                logging.getLogger(__name__).warning(
+                    f"A parse worker died; parsing the {len(in_flight) + 1} files in flight one at a time")
+                executor.shutdown(wait=True)
+                lost = [xml_file] + [in_flight_file for in_flight_file, _ in in_flight]
+                in_flight.clear()
+                for lost_file in lost:
+                    yield lost_file, _parse_file_isolated(lost_file, policy, streaming, cache, backend)
+                executor = ProcessPoolExecutor(max_workers=workers)
+                in_flight.extend((next_file, submit(next_file)) for next_file in islice(remaining, 2 * workers))
+                continue
+            except Exception as e:
+                result = e
+            next_file = next(remaining, None)
+            if next_file is not None:
+                in_flight.append((next_file, submit(next_file)))
+            yield xml_file, result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Columns of parse_xml's DataFrame, in its order, in a columnar file. Text is a list of
+# paragraphs and References a list of (kind, schedule_number, part_number, article_number,
+# subref, ref, text) - REFERENCE_FIELDS; the fields repeated down an Order are dictionary-encoded.
+PROVISION_COLUMNS = [
+    ('Order', 'dictionary'), ('Year', 'int32'), ('No.', 'int32'), ('Title', 'string'), ('Art', 'string'),
+    ('Text', 'list<string>'), ('Schedule', 'dictionary'), ('Schedule_Name', 'dictionary'),
+    ('References', 'list<reference>'), ('Link', 'string'), ('Part_Number', 'dictionary'),
+    ('Part_Title', 'dictionary')
+]
+PROVISION_COLUMN_NAMES = [name for name, _ in PROVISION_COLUMNS]
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    return pa, pq
+
+def provision_schema(pa):
+    types = {
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+        'int32': pa.int32(),
+        'string': pa.string(),
+        'list<string>': pa.list_(pa.string()),
+        'list<reference>': pa.list_(pa.struct([(name, pa.string()) for name in REFERENCE_FIELDS]))
+    }
+    return pa.schema([(name, types[type_name]) for name, type_name in PROVISION_COLUMNS])
+
+class ProvisionParquetWriter:
+    """
+    Write parse_xml DataFrames to one Parquet file as they arrive.
+
+    Provisions are buffered until row_group_rows are ready and then written as a row
+    group, so a corpus is written in bounded memory and read back without parsing
+    strings: Text and References keep their list structure, and Order, Schedule and
+    Part names are stored once per row group rather than once per provision.
+    """
+
+    def __init__(self, path: str, row_group_rows: int = 10000):
+        self.pa, pq = _import_pyarrow()
+        self.schema = provision_schema(self.pa)
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not len(df):
+            return
+        self.pending.append(df)
+        self.pending_rows += len(df)
+        if self.pending_rows >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True)
+        self.pending, self.pending_rows = [], 0
+        arrays = []
+        for field in self.schema:
+            values = df[field.name] if field.name in df.columns else [None] * len(df)
+            if self.pa.types.is_dictionary(field.type):
+                arrays.append(self.pa.array(values, type=self.pa.string(), from_pandas=True).dictionary_encode())
+            else:
+                arrays.append(self.pa.array(values, type=field.type, from_pandas=True))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+class ProvisionCSVWriter:
+    """
+    Append parse_xml DataFrames to one CSV file; Text and References are written as Python lists.
+
+    Every DataFrame is written with the PROVISION_COLUMNS columns in their order, since
+    parse_xml only has the Part columns for Orders with schedule sections, and rows
+    appended under the first file's header must line up with it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not len(df):
+            return
+        df.reindex(columns=PROVISION_COLUMN_NAMES).to_csv(self.path, mode='w' if self.header else 'a',
+                                                          header=self.header, index=False)
+        self.header = False
+
+    def close(self) -> None:
+        if self.header:
+            # Nothing parsed: still leave an (empty) dataset behind
+            pd.DataFrame(columns=PROVISION_COLUMN_NAMES).to_csv(self.path, index=False)
+
+def open_provision_writer(path: str, output_format: str):
+    """A ProvisionCSVWriter or ProvisionParquetWriter for path"""
+    return ProvisionParquetWriter(path) if output_format == 'parquet' else ProvisionCSVWriter(path)
+
+def read_provisions(path: str) -> pd.DataFrame:
+    """Read a ProvisionParquetWriter file back into parse_xml's DataFrame shape"""
+    pa, pq = _import_pyarrow()
+    table = pq.read_table(path)
+    df = pd.DataFrame({
+        name: table.column(name).to_pylist() if type_name.startswith(('list', 'dictionary'))
+        else table.column(name).to_pandas()
+        for name, type_name in PROVISION_COLUMNS
+    })
+    df['References'] = [[tuple(reference[field] for field in REFERENCE_FIELDS) for reference in references]
+                        for references in df['References']]
+    return df
+
+def batch_main(args) -> int:
+    """
+    Parse every input file under the schedule policy, without prompting.
+
+    The provisions of all files are written to one consolidated CSV or Parquet file
+    (--output, --format), in input order, and with --output-dir also to one file per
+    input. Files that fail are logged and listed with their errors in the
+    --failures-report JSON file.
+    """
+    logger = logging.getLogger(__name__)
+    policy = policy_from_args(args)
+    files = xml_files(args.inputs)
+    output_file = args.output
+    if output_file is None and args.output_dir is None:
+        output_file = f"parsed_legislation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    cache = None if args.no_cache else open_parse_cache(args.cache_dir, args.cache_max_mb)
+    logger.info(f"Parsing {len(files)} files with {args.workers or os.cpu_count()} workers")
+
+    failures = []
+    provisions = 0
+    partial_file = output_file + '.partial' if output_file else None
+    writer = open_provision_writer(partial_file, args.format) if output_file else None
+    for xml_file, result in parse_files(files, policy, args.workers, args.streaming, cache, args.backend):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to parse {xml_file}: {str(result)}")
+            failures.append({'file': xml_file, 'error': f"{type(result).__name__}: {result}"})
+            continue
+        if args.output_dir:
+            per_file = os.path.join(args.output_dir,
+                                    os.path.splitext(os.path.basename(xml_file))[0] + '.' + args.format)
+            per_file_writer = open_provision_writer(per_file, args.format)
+            per_file_writer.write(result)
+            per_file_writer.close()
+        if writer:
+            writer.write(result)
+        provisions += len(result)
+
+    if writer:
+        writer.close()
+        os.replace(partial_file, output_file)
+        logger.info(f"Saved {provisions} provisions to {output_file}")
+
+    with open(args.failures_report, 'w', encoding='utf-8') as f:
+        json.dump(failures, f, indent=2)
+    logger.info(f"Parsed {len(files) - len(failures)} of {len(files)} files"
+                + (f"; failures listed in {args.failures_report}" if failures else ""))
+    return 1 if failures else 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Parse legislation.gov.uk XML into provision CSV or Parquet files. "
+                    "With no inputs, runs the interactive test script")
+    parser.add_argument('inputs', nargs='*', metavar='XML_FILE_DIR_OR_GLOB',
+                        help="XML files, directories or glob patterns to parse without prompting")
+    parser.add_argument('--policy', metavar='JSON_FILE',
+                        help="Schedule policy file: {\"include\": [...], \"exclude\": [...], \"include_unmatched\": false}")
+    parser.add_argument('--include', action='append', default=[], metavar='PATTERN',
+                        help="Extract schedules whose title matches this regular expression (repeatable)")
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help="Skip schedules whose title matches this regular expression, even if included (repeatable)")
+    parser.add_argument('--all-schedules', action='store_true',
+                        help="Also extract schedules matching no --include pattern")
+    parser.add_argument('--output', metavar='FILE',
+                        help="Consolidated provision dataset (default: parsed_legislation_<timestamp>.csv or "
+                             ".parquet unless --output-dir is given)")
+    parser.add_argument('--output-dir', help="Also write one file per parsed file to this directory")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="csv stores Text and References as Python list literals; parquet stores them as "
+                             "native lists, with Order/Schedule/Part names dictionary-encoded (needs pyarrow)")
+    parser.add_argument('--workers', type=int, help="Parse processes (default: one per CPU)")
+    parser.add_argument('--failures-report', default='parse_failures.json',
+                        help="JSON file listing the files that failed and why (default: parse_failures.json)")
+    parser.add_argument('--streaming', action='store_true', help="Parse with iterparse in bounded memory")
+    parser.add_argument('--backend', choices=['etree', 'lxml'], default='etree',
+                        help="XML library; lxml falls back to ElementTree when it is not installed (default: etree)")
+    parser.add_argument('--cache-dir', default='parse_cache',
+                        help="Reuse parses of unchanged files under the same policy from here (default: parse_cache)")
+    parser.add_argument('--cache-max-mb', type=int, default=1024,
+                        help="Evict the least recently used cached parses beyond this size (default: 1024)")
+    parser.add_argument('--no-cache', action='store_true', help="Parse every file, without reading or filling the cache")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.inputs:
+        sys.exit(batch_main(args))
     main()
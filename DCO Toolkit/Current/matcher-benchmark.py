@@ -0,0 +1,369 @@
+# matcher-benchmark.py
+#
+# Reproducible benchmark for dco-similarity-matcher.py.
+#
+#   python matcher-benchmark.py generate --orders 40 --output synthetic
+#   python matcher-benchmark.py run --corpus synthetic --baseline benchmark_baseline.json
+#
+# `generate` writes synthetic legislation.gov.uk-style DCO XML by mutating the
+# provisions of real Orders. `run` ingests a corpus into a throwaway Postgres
+# database, reports throughput, comparisons per article, peak RSS and recall
+# against a brute-force search, and exits non-zero if a tracked metric has
+# regressed against a saved baseline.
+
+import argparse
+import copy
+import importlib.util
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SEED_DIR = os.path.join(HERE, '..', 'Original', 'newfolderomg')
+
+NAMESPACES = {
+    'ns0': 'http://www.legislation.gov.uk/namespaces/legislation',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'ukm': 'http://www.legislation.gov.uk/namespaces/metadata'
+}
+
+# Tracked metrics and whether a higher value is better
+TRACKED_METRICS = {
+    'articles_per_second': True,
+    'comparisons_per_article': False,
+    'sql_round_trips_per_article': False,
+    'peak_rss_mb': False,
+    'recall': True
+}
+
+
+def load_matcher():
+    """Import dco-similarity-matcher.py, which cannot be imported by name"""
+    # The matcher imports parse_xml from the original toolkit
+    sys.path.append(os.path.join(HERE, '..', 'Original'))
+    spec = importlib.util.spec_from_file_location('dco_similarity_matcher',
+                                                  os.path.join(HERE, 'dco-similarity-matcher.py'))
+    matcher = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = matcher
+    spec.loader.exec_module(matcher)
+    return matcher
+
+
+def _register_namespaces(xml_file: str) -> None:
+    """Keep the seed document's namespace prefixes when writing synthetic files"""
+    for _, (prefix, uri) in ET.iterparse(xml_file, events=['start-ns']):
+        ET.register_namespace(prefix, uri)
+
+
+class SyntheticCorpusGenerator:
+    """
+    Builds synthetic DCOs from real ones.
+
+    Every synthetic Order takes the structure of a seed Order. Each provision is
+    either an exact copy of an earlier synthetic version of the same provision,
+    a near-duplicate of one (a fraction of words changed), or a fresh variant
+    of the seed provision with a heavy rewrite. The mix is controlled by the
+    exact and near-duplicate rates, and a fixed random seed makes corpora
+    reproducible.
+    """
+
+    def __init__(self, seed_files: List[str], exact_duplicate_rate: float = 0.2,
+                 near_duplicate_rate: float = 0.5, mutation_rate: float = 0.05,
+                 fresh_rewrite_rate: float = 0.4, random_seed: int = 1):
+        self.seed_files = seed_files
+        self.exact_duplicate_rate = exact_duplicate_rate
+        self.near_duplicate_rate = near_duplicate_rate
+        self.mutation_rate = mutation_rate
+        self.fresh_rewrite_rate = fresh_rewrite_rate
+        self.rng = random.Random(random_seed)
+
+        self.seed_trees = []
+        vocabulary = set()
+        for seed_file in seed_files:
+            _register_namespaces(seed_file)
+            tree = ET.parse(seed_file)
+            self.seed_trees.append(tree)
+            for text_elem in tree.getroot().iter(f"{{{NAMESPACES['ns0']}}}Text"):
+                vocabulary.update(''.join(text_elem.itertext()).split())
+        self.vocabulary = sorted(vocabulary)
+
+        # (seed index, P1group index) -> every synthetic version generated so far
+        self.provision_pool: Dict[tuple, List[List[str]]] = {}
+
+    def mutate(self, paragraphs: List[str], rate: float) -> List[str]:
+        """Substitute, delete or insert words at the given rate"""
+        mutated = []
+        for paragraph in paragraphs:
+            words = []
+            for word in paragraph.split():
+                roll = self.rng.random()
+                if roll >= rate:
+                    words.append(word)
+                elif roll < rate / 3:
+                    continue  # deletion
+                elif roll < 2 * rate / 3:
+                    words.append(self.rng.choice(self.vocabulary))  # substitution
+                else:
+                    words.extend([word, self.rng.choice(self.vocabulary)])  # insertion
+            mutated.append(' '.join(words))
+        return mutated
+
+    def generate_order(self, index: int, year: int, number: int) -> ET.ElementTree:
+        seed_index = index % len(self.seed_trees)
+        tree = copy.deepcopy(self.seed_trees[seed_index])
+        root = tree.getroot()
+
+        title = root.find('.//dc:title', NAMESPACES)
+        title.text = f"The Synthetic Project {index + 1} Development Consent Order {year}"
+        root.find('.//ukm:Year', NAMESPACES).set('Value', str(year))
+        root.find('.//ukm:Number', NAMESPACES).set('Value', str(number))
+
+        for p1_index, p1group in enumerate(root.iter(f"{{{NAMESPACES['ns0']}}}P1group")):
+            text_elems = p1group.findall('.//ns0:Text', NAMESPACES)
+            seed_paragraphs = [''.join(t.itertext()) for t in text_elems]
+            pool = self.provision_pool.setdefault((seed_index, p1_index), [])
+
+            roll = self.rng.random()
+            if pool and roll < self.exact_duplicate_rate:
+                paragraphs = list(self.rng.choice(pool))
+            elif pool and roll < self.exact_duplicate_rate + self.near_duplicate_rate:
+                paragraphs = self.mutate(self.rng.choice(pool), self.mutation_rate)
+            else:
+                paragraphs = self.mutate(seed_paragraphs, self.fresh_rewrite_rate)
+            pool.append(paragraphs)
+
+            for text_elem, paragraph in zip(text_elems, paragraphs):
+                for child in list(text_elem):
+                    text_elem.remove(child)
+                text_elem.text = paragraph
+
+        return tree
+
+    def generate(self, output_dir: str, orders: int, start_year: int = 2010,
+                 orders_per_year: int = 20) -> List[str]:
+        """Write synthetic Orders named YEAR_NUMBER.xml, in chronological order"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for index in range(orders):
+            year = start_year + index // orders_per_year
+            number = index % orders_per_year + 1
+            path = os.path.join(output_dir, f"{year}_{number}.xml")
+            self.generate_order(index, year, number).write(path, encoding='utf-8', xml_declaration=True)
+            paths.append(path)
+        logging.info(f"Generated {len(paths)} synthetic Orders in {output_dir}")
+        return paths
+
+
+def corpus_files(corpus_dir: str) -> List[str]:
+    files = sorted(os.listdir(corpus_dir),
+                   key=lambda x: (int(x.split('_')[0]), int(x.split('_')[1].split('.')[0])))
+    return [os.path.join(corpus_dir, f) for f in files if f.endswith('.xml')]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process or any parse worker, in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024  # ru_maxrss is in KB on Linux
+
+
+def brute_force_recall(matcher, cur, sample_size: int, threshold: float, random_seed: int) -> float:
+    """
+    Fraction of (source article, target order) pairs whose best brute-force match
+    scores at least `threshold` where the matcher stored that best score.
+
+    Orders are ingested in order_id order in a fresh database, so each article
+    is checked against the Orders with lower order_ids, as the matcher saw them.
+    """
+    all_articles = matcher.fetch_articles(cur, """
+        SELECT article_id, article_text, order_id, title_hash, category, word_count, title_words, hash,
+            provision_kind, schedule_type
+        FROM articles
+        ORDER BY order_id, article_id
+    """)
+    articles_by_order = {}
+    for article in all_articles:
+        articles_by_order.setdefault(article.order_id, []).append(article)
+
+    first_order = min(articles_by_order) if articles_by_order else None
+    sources = [article for article in all_articles if article.order_id != first_order]
+    rng = random.Random(random_seed)
+    sample = rng.sample(sources, min(sample_size, len(sources)))
+
+    cur.execute("SELECT source_article_id, target_order_id, similarity_score FROM similarities")
+    stored = {(source_id, target_order_id): score for source_id, target_order_id, score in cur.fetchall()}
+
+    pairs = 0
+    found = 0
+    for source in sample:
+        for target_order_id, targets in articles_by_order.items():
+            if target_order_id >= source.order_id:
+                continue
+            best = max(matcher.score_articles(source, target)[0] for target in targets)
+            if best < threshold:
+                continue
+            pairs += 1
+            if stored.get((source.id, target_order_id), 0) >= best - 1e-6:
+                found += 1
+
+    return found / pairs if pairs else 1.0
+
+
+def run_benchmark(corpus_dir: str, recall_sample: int, recall_threshold: float,
+                  prefetch: int, parse_workers: int, keep_database: bool, random_seed: int,
+                  sqlite: bool = False) -> Dict:
+    matcher = load_matcher()
+    file_paths = corpus_files(corpus_dir)
+    database = f"dcos_bench_{os.getpid()}"
+
+    if sqlite:
+        database = os.path.join(tempfile.gettempdir(), f"{database}.db")
+        conn, cur = matcher.setup_sqlite_tables(database)
+    else:
+        matcher.create_database(database)
+        conn, cur = matcher.setup_tables(database)
+    try:
+        sink = matcher.MetricsSink()
+        start = time.perf_counter()
+        matcher.run_pipeline(file_paths, conn, cur, prefetch=prefetch, workers=parse_workers, sink=sink)
+        wall_seconds = time.perf_counter() - start
+
+        recall = brute_force_recall(matcher, cur, recall_sample, recall_threshold, random_seed)
+    finally:
+        cur.close()
+        conn.close()
+        if keep_database:
+            logging.info(f"Kept benchmark database {database}")
+        elif sqlite:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database + suffix):
+                    os.remove(database + suffix)
+        else:
+            admin = matcher.connect_database("postgres")
+            admin.set_isolation_level(matcher.ISOLATION_LEVEL_AUTOCOMMIT)
+            admin_cur = admin.cursor()
+            admin_cur.execute(f'DROP DATABASE IF EXISTS "{database}"')
+            admin_cur.close()
+            admin.close()
+
+    articles = sink.total_counters.get('articles', 0)
+    return {
+        'orders': len(file_paths),
+        'articles': articles,
+        'wall_seconds': round(wall_seconds, 3),
+        'articles_per_second': articles / wall_seconds if wall_seconds else 0.0,
+        'comparisons_per_article': (sink.total_counters.get('levenshtein_comparisons', 0)
+                                    + sink.total_counters.get('definition_comparisons', 0)) / articles if articles else 0.0,
+        'candidates_per_article': sink.total_counters.get('candidates', 0) / articles if articles else 0.0,
+        'sql_round_trips_per_article': sink.total_counters.get('sql_round_trips', 0) / articles if articles else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'recall': recall,
+        'stage_seconds': sink.total_stage_seconds
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Tracked metrics that are worse than the baseline by more than `tolerance` (relative)"""
+    regressions = []
+    for metric, higher_is_better in TRACKED_METRICS.items():
+        if metric not in baseline or metric not in report:
+            continue
+        expected, actual = baseline[metric], report[metric]
+        if higher_is_better:
+            regressed = actual < expected * (1 - tolerance)
+        else:
+            regressed = actual > expected * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{metric}: {actual:.4g} (baseline {expected:.4g})")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the DCO similarity matcher on a synthetic corpus")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Write a synthetic DCO corpus")
+    generate.add_argument('--seed-dir', default=DEFAULT_SEED_DIR,
+                          help="Directory of real DCO XML files to mutate")
+    generate.add_argument('--output', required=True, help="Directory for the synthetic XML files")
+    generate.add_argument('--orders', type=int, default=40, help="Number of synthetic Orders")
+    generate.add_argument('--exact-duplicate-rate', type=float, default=0.2,
+                          help="Share of provisions copied unchanged from an earlier synthetic Order")
+    generate.add_argument('--near-duplicate-rate', type=float, default=0.5,
+                          help="Share of provisions copied with light edits from an earlier synthetic Order")
+    generate.add_argument('--mutation-rate', type=float, default=0.05,
+                          help="Share of words edited in a near-duplicate")
+    generate.add_argument('--random-seed', type=int, default=1)
+
+    run = commands.add_parser('run', help="Ingest a corpus into a throwaway database and report metrics")
+    run.add_argument('--corpus', required=True, help="Directory of XML files named YEAR_NUMBER.xml")
+    run.add_argument('--recall-sample', type=int, default=200,
+                     help="Number of articles checked against brute force")
+    run.add_argument('--recall-threshold', type=float, default=70.0,
+                     help="Brute-force similarity a pair needs before it counts towards recall")
+    run.add_argument('--prefetch', type=int, default=2)
+    run.add_argument('--parse-workers', type=int, default=1)
+    run.add_argument('--keep-database', action='store_true', help="Keep the benchmark database afterwards")
+    run.add_argument('--sqlite', action='store_true',
+                     help="Benchmark the embedded SQLite backend in a temporary file instead of Postgres")
+    run.add_argument('--random-seed', type=int, default=1)
+    run.add_argument('--report', help="Write the report to this JSON file")
+    run.add_argument('--baseline', help="Fail if a tracked metric regressed against this report")
+    run.add_argument('--tolerance', type=float, default=0.1,
+                     help="Allowed relative regression before a run fails")
+    run.add_argument('--save-baseline', action='store_true', help="Write the report to --baseline")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.command == 'generate':
+        seed_files = sorted(os.path.join(args.seed_dir, f) for f in os.listdir(args.seed_dir) if f.endswith('.xml'))
+        generator = SyntheticCorpusGenerator(
+            seed_files,
+            exact_duplicate_rate=args.exact_duplicate_rate,
+            near_duplicate_rate=args.near_duplicate_rate,
+            mutation_rate=args.mutation_rate,
+            random_seed=args.random_seed
+        )
+        generator.generate(args.output, args.orders)
+        return 0
+
+    report = run_benchmark(args.corpus, args.recall_sample, args.recall_threshold,
+                           args.prefetch, args.parse_workers, args.keep_database, args.random_seed,
+                           sqlite=args.sqlite)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        if regressions:
+            for regression in regressions:
+                logging.error(f"Regression - {regression}")
+            return 1
+        logging.info("No tracked metric regressed")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
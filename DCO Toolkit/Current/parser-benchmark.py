@@ -0,0 +1,256 @@
+# parser-benchmark.py
+#
+# Micro-benchmark for legislation-parser.py on the newfolderomg fixtures.
+#
+#   python parser-benchmark.py
+#   python parser-benchmark.py --repeat 20 --scales 1 4 16 --report parser_benchmark.json
+#
+# Each fixture is parsed in every mode - the tree mode with the structure index,
+# the tree mode with the per-lookup XPath searches it replaced, and the streaming
+# mode - and the median time per parse is reported. --scales repeats each
+# fixture's Body that many times so the growth of parse cost with document size
+# can be seen; with the index, time per provision should stay flat. --clean-text
+# also times LegislationXMLParser.clean_text alone over the text of every Text
+# element in the fixtures. --backends etree lxml runs every mode with each XML
+# backend, and also times XMLDataExtractor.parse_xml with each.
+#
+#   python parser-benchmark.py --check-extractor
+#
+# checks instead that XMLDataExtractor and LegislationXMLParser read the same
+# Order year and SI number from each fixture, and from a copy of it with numbered
+# schedules appended (schedule numbers once overwrote the SI number in the
+# extractor). Exits 1 on any difference.
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ORIGINAL_DIR = os.path.join(HERE, '..', 'Original')
+DEFAULT_FIXTURE_DIR = os.path.join(ORIGINAL_DIR, 'newfolderomg')
+
+# mode name -> (LegislationXMLParser keyword arguments, parse_xml keyword arguments)
+MODES = {
+    'tree_indexed': ({'use_structure_index': True}, {}),
+    'tree_xpath': ({'use_structure_index': False}, {}),
+    'streaming': ({'use_structure_index': True}, {'streaming': True}),
+}
+
+
+def load_parser_module():
+    """Import legislation-parser.py, which cannot be imported by name"""
+    spec = importlib.util.spec_from_file_location('legislation_parser', os.path.join(HERE, 'legislation-parser.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    # Keep the parser's per-file progress messages out of the benchmark output
+    logging.getLogger(spec.name).setLevel(logging.WARNING)
+    return module
+
+
+def scale_fixture(xml_file: str, scale: int, output_dir: str) -> str:
+    """Write a copy of xml_file with its Body content repeated `scale` times"""
+    if scale == 1:
+        return xml_file
+    with open(xml_file, 'r', encoding='utf-8') as f:
+        document = f.read()
+    body_start = re.search(r'<Body[^>]*>', document).end()
+    body_end = document.index('</Body>')
+    scaled = document[:body_start] + document[body_start:body_end] * scale + document[body_end:]
+    path = os.path.join(output_dir, f'x{scale}_' + os.path.basename(xml_file))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(scaled)
+    return path
+
+
+# Appended by schedule_fixture: a lettered schedule last, as the SI number once took the last schedule's number
+SCHEDULES_FIXTURE = """<Schedules><Title>SCHEDULES</Title>
+<Schedule id="schedule-1"><Number>SCHEDULE 1</Number><TitleBlock><Title>Authorised development</Title></TitleBlock>
+<ScheduleBody><P1group><Title>Works</Title><P1><Pnumber>1</Pnumber><P1para><Text>Work No. 1.</Text></P1para></P1></P1group></ScheduleBody></Schedule>
+<Schedule id="schedule-A"><Number>SCHEDULE A</Number><TitleBlock><Title>Protective provisions</Title></TitleBlock>
+<ScheduleBody><Part><Number>PART 1</Number><Title>For the protection of electricity undertakers</Title>
+<P1group><Title>Application</Title><P1><Pnumber>1</Pnumber><P1para><Text>This Part applies.</Text></P1para></P1></P1group>
+</Part></ScheduleBody></Schedule>
+</Schedules>"""
+
+
+def schedule_fixture(xml_file: str, output_dir: str) -> str:
+    """Write a copy of xml_file with SCHEDULES_FIXTURE after its Body"""
+    with open(xml_file, 'r', encoding='utf-8') as f:
+        document = f.read()
+    body_end = document.index('</Body>') + len('</Body>')
+    path = os.path.join(output_dir, 'schedules_' + os.path.basename(xml_file))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(document[:body_end] + SCHEDULES_FIXTURE + document[body_end:])
+    return path
+
+
+def check_extractor(fixture_dir: str) -> List[str]:
+    """
+    Differences between the Order year and SI number that XMLDataExtractor and
+    LegislationXMLParser read from each fixture and its schedule_fixture copy.
+    """
+    parser_module = load_parser_module()
+    if ORIGINAL_DIR not in sys.path:
+        sys.path.append(ORIGINAL_DIR)
+    import XMLDataExtractor
+    fixtures = sorted(os.path.join(fixture_dir, name) for name in os.listdir(fixture_dir) if name.endswith('.xml'))
+    policy = parser_module.SchedulePolicy(include_unmatched=True)
+    differences = []
+    with tempfile.TemporaryDirectory(prefix='parser_check_') as schedules_dir:
+        for xml_file in fixtures + [schedule_fixture(fixture, schedules_dir) for fixture in fixtures]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                df = XMLDataExtractor.parse_xml(xml_file)
+                records = list(parser_module.LegislationXMLParser().iter_provisions(xml_file, schedule_policy=policy))
+            # Compared as text: the extractor keeps the metadata's strings, the parser converts them to int
+            extracted = {(str(year), str(number)) for year, number in zip(df['Year'], df['No.'])}
+            parsed = {(str(record.year), str(record.number)) for record in records}
+            if extracted != parsed:
+                differences.append(f"{os.path.basename(xml_file)}: XMLDataExtractor (year, number) {sorted(extracted)}, "
+                                   f"LegislationXMLParser {sorted(parsed)}")
+    return differences
+
+
+def time_parse(parser_module, xml_file: str, mode: str, repeat: int, backend: str = 'etree') -> Dict:
+    parser_kwargs, parse_kwargs = MODES[mode]
+    parser_kwargs = dict(parser_kwargs, backend=backend)
+    # Every schedule, so parses never prompt
+    policy = parser_module.SchedulePolicy(include_unmatched=True)
+    timings = []
+    provisions = 0
+    for _ in range(repeat):
+        parser = parser_module.LegislationXMLParser(**parser_kwargs)
+        start = time.perf_counter()
+        # parse_xml prints the Order title
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = parser.parse_xml(xml_file, schedule_policy=policy, **parse_kwargs)
+        timings.append(time.perf_counter() - start)
+        provisions = len(df)
+    median = statistics.median(timings)
+    return {
+        'provisions': provisions,
+        'median_ms': round(median * 1000, 2),
+        'ms_per_provision': round(median * 1000 / provisions, 4) if provisions else None
+    }
+
+
+def time_clean_text(parser_module, fixtures: List[str], repeat: int) -> Dict:
+    """Median time for clean_text over every Text element's text in the fixtures"""
+    texts = [''.join(text.itertext())
+             for fixture in fixtures
+             for text in ET.parse(fixture).getroot().iter(f"{{{parser_module.LegislationXMLParser.NAMESPACES['ns0']}}}Text")]
+    parser = parser_module.LegislationXMLParser()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            parser.clean_text(text)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    characters = sum(len(text) for text in texts)
+    return {
+        'texts': len(texts),
+        'characters': characters,
+        'median_ms': round(median * 1000, 2),
+        'mb_per_second': round(characters / median / 1e6, 2)
+    }
+
+
+def time_extractor(xml_file: str, repeat: int, backend: str) -> Dict:
+    """Median time for XMLDataExtractor.parse_xml, the matcher's parser"""
+    if ORIGINAL_DIR not in sys.path:
+        sys.path.append(ORIGINAL_DIR)
+    import XMLDataExtractor
+    timings = []
+    provisions = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = XMLDataExtractor.parse_xml(xml_file, backend=backend)
+        timings.append(time.perf_counter() - start)
+        provisions = len(df)
+    median = statistics.median(timings)
+    return {
+        'provisions': provisions,
+        'median_ms': round(median * 1000, 2),
+        'ms_per_provision': round(median * 1000 / provisions, 4) if provisions else None
+    }
+
+
+def run_benchmark(fixture_dir: str, repeat: int, scales: List[int], modes: List[str], clean_text: bool = False,
+                  backends: List[str] = ('etree',)) -> Dict:
+    parser_module = load_parser_module()
+    fixtures = sorted(os.path.join(fixture_dir, name) for name in os.listdir(fixture_dir) if name.endswith('.xml'))
+    report = {'repeat': repeat, 'results': []}
+    if clean_text:
+        report['clean_text'] = time_clean_text(parser_module, fixtures, repeat)
+        logging.info(f"clean_text: {report['clean_text']['median_ms']}ms for {report['clean_text']['texts']} texts")
+    with tempfile.TemporaryDirectory(prefix='parser_benchmark_') as scaled_dir:
+        for scale in scales:
+            for fixture in fixtures:
+                xml_file = scale_fixture(fixture, scale, scaled_dir)
+                runs = [(mode, backend) for backend in backends for mode in modes]
+                if len(backends) > 1:
+                    runs += [('extractor', backend) for backend in backends]
+                for mode, backend in runs:
+                    if mode == 'extractor':
+                        result = time_extractor(xml_file, repeat, backend)
+                    else:
+                        result = time_parse(parser_module, xml_file, mode, repeat, backend)
+                    result.update({'fixture': os.path.basename(fixture), 'scale': scale, 'mode': mode,
+                                   'backend': backend, 'size_kb': os.path.getsize(xml_file) // 1024})
+                    report['results'].append(result)
+                    logging.info(f"{result['fixture']} x{scale} {mode} ({backend}): {result['median_ms']}ms "
+                                 f"for {result['provisions']} provisions")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-benchmark for legislation-parser.py")
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURE_DIR, help="Directory of legislation XML files")
+    parser.add_argument('--repeat', type=int, default=10, help="Parses per fixture and mode; the median is reported")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1],
+                        help="Body repetition factors, to show how parse time grows with document size")
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES))
+    parser.add_argument('--backends', nargs='+', choices=['etree', 'lxml'], default=['etree'],
+                        help="XML backends to run each mode with; more than one also times XMLDataExtractor")
+    parser.add_argument('--clean-text', action='store_true', help="Also time clean_text on the fixtures' text")
+    parser.add_argument('--report', help="Write the report to this JSON file")
+    parser.add_argument('--check-extractor', action='store_true',
+                        help="Check that XMLDataExtractor reads the same Order year and SI number as the parser, "
+                             "with and without schedules, instead of benchmarking")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.check_extractor:
+        differences = check_extractor(args.fixtures)
+        for difference in differences:
+            logging.error(difference)
+        return 1 if differences else 0
+    report = run_benchmark(args.fixtures, args.repeat, args.scales, args.modes, args.clean_text, args.backends)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import json
+import os
+import pandas as pd
+
+
+class CorpusStore:
+    """
+    Append-only store of parsed provisions, replacing the re-pickled base.pkl.
+
+    Each appended DataFrame is written once as its own pickle segment and recorded
+    in index.jsonl with the Orders it holds and its row offset, so adding an Order
+    never rewrites the rest of the corpus. The whole corpus is read once when the
+    store is opened and kept in memory as records.
+    """
+
+    def __init__(self, directory='corpus', seed_pickle='base.pkl'):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.jsonl')
+        self.records = []
+        self.texts = []
+        self.index = []
+        os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.index.append(entry)
+                        self._load(pd.read_pickle(os.path.join(directory, entry['segment'])))
+        elif seed_pickle and os.path.exists(seed_pickle):
+            # First run after base.pkl: take it over as the first segment
+            self.append(pd.read_pickle(seed_pickle))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def orders(self):
+        return {order for entry in self.index for order in entry['orders']}
+
+    def _load(self, df):
+        df = df.reset_index(drop=True)
+        self.records.extend(df.itertuples(index=False))
+        self.texts.extend(df['Text'])
+
+    def append(self, df):
+        """Write df as a new segment and add it to the in-memory corpus"""
+        segment = '{:06d}.pkl'.format(len(self.index) + 1)
+        segment_path = os.path.join(self.directory, segment)
+        df.to_pickle(segment_path + '.partial')
+        os.replace(segment_path + '.partial', segment_path)
+
+        # A segment only becomes part of the corpus once its index line is written
+        entry = {
+            'segment': segment,
+            'orders': sorted(df['Order'].unique().tolist()),
+            'first_row': len(self.records),
+            'rows': len(df)
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.index.append(entry)
+        self._load(df)
@@ -0,0 +1,68 @@
+import re
+
+# InternalLink Ref values: article-8-1-a, schedule-2, schedule-2-paragraph-7, schedule-2-part-1-paragraph-3
+INTERNAL_REF = re.compile(r'^(?:article-(?P<article>[^-]+)'
+                          r'|schedule-(?P<schedule>[^-]+)(?:-part-(?P<part>[^-]+))?(?:-paragraph-(?P<paragraph>[^-]+))?)'
+                          r'(?:-(?P<subref>.+))?$')
+
+# The fields of a reference tuple, in order
+REFERENCE_FIELDS = ['kind', 'schedule_number', 'part_number', 'article_number', 'subref', 'ref', 'text']
+
+
+def citation_reference(uri, text):
+    """The reference tuple for a Citation of other legislation, with its URI as ref"""
+    return ('legislation', '', '', '', '', uri, text)
+
+
+def reference_items(links, namespace_uri, link_text):
+    """
+    The references among links, in document order.
+
+    links are elements, e.g. every element of a provision; InternalLinks to a provision
+    of the same Order and Citations become reference tuples (REFERENCE_FIELDS), with
+    their text from link_text(element), and each FootnoteRef is left as ('footnote', id)
+    for resolve_references. kind is 'article' or 'schedule' for an InternalLink, and the
+    Part of a schedule paragraph is kept as part_number ('1' for schedule-2-part-1-...).
+    """
+    internal_link = '{%s}InternalLink' % namespace_uri
+    citation_tag = '{%s}Citation' % namespace_uri
+    footnote_ref = '{%s}FootnoteRef' % namespace_uri
+    items = []
+    for link in links:
+        if link.tag == internal_link:
+            ref = link.get('Ref', '')
+            match = INTERNAL_REF.match(ref)
+            if match is None:
+                continue
+            if match.group('article'):
+                items.append(('article', '', '', match.group('article'), match.group('subref') or '',
+                              ref, link_text(link)))
+            else:
+                items.append(('schedule', match.group('schedule'), match.group('part') or '',
+                              match.group('paragraph') or '', match.group('subref') or '', ref, link_text(link)))
+        elif link.tag == citation_tag:
+            items.append(citation_reference(link.get('URI', ''), link_text(link)))
+        elif link.tag == footnote_ref:
+            items.append(('footnote', link.get('Ref')))
+    return items
+
+
+def resolve_references(items, footnote_citations, link_text):
+    """
+    Expand the footnote items of reference_items into the Citations of those footnotes
+    (footnote_citations maps a footnote id to its Citation elements) and drop repeated
+    references; references differing only in their text are repeats.
+    """
+    references = []
+    seen = set()
+    for item in items:
+        if item[0] == 'footnote':
+            expanded = [citation_reference(citation.get('URI', ''), link_text(citation))
+                        for citation in footnote_citations.get(item[1], [])]
+        else:
+            expanded = [item]
+        for reference in expanded:
+            if reference[:-1] not in seen:
+                seen.add(reference[:-1])
+                references.append(reference)
+    return references
@@ -1,4 +1,5 @@
 from XMLDataExtractor import parse_xml
+from CorpusStore import CorpusStore
 import gc
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
@@ -7,6 +8,7 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import os
 import heapq
+from operator import itemgetter
 import sys
 from fuzzywuzzy import fuzz
 import Levenshtein
@@ -29,36 +31,39 @@ for filename in (os.listdir(directory)):
     files.append(filename)
 sorted_files = sorted(files, key=lambda x: (int(x.split('_')[0]), int(x.split('_')[1].split('.')[0])))
 
+# Corpus of every Order matched so far, read once; each new Order is appended as a segment
+corpus = CorpusStore('corpus')
+
 for filename in sorted_files:
     file = os.path.join(directory, filename)
     if os.path.isfile(file):
         
-        df = parse_xml(file)
-        # print(df.iloc[-1,4])
-
+        newdf = parse_xml(file)
+        order_names = ', '.join(sorted(set(newdf['Order'])))
+        # print(newdf.iloc[-1,4])
 
-        df.to_pickle('new.pkl')
-        del df
+        # An Order matched on an earlier run is already in the corpus; matching it again would repeat its rows
+        if set(newdf['Order']) & corpus.orders:
+            print(order_names, "already in corpus, skipped")
+            del newdf
+            continue
 
         
         # print("working...")
 
         Text = open("DCO_Similarity.csv", 'a', encoding='utf-8')
 
-        data = []
-
-
-        db = pd.read_pickle('base.pkl')
-        newdf = pd.read_pickle('new.pkl')
-
-        db.reset_index(drop=True, inplace=True)
-
         for idx, row in enumerate(newdf.itertuples(), start=0):
-            # Get the top 5 most similar articles using Levenshtein similarity
-            similar_indices = sorted(range(len(db['Text'])), key=lambda i: levenshtein_similarity(row.Text, db['Text'][i]), reverse=True)[:5]
+            # Get the top 5 most similar articles using Levenshtein similarity, scoring each article once
+            top_matches = heapq.nlargest(
+                5,
+                ((levenshtein_similarity(row.Text, text), i) for i, text in enumerate(corpus.texts)),
+                key=itemgetter(0)
+            )
             
-            for i in similar_indices:
-                similarity_score = levenshtein_similarity(row.Text, db['Text'][i])*100
+            for score, i in top_matches:
+                similarity_score = score*100
+                match = corpus.records[i]
                 # print(similarity_score)
 
                 if similarity_score >= 0:  # Customize the similarity threshold as needed (70 is used as an example)
@@ -68,23 +73,21 @@ for filename in sorted_files:
                             row.Order,
                             row.Title,
                             row.Art,
-                            db.loc[i, 'Art'],
-                            db.loc[i, 'Title'],
-                            db.loc[i, 'Order'],
+                            match.Art,
+                            match.Title,
+                            match.Order,
                             row.Link,
-                            db.loc[i, 'Link']
+                            match.Link
                         ),
                         file=Text
                     )
             print("Article", row.Art, row.Title, "complete...")
         
-        print(row.Order, "Completed")
+        print(order_names, "Completed")
 
         Text.close()
 
-        cat = pd.concat([db, newdf], ignore_index=True)
-        cat.to_pickle('base.pkl')
+        corpus.append(newdf)
 
         del newdf
-        del db
         gc.collect()
@@ -1,6 +1,12 @@
 import re
 import pandas as pd
 import xml.etree.ElementTree as ET
+from LegislationReferences import reference_items, resolve_references
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 def replace_strings(row):
     ordername = row['Order']
@@ -10,15 +16,8 @@ def replace_strings(row):
     return replaced_text
 
 def extract_text(element):
-    text_content = ""
-    if element.text:
-        text_content += element.text
-    for child in element:
-        child_text = extract_text(child)
-        text_content += child_text
-    if element.tail:
-        text_content += element.tail
-    return text_content.strip()
+    # Only the ends are stripped: the whitespace around inline elements (citations, links) separates words
+    return ''.join(element.itertext()).strip()
 
 def assess_interpretation_text(element):
     interpretation_data = []
@@ -39,9 +38,73 @@ def assess_interpretation_text(element):
 
     return interpretation_data
 
-def parse_xml(xml_file):
+def extract_definitions(element, namespace):
+    # (term, definition text) for every item in the element's definition lists
+    definitions = []
+    for definition_list in element.iterfind('.//ns0:UnorderedList[@Class="Definition"]', namespace):
+        for item in definition_list.findall('./ns0:ListItem', namespace):
+            term = item.find('.//ns0:Term', namespace)
+            if term is None:
+                continue
+            text = ' '.join(extract_text(text_element) for text_element in item.findall('.//ns0:Text', namespace))
+            definitions.append((''.join(term.itertext()).strip(), text))
+    return definitions
+
+def footnote_citations(root, namespace):
+    # Footnote id -> Citations in that footnote. Citations of other legislation sit in
+    # the Footnotes section and are reached from the provision through a FootnoteRef.
+    citations = {}
+    for footnote in root.iterfind('.//ns0:Footnote', namespace):
+        citations[footnote.get('id')] = footnote.findall('.//ns0:Citation', namespace)
+    return citations
+
+def extract_references(element, namespace, citations=None):
+    # (kind, schedule number, part number, article number, sub-reference, ref, link text)
+    # for each distinct InternalLink and Citation the element refers to, in document
+    # order, as in legislation-parser.py (see LegislationReferences)
+    def link_text(link):
+        return ''.join(link.itertext()).strip()
+    return resolve_references(reference_items(element.iter(), namespace['ns0'], link_text), citations or {}, link_text)
+
+# The hot lookups of parse_xml: name -> (ElementTree path, lxml XPath, first match only)
+SELECTORS = {
+    'schedules': ('.//ns0:Schedule', 'descendant::ns0:Schedule', False),
+    'first_number': ('.//ns0:Number', 'descendant::ns0:Number[1]', True),
+    'first_title': ('.//ns0:Title', 'descendant::ns0:Title[1]', True),
+    'p1groups': ('.//ns0:P1group', 'descendant::ns0:P1group', False),
+    'title': ('./ns0:Title', 'ns0:Title[1]', True),
+    'pnumber': ('./ns0:P1/ns0:Pnumber', '(ns0:P1/ns0:Pnumber)[1]', True),
+    'texts': ('.//ns0:Text', 'descendant::ns0:Text', False),
+}
+# lxml XPath objects for SELECTORS, compiled on first use
+LXML_SELECTORS = {}
+
+def selectors(backend, namespace):
+    # name -> function(element) returning the first match (or None) or all matches.
+    # ElementTree re-reads its path on every call; lxml evaluates precompiled XPath.
+    if backend == 'lxml':
+        if not LXML_SELECTORS:
+            LXML_SELECTORS.update({name: lxml_etree.XPath(xpath, namespaces=namespace)
+                                   for name, (_, xpath, _) in SELECTORS.items()})
+        return {name: (lambda element, xpath=LXML_SELECTORS[name]: next(iter(xpath(element)), None)) if first
+                else LXML_SELECTORS[name]
+                for name, (_, _, first) in SELECTORS.items()}
+    return {name: (lambda element, path=path: element.find(path, namespace)) if first
+            else (lambda element, path=path: element.findall(path, namespace))
+            for name, (path, _, first) in SELECTORS.items()}
+
+def parse_xml(xml_file, backend='etree'):
+    # backend 'lxml' parses with lxml and precompiled XPath selectors, for the same
+    # DataFrame; it falls back to ElementTree when lxml is not installed
+    if backend == 'lxml' and lxml_etree is None:
+        backend = 'etree'
+
     # Parse the XML data 
-    tree = ET.parse(xml_file)
+    if backend == 'lxml':
+        # Drop comments and processing instructions, as ElementTree does
+        tree = lxml_etree.parse(xml_file, lxml_etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True))
+    else:
+        tree = ET.parse(xml_file)
     root = tree.getroot()
     xml_root = root
 
@@ -51,6 +114,7 @@ def parse_xml(xml_file):
                  'ukm': 'http://www.legislation.gov.uk/namespaces/metadata'}#,
                  #'ukm': 'http://www.legislation.gov.uk/namespaces/ukm'}
     xxx = {'ukm': 'http://www.legislation.gov.uk/namespaces/ukm'}
+    select = selectors(backend, namespace)
 
     # Initialize lists to store extracted data
     orders = []
@@ -59,31 +123,62 @@ def parse_xml(xml_file):
     titles = []
     pnumbers = []
     text_contents = []
+    schedules = []
+    schedule_names = []
+    part_numbers = []
+    part_titles = []
+    definitions = []
+    references = []
+
+    citations = footnote_citations(root, namespace)
+
+    # The Order's title, year and number are the same for every P1group, so they are
+    # looked up once rather than with a scan of the whole document per P1group
+    order = root.find('.//dc:title', namespaces={'dc': 'http://purl.org/dc/elements/1.1/'}).text.strip()
+    year = root.find('.//ukm:Year', namespace).get('Value')
+    number = root.find('.//ukm:Number', namespace).get('Value')
+
+    # Schedule and Part enclosing each schedule P1group, as in legislation-parser.py.
+    # Body P1groups are not in the map.
+    schedule_context = {}
+    for schedule in select['schedules'](root):
+        schedule_number = select['first_number'](schedule)
+        if schedule_number is None:
+            continue
+        schedule_no = ''.join(schedule_number.itertext()).strip().replace('SCHEDULE ', '')
+        schedule_title = select['first_title'](schedule)
+        name = ''.join(schedule_title.itertext()).strip() if schedule_title is not None else ''
+        for p1group in schedule.iter('{%s}P1group' % namespace['ns0']):
+            schedule_context[p1group] = (schedule_no, name, None, None)
+        for part in schedule.iter('{%s}Part' % namespace['ns0']):
+            part_number = part.find('./ns0:Number', namespace)
+            part_title = part.find('./ns0:Title', namespace)
+            part_info = (''.join(part_number.itertext()).strip() if part_number is not None else None,
+                         ''.join(part_title.itertext()).strip() if part_title is not None else None)
+            for p1group in part.iter('{%s}P1group' % namespace['ns0']):
+                schedule_context[p1group] = (schedule_no, name) + part_info
 
     # Iterate through P1 groups and extract required information
-    for p1group in root.findall('.//ns0:P1group', namespace):
-        order = root.find('.//dc:title', namespaces={'dc': 'http://purl.org/dc/elements/1.1/'}).text.strip()
+    for p1group in select['p1groups'](root):
         orders.append(order)
         # print(order)
 
 
         
-        # Extract ukm:Year and ukm:Number
-        year = root.find('.//ukm:Year', namespace).get('Value')
-        number = root.find('.//ukm:Number', namespace).get('Value')
+        # ukm:Year and ukm:Number
         years.append(year)
         numbers.append(number)
         
         # Extract ns0:Title
-        title = p1group.find('./ns0:Title', namespace).text.strip()
+        title = select['title'](p1group).text.strip()
         titles.append(title)
         
         # Extract ns0:Pnumber
-        pnumber = p1group.find('./ns0:P1/ns0:Pnumber', namespace).text.strip()
+        pnumber = select['pnumber'](p1group).text.strip()
         pnumbers.append(pnumber)
         
         # Extract all ns0:Text elements and concatenate their text content
-        text_elements = p1group.findall('.//ns0:Text', namespace)
+        text_elements = select['texts'](p1group)
         try:
             # text_content = ' '.join([extract_text(text_element) for text_element in text_elements])
             paragraphs = [extract_text(text_element) for text_element in text_elements]
@@ -93,6 +188,15 @@ def parse_xml(xml_file):
             text_contents.append("Failed")
             # print(text_contents)
 
+        definitions.append(extract_definitions(p1group, namespace))
+        references.append(extract_references(p1group, namespace, citations))
+
+        schedule, schedule_name, part_number, part_title = schedule_context.get(p1group, (None, None, None, None))
+        schedules.append(schedule)
+        schedule_names.append(schedule_name)
+        part_numbers.append(part_number)
+        part_titles.append(part_title)
+
     # Create a DataFrame from the extracted data
     data = {
         'Order': orders,
@@ -100,7 +204,13 @@ def parse_xml(xml_file):
         'No.': numbers,
         'Title': titles,
         'Art': pnumbers,
-        'Text': text_contents
+        'Text': text_contents,
+        'Schedule': schedules,
+        'Schedule_Name': schedule_names,
+        'Part_Number': part_numbers,
+        'Part_Title': part_titles,
+        'Definitions': definitions,
+        'References': references
     }
 
     df = pd.DataFrame(data)
@@ -110,6 +220,7 @@ def parse_xml(xml_file):
         order_string = df.loc[1, 'Order'].strip()
         # Apply replacement to each paragraph in the array
         df['Text'] = df['Text'].apply(lambda x: [re.sub(re.escape(order_string), 'Order', p, flags=re.IGNORECASE) for p in x])
+        df['Definitions'] = df['Definitions'].apply(lambda x: [(term, re.sub(re.escape(order_string), 'Order', text, flags=re.IGNORECASE)) for term, text in x])
     except:
         print("No Order")
 
@@ -119,6 +230,9 @@ def parse_xml(xml_file):
     #     for element in xml_root.findall('.//ns0:P1group', namespace)
     # ]
     df['Link'] = 'https://www.legislation.gov.uk/uksi/' + df['Year'].astype(str) + '/' + df['No.'].astype(str) + '/article/' + df['Art'].astype(str) +'/made'
+    in_schedule = df['Schedule'].notna()
+    df.loc[in_schedule, 'Link'] = ('https://www.legislation.gov.uk/uksi/' + df['Year'].astype(str) + '/' + df['No.'].astype(str)
+                                   + '/schedule/' + df['Schedule'].astype(str) + '/paragraph/' + df['Art'].astype(str) + '/made')[in_schedule]
     df['UID'] = df['Year'].astype(str) + '_' + df['No.'].astype(str) + '_' + df['Art'].astype(str)
 
     # print("Another Row: ", df.loc[43,'Text'])